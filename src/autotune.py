@@ -0,0 +1,156 @@
+# autotune.py
+# 印刷キューのページ数予算と問い合わせ間隔を、実測したプリンタの速さから自動で調整する
+#
+# config.json の queue_limit / queue_wait_interval_sec は人が勘で決めた固定値で、
+# queue_limit=1・5秒間隔だとインクジェットが1件ごとに遊んでいた。
+# ここではキュー監視の結果を見ながら、QueueBudget のページ数予算（window）を AIMD で動かす。
+#   - 予算で投入を止めていたのにプリンタが空になった（遊んだ）→ window を少しずつ増やす
+#   - 後ろに並んでいる分を印刷し切るのに target_queue_sec 以上かかる → window を半分にする
+# 問い合わせ間隔は「予算いっぱいのキューが空になるまでに4回は見る」ように
+# window ÷ 印刷速度 ÷ 4 を min_poll〜max_poll に収めて決める。
+#
+# 学習した値はプリンタごとに JSON に保存し、次回の初期値にする。
+# 時刻は監視結果のタイムスタンプだけを使うので、実時間を使わない模擬プリンタでも試せる
+# （benchmark.py tune）。
+#
+# 使い方:
+#   tuner = QueueTuner(budget, **load_state(path, printer_name))
+#   tuner.attach(monitor)
+#   ... 印刷 ...
+#   tuner.detach(monitor)
+#   save_state(path, printer_name, tuner)
+
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from queue_budget import QueueBudget
+from queue_monitor import QueueMonitor, QueueSnapshot
+
+
+class QueueTuner:
+    RATE_HALF_SEC = 120   # 印刷速度の平均をどのくらいの時間で入れ替えるか
+
+    def __init__(self, budget: QueueBudget, window: float = 4, poll_sec: float = 1.0,
+                 rate: float = 0.0, min_window: float = 2, max_window: float = 200,
+                 increase: float = 2, decrease: float = 0.5, target_queue_sec: float = 60,
+                 min_poll: float = 0.2, max_poll: float = 5.0):
+        """
+        window: 先頭ジョブの後ろに並べてよいページ数（budget.max_pages に反映する）
+        rate: 印刷速度（ページ/秒）の初期値。0 なら未測定
+        increase / decrease: AIMD の加算量（ページ）と減少率
+        target_queue_sec: 後ろに並べておく量の上限（印刷し切るのにかかる秒数で）
+        """
+        self.budget = budget
+        self.window = float(window)
+        self.poll_sec = float(poll_sec)
+        self.rate = float(rate)
+        self.min_window = min_window
+        self.max_window = max_window
+        self.increase = increase
+        self.decrease = decrease
+        self.target_queue_sec = target_queue_sec
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+
+        self.starved = 0      # 予算で止めていたのにプリンタが空になった回数
+        self.backoffs = 0     # 並べすぎで window を減らした回数
+
+        self._lock = threading.Lock()
+        self._prev: Optional[Dict[int, int]] = None   # job_id -> ページ数
+        self._prev_time = 0.0
+        self._busy_sec = 0.0
+        self._done_pages = 0.0
+        self._next_backoff = 0.0
+        self._monitor: Optional[QueueMonitor] = None
+        self._apply()
+
+    # ===== 監視との接続 =====
+    def attach(self, monitor: QueueMonitor):
+        self._monitor = monitor
+        monitor.subscribe(self.observe)
+        self._apply()
+
+    def detach(self, monitor: QueueMonitor):
+        monitor.unsubscribe(self.observe)
+        self._monitor = None
+
+    def _apply(self):
+        self.budget.max_pages = int(round(self.window))
+        if self._monitor is not None:
+            self._monitor.min_interval = self.poll_sec
+
+    # ===== 観測 =====
+    def observe(self, snap: QueueSnapshot):
+        if not snap.ok:
+            return
+        with self._lock:
+            now = snap.timestamp
+            current = {j.job_id: self.budget.job_pages(j) for j in snap.jobs}
+            prev = self._prev
+            self._prev = current
+            prev_time = self._prev_time
+            dt = now - prev_time
+            self._prev_time = now
+            if prev is None or dt <= 0:
+                return
+
+            # 印刷速度: 前回も今回もキューに何かあった（= ずっと印刷していた）間に抜けていったページ数
+            # 途中で空になった区間は、いつ印刷が終わったか分からないので数えない
+            if prev and current:
+                self._busy_sec += dt
+                self._done_pages += sum(p for job_id, p in prev.items() if job_id not in current)
+                if self._busy_sec >= 5 and self._done_pages > 0:
+                    # 測った時間の長さで重み付けする（大きなジョブ1件の測定を小さなジョブと同じ重みにしない）
+                    sample = self._done_pages / self._busy_sec
+                    alpha = min(self._busy_sec / self.RATE_HALF_SEC, 1.0)
+                    self.rate = sample if self.rate <= 0 else (1 - alpha) * self.rate + alpha * sample
+                    self._busy_sec = 0.0
+                    self._done_pages = 0.0
+
+            # 前回の問い合わせ以降に、予算で投入を待たせていたか
+            blocked = self.budget.held_at >= prev_time
+
+            if prev and not current and blocked:
+                # 加算増加: 投入を止めていた間にプリンタが遊んだ
+                self.window = min(self.window + self.increase, self.max_window)
+                self.starved += 1
+            elif self.rate > 0 and now >= self._next_backoff:
+                waiting = sum(list(current.values())[1:])
+                drain_sec = waiting / self.rate
+                if drain_sec > self.target_queue_sec:
+                    # 乗算減少: 並べすぎ。減らした分が捌けるまでは再判定しない
+                    self.window = max(self.window * self.decrease, self.min_window)
+                    self.backoffs += 1
+                    self._next_backoff = now + drain_sec
+
+            if self.rate > 0:
+                self.poll_sec = min(max(self.window / self.rate / 4, self.min_poll), self.max_poll)
+            self._apply()
+
+    def state(self) -> dict:
+        return {"window": round(self.window, 2), "poll_sec": round(self.poll_sec, 3), "rate": round(self.rate, 3)}
+
+
+# ===== 学習結果の保存 =====
+def load_state(path: Path, printer_name: str) -> dict:
+    """保存済みの {window, poll_sec, rate}。無ければ空（QueueTuner の既定値になる）"""
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    state = data.get(printer_name, {})
+    return {k: float(state[k]) for k in ("window", "poll_sec", "rate") if k in state}
+
+
+def save_state(path: Path, printer_name: str, tuner: QueueTuner):
+    path = Path(path)
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        data = {}
+    data[printer_name] = tuner.state()
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(path)
@@ -0,0 +1,1131 @@
+# benchmark.py
+# 性能比較用のベンチマーク集（開発用。exe には含めない）
+#
+# 使い方:
+#   python benchmark.py scan --folders 10000
+#   python benchmark.py index --folders 10000
+#   python benchmark.py soffice --soffice /usr/bin/soffice --printer PDF --docs 20
+#   python benchmark.py convert --soffice /usr/bin/soffice --docs 32 --workers 1 2 4 8
+#   python benchmark.py notify --jobs 300 --service-ms 20 --poll-sec 0.5
+#   python benchmark.py throttle --jobs 200 --queue-limits 1 8 --max-pages 20
+#   python benchmark.py tune --jobs 400 --runs 3
+#   python benchmark.py batch --folders 30 --per-folder 6 --batch 1 3 6
+#   python benchmark.py merge --total-mb 500 --files 50 --pages 5
+#   python benchmark.py pool --folders 40 --speeds 1 1 2
+#   python benchmark.py hang --items 40 --every 6 --timeout-sec 2
+#   python benchmark.py since --folders 2000 10000 --changed 30
+#   python benchmark.py history --folders 200 --per-folder 3 --size-kb 512 --changed 10 --workers 1 4 8
+#   python benchmark.py scan-latency --folders 2000 --latency-ms 2 --workers 1 4 16
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import subprocess
+import tempfile
+import threading
+import contextlib
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+import scanner
+import module1 as m
+import child_process
+from child_process import TimeoutPolicy
+from soffice_worker import SofficeWorker
+from convert_pool import ConvertPool
+import spooler
+import queue_monitor
+from queue_monitor import QueueMonitor, QueueSnapshot
+from queue_budget import QueueBudget
+from autotune import QueueTuner
+import printer_backend
+from printer_backend import FakePrinter
+from printer_pool import PrinterPool, PoolPrinter
+from scan_index import ScanIndex
+from scanner import TimeRange
+from print_history import PrintHistory
+from pdf_info import count_pages
+
+
+# ===== 比較用：旧 collect_targets（iterdir + glob×2 + stat） =====
+def collect_targets_glob(parent_folder: Path, target_date: datetime) -> Tuple[List[Tuple[str, Path, str]], List[str]]:
+    targets: List[Tuple[str, Path, str]] = []
+    no_word_folder: List[str] = []
+
+    for sub in sorted(parent_folder.iterdir()):
+        if not sub.is_dir():
+            continue
+
+        pdfs = sorted(sub.glob("*.pdf"))
+        recent_pdfs = []
+        for p in pdfs:
+            mtime = datetime.fromtimestamp(p.stat().st_mtime)
+            if mtime.date() == target_date.date():
+                recent_pdfs.append(p)
+
+        if recent_pdfs:
+            for p in recent_pdfs:
+                targets.append(("pdf", p, p.name))
+
+            doc_exts = {".doc", ".docx", ".docm"}
+            docms = [
+                p for p in sorted(sub.glob("*.doc*"))
+                if p.suffix.lower() in doc_exts and not p.name.startswith("~$")
+                ]
+            if docms:
+                for w in docms:
+                    targets.append(("word", w, w.name))
+            else:
+                no_word_folder.append(sub.name)
+
+    return targets, no_word_folder
+
+
+# ===== テスト用ツリー生成 =====
+def make_tree(root: Path, n_folders: int, target_date: datetime, hit_every: int = 20) -> None:
+    """
+    n_folders 個のサブフォルダを作る。hit_every 個に1つが target_date 更新のPDFを持つ。
+    """
+    today = target_date.timestamp() + 3600
+    old = (target_date - timedelta(days=30)).timestamp()
+    for i in range(n_folders):
+        sub = root / f"client{i:05d}"
+        sub.mkdir(parents=True)
+        for j in range(3):
+            p = sub / f"report{j}.pdf"
+            p.write_bytes(b"%PDF-1.4\n")
+            ts = today if (i % hit_every == 0 and j == 0) else old
+            os.utime(p, (ts, ts))
+        if i % 7:
+            (sub / "houkoku.docx").write_bytes(b"")
+        (sub / "memo.txt").write_bytes(b"")
+
+
+# ===== ファイルシステム呼び出しの計測 =====
+class _EntryProxy:
+    """DirEntry の代理。stat() を往復1回として数える（Windows では列挙時に取得済みなので数えない）"""
+
+    def __init__(self, entry, fs: "FsCallCounter"):
+        self._entry = entry
+        self._fs = fs
+
+    def __getattr__(self, name):
+        return getattr(self._entry, name)
+
+    def __fspath__(self):
+        return self._entry.path
+
+    def stat(self, *args, **kwargs):
+        if not self._fs.cached_entry_stat:
+            self._fs.hit("stat")
+        return self._entry.stat(*args, **kwargs)
+
+
+class _ScandirProxy:
+    def __init__(self, it, fs: "FsCallCounter"):
+        self._it = it
+        self._fs = fs
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return _EntryProxy(next(self._it), self._fs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._it.close()
+
+
+class FsCallCounter:
+    """
+    os.scandir / os.listdir / os.stat を差し替え、ネットワーク往復に相当する呼び出し数を数える。
+    cached_entry_stat=True は Windows（SMB）の挙動: DirEntry.stat() は追加往復なし。
+    latency_sec > 0 なら呼び出しごとにその時間だけ待ち、遅いネットワーク共有の代わりにする。
+    """
+
+    def __init__(self, cached_entry_stat: bool = True, latency_sec: float = 0.0):
+        self.cached_entry_stat = cached_entry_stat
+        self.latency_sec = latency_sec
+        self.calls = {"scandir": 0, "listdir": 0, "stat": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+    def hit(self, kind: str) -> None:
+        with self._lock:
+            self.calls[kind] += 1
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+
+    @contextlib.contextmanager
+    def patched(self):
+        orig_scandir, orig_listdir, orig_stat = os.scandir, os.listdir, os.stat
+
+        def scandir(path="."):
+            self.hit("scandir")
+            return _ScandirProxy(orig_scandir(path), self)
+
+        def listdir(path="."):
+            self.hit("listdir")
+            return orig_listdir(path)
+
+        def stat(path, *args, **kwargs):
+            self.hit("stat")
+            return orig_stat(path, *args, **kwargs)
+
+        os.scandir, os.listdir, os.stat = scandir, listdir, stat
+        try:
+            yield self
+        finally:
+            os.scandir, os.listdir, os.stat = orig_scandir, orig_listdir, orig_stat
+
+
+def _count_calls(func, *args) -> FsCallCounter:
+    fs = FsCallCounter()
+    with fs.patched():
+        func(*args)
+    return fs
+
+
+def _timeit(func, *args, repeat: int = 3) -> Tuple[float, object]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+# ===== scan: 旧実装 vs scandir 1パス =====
+def bench_scan(args) -> None:
+    target_date = datetime(2025, 4, 1)
+    tmp = Path(tempfile.mkdtemp(prefix="bench_scan_"))
+    try:
+        print(f"ツリー生成中: {args.folders} フォルダ ({tmp})")
+        make_tree(tmp, args.folders, target_date)
+
+        t_old, r_old = _timeit(collect_targets_glob, tmp, target_date, repeat=args.repeat)
+        t_new, r_new = _timeit(scanner.collect_targets, tmp, target_date, repeat=args.repeat)
+
+        if r_old != r_new:
+            print("!! 結果が一致しません")
+            sys.exit(1)
+        print(f"対象件数: {len(r_new[0])} / wordなしフォルダ: {len(r_new[1])}")
+        c_old = _count_calls(collect_targets_glob, tmp, target_date)
+        c_new = _count_calls(scanner.collect_targets, tmp, target_date)
+        print(f"iterdir+glob : {t_old:8.3f} s  FS呼び出し {c_old.total:7d} {c_old.calls}")
+        print(f"scandir 1パス: {t_new:8.3f} s  FS呼び出し {c_new.total:7d} {c_new.calls}"
+              f"  (x{t_old / t_new:.2f})")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ===== scan-latency: 遅延注入した共有での直列 / 並列 =====
+def bench_scan_latency(args) -> None:
+    target_date = datetime(2025, 4, 1)
+    tmp = Path(tempfile.mkdtemp(prefix="bench_latency_"))
+    try:
+        print(f"ツリー生成中: {args.folders} フォルダ ({tmp}) / 往復 {args.latency_ms} ms")
+        make_tree(tmp, args.folders, target_date)
+        expected = collect_targets_glob(tmp, target_date)
+
+        fs = FsCallCounter(latency_sec=args.latency_ms / 1000)
+        with fs.patched():
+            t0 = time.perf_counter()
+            collect_targets_glob(tmp, target_date)
+            t_old = time.perf_counter() - t0
+            print(f"iterdir+glob        : {t_old:8.3f} s")
+
+            for w in args.workers:
+                t0 = time.perf_counter()
+                result = scanner.collect_targets(tmp, target_date, workers=w)
+                t = time.perf_counter() - t0
+                if result != expected:
+                    print("!! 結果が一致しません")
+                    sys.exit(1)
+                print(f"scandir workers={w:<3d}: {t:8.3f} s  (x{t_old / t:.2f})")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ===== index: 走査インデックスのコールド / ウォーム =====
+def bench_index(args) -> None:
+    target_date = datetime(2025, 4, 1)
+    tmp = Path(tempfile.mkdtemp(prefix="bench_index_"))
+    try:
+        tree = tmp / "parent"
+        print(f"ツリー生成中: {args.folders} フォルダ ({tree})")
+        make_tree(tree, args.folders, target_date)
+        expected_cold = scanner.collect_targets(tree, target_date)
+
+        index = ScanIndex(tmp / "scan_index.sqlite3")
+
+        def run():
+            index.refresh(tree)
+            return index.collect_targets(tree, target_date)
+
+        t0 = time.perf_counter()
+        fs_cold = FsCallCounter()
+        with fs_cold.patched():
+            cold = run()
+        t_cold = time.perf_counter() - t0
+
+        # 数フォルダだけ変更してからウォーム実行
+        for i in range(0, args.folders, max(args.folders // args.changed, 1)):
+            (tree / f"client{i:05d}" / "new.pdf").write_bytes(b"%PDF-1.4\n")
+        expected = scanner.collect_targets(tree, target_date)
+
+        t0 = time.perf_counter()
+        fs_warm = FsCallCounter()
+        with fs_warm.patched():
+            warm = run()
+        t_warm = time.perf_counter() - t0
+        index.close()
+
+        if cold != expected_cold or warm != expected:
+            print("!! 結果が一致しません")
+            sys.exit(1)
+        print(f"コールド: {t_cold:8.3f} s  FS呼び出し {fs_cold.total:7d}")
+        print(f"ウォーム: {t_warm:8.3f} s  FS呼び出し {fs_warm.total:7d}  (変更 {args.changed} フォルダ)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ===== since: 前回の印刷以降（差分モード）の収集 =====
+def bench_since(args) -> None:
+    base_date = datetime(2025, 4, 1)
+    for n in args.folders:
+        tmp = Path(tempfile.mkdtemp(prefix="bench_since_"))
+        try:
+            tree = tmp / "parent"
+            make_tree(tree, n, base_date)
+            index = ScanIndex(tmp / "scan_index.sqlite3")
+            index.refresh(tree)   # 前回の実行で作ってあるインデックス
+
+            # 前回の印刷のあとに changed フォルダだけ更新された
+            high_water = time.time()
+            for i in range(0, n, max(n // args.changed, 1)):
+                (tree / f"client{i:05d}" / "new.pdf").write_bytes(b"%PDF-1.4\n")
+            period = TimeRange.since(high_water)
+
+            t0 = time.perf_counter()
+            fs_full = FsCallCounter()
+            with fs_full.patched():
+                expected = scanner.collect_targets(tree, period)
+            t_full = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            fs_index = FsCallCounter()
+            with fs_index.patched():
+                index.refresh(tree)
+                got = index.collect_targets(tree, period)
+            t_index = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            index.collect_targets(tree, period)
+            t_query = time.perf_counter() - t0
+            index.close()
+
+            if got != expected:
+                print("!! 結果が一致しません")
+                sys.exit(1)
+            print(f"{n:6d} フォルダ / 変更 {len(expected[0]):3d} 件: "
+                  f"全走査 {t_full:7.3f} s（FS {fs_full.total:6d}） / "
+                  f"インデックス {t_index:7.3f} s（FS {fs_index.total:6d}、うち問い合わせ {t_query * 1000:.1f} ms）")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ===== soffice: 都度起動 vs 常駐ワーカー =====
+def _sample_docs(n: int) -> List[Path]:
+    sample = Path(__file__).resolve().parent.parent / "parent_sample"
+    docs = [p for p in sorted(sample.rglob("*.docx")) if not p.name.startswith("~$")]
+    if not docs:
+        print("!! parent_sample に .docx がありません")
+        sys.exit(1)
+    return [docs[i % len(docs)] for i in range(n)]
+
+
+def bench_soffice(args) -> None:
+    soffice = Path(args.soffice or shutil.which("soffice") or "")
+    if not soffice.is_file():
+        print("!! soffice が見つかりません（--soffice で指定）")
+        sys.exit(1)
+    docs = _sample_docs(args.docs)
+
+    t0 = time.perf_counter()
+    for d in docs:
+        m.print_word_with_soffice(soffice, args.printer, d)
+    t_spawn = time.perf_counter() - t0
+    print(f"都度起動      : {t_spawn:8.2f} s  ({t_spawn / len(docs):.2f} s/件)")
+
+    worker = SofficeWorker(soffice)
+    try:
+        t0 = time.perf_counter()
+        worker.start()
+        t_start = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for d in docs:
+            worker.print_document(args.printer, d)
+        t_warm = time.perf_counter() - t0
+    finally:
+        worker.stop()
+    mode = "UNO" if worker.use_uno else "IPC"
+    print(f"常駐ワーカー({mode}): 起動 {t_start:6.2f} s + {t_warm:8.2f} s  ({t_warm / len(docs):.2f} s/件)")
+
+
+# ===== convert: 並列変換プールのスループット =====
+def bench_convert(args) -> None:
+    soffice = Path(args.soffice or shutil.which("soffice") or "")
+    if not soffice.is_file():
+        print("!! soffice が見つかりません（--soffice で指定）")
+        sys.exit(1)
+    docs = _sample_docs(args.docs)
+
+    base = None
+    for w in args.workers:
+        with tempfile.TemporaryDirectory(prefix="bench_convert_") as work_dir:
+            # プロファイル作成（初回起動）はワーカーごとに1回だけなので、
+            # 別のプールで同じ work_dir のプロファイルを作ってから測る
+            warm = ConvertPool(soffice, workers=w, work_dir=Path(work_dir))
+            try:
+                warm.prefetch(docs[:w])
+                for d in docs[:w]:
+                    warm.convert(d)
+            finally:
+                warm.close()
+            shutil.rmtree(Path(work_dir) / "out", ignore_errors=True)
+            pool = ConvertPool(soffice, workers=w, work_dir=Path(work_dir))
+            try:
+                t0 = time.perf_counter()
+                pool.prefetch(docs)
+                for d in docs:
+                    pool.convert(d)
+                t = time.perf_counter() - t0
+            finally:
+                pool.close()
+        base = base or t
+        print(f"workers={w:<3d}: {t:8.2f} s  {len(docs) / t:6.2f} 件/s  (x{base / t:.2f})")
+
+
+# ===== notify: 変化通知 vs 一定間隔の問い合わせ（queue_limit 付き投入） =====
+def _run_throttled(n_jobs: int, queue_limit: int, service_sec: float, poll_sec: float, notify: bool):
+    fake = spooler.FakeInspector()
+    printer = FakePrinter(fake, "P", service_sec)
+    notifier = spooler.make_notifier(fake, "P") if notify else None
+    mon = QueueMonitor("P", inspector=fake, min_interval=poll_sec, max_interval=poll_sec, notifier=notifier)
+    printer.start()
+    mon.start()
+    t0 = time.perf_counter()
+    for i in range(n_jobs):
+        since = time.monotonic()
+        mon.wait_until(lambda s: s.timestamp >= since and s.depth < queue_limit)
+        fake.add_job("P", f"doc{i}.pdf")
+    mon.wait_until(lambda s: s.empty)
+    elapsed = time.perf_counter() - t0
+    mon.stop()
+    printer.stop()
+    return elapsed, printer.busy_sec, fake.calls
+
+
+def bench_notify(args) -> None:
+    print(f"{args.jobs} ジョブ / queue_limit={args.queue_limit} / 1件 {args.service_ms} ms")
+    for notify in (False, True):
+        t, busy, calls = _run_throttled(
+            args.jobs, args.queue_limit, args.service_ms / 1000, args.poll_sec, notify
+        )
+        label = "変化通知      " if notify else f"問い合わせ{args.poll_sec:>4}s"
+        print(f"{label}: {t:8.2f} s  プリンタ稼働率 {busy / t * 100:5.1f}%  問い合わせ {calls} 回")
+
+
+# ===== throttle: ジョブ数上限 vs ページ数予算 =====
+def _doc_mix(n: int, big_every: int, big_pages: int, seed: int = 1) -> List[int]:
+    """1〜2ページの報告書の中に、big_every 件に1件ほど大きなスキャンPDFが混ざる"""
+    rnd = random.Random(seed)
+    return [rnd.randint(big_pages // 2, big_pages) if rnd.randrange(big_every) == 0 else rnd.randint(1, 2)
+            for _ in range(n)]
+
+
+def _run_paced(pages_list: List[int], service_sec: float, page_sec: float, submit_sec: float,
+               queue_limit: int = 0, budget: "QueueBudget" = None):
+    """
+    queue_limit（ジョブ数）か budget（ページ数）で絞りながら投入する。
+    submit_sec は PDFtoPrinter 起動など、1件投入するのにかかる時間。
+    """
+    fake = spooler.FakeInspector()
+    printer = FakePrinter(fake, "P", service_sec, page_sec)
+    mon = QueueMonitor("P", inspector=fake, min_interval=0.05, max_interval=0.05,
+                       notifier=spooler.make_notifier(fake, "P"))
+    peak = {"pages": 0}
+
+    def on_snapshot(snap):
+        peak["pages"] = max(peak["pages"], sum(j.pages for j in snap.jobs))
+
+    mon.subscribe(on_snapshot)
+    printer.start()
+    mon.start()
+    t0 = time.perf_counter()
+    for i, pages in enumerate(pages_list):
+        name = f"doc{i}.pdf"
+        if budget is not None:
+            budget.acquire(mon, name, pages=pages)
+        else:
+            since = time.monotonic()
+            mon.wait_until(lambda s: s.timestamp >= since and s.depth < queue_limit)
+        time.sleep(submit_sec)
+        fake.add_job("P", name, pages=pages)
+    mon.wait_until(lambda s: s.empty)
+    elapsed = time.perf_counter() - t0
+    mon.stop()
+    printer.stop()
+    return elapsed, printer.busy_sec, peak["pages"]
+
+
+def bench_throttle(args) -> None:
+    pages_list = _doc_mix(args.jobs, args.big_every, args.big_pages)
+    print(f"{args.jobs} ジョブ / 計 {sum(pages_list)} ページ / 1件 {args.service_ms} ms + "
+          f"1ページ {args.page_ms} ms / 投入 {args.submit_ms} ms")
+    runs = [(f"queue_limit={n}", {"queue_limit": n}) for n in args.queue_limits]
+    runs += [(f"max_pages={n}", {"budget": QueueBudget(max_pages=n)}) for n in args.max_pages]
+    for label, kwargs in runs:
+        t, busy, peak = _run_paced(
+            pages_list, args.service_ms / 1000, args.page_ms / 1000, args.submit_ms / 1000, **kwargs
+        )
+        print(f"{label:<14}: {t:7.2f} s  {sum(pages_list) / t:6.1f} ページ/s  "
+              f"プリンタ稼働率 {busy / t * 100:5.1f}%  キュー最大 {peak} ページ")
+
+
+# ===== tune: 離散イベントの模擬プリンタで固定設定と自動調整を比べる =====
+class PrinterSim:
+    """
+    実時間を使わない模擬プリンタ + 監視 + 投入側。
+    プリンタは1件あたり service_sec + ページ数 × page_sec、投入は1件 submit_sec かかる。
+    監視は poll_sec ごと（tuner があればその問い合わせ間隔）と投入直後にキューを見て、
+    予算に空きがあれば次を投入する（投入中は次を判定しない）。
+    印刷の終了は次の問い合わせまで分からない（変化通知なしの場合）。
+    """
+
+    def __init__(self, service_sec: float, page_sec: float, submit_sec: float):
+        self.service_sec = service_sec
+        self.page_sec = page_sec
+        self.submit_sec = submit_sec
+
+    def run(self, pages_list: List[int], budget: QueueBudget, poll_sec: float = 1.0, tuner=None):
+        queue: List[spooler.JobInfo] = []
+        t = 0.0
+        busy = 0.0
+        printing_end = None
+        submit_end = None
+        next_poll = 0.0
+        i = 0
+        peak = 0
+        waiting_area = 0.0
+        while i < len(pages_list) or queue or submit_end is not None:
+            t = min(x for x in (printing_end, submit_end, next_poll) if x is not None)
+            if printing_end is not None and t == printing_end:
+                queue.pop(0)
+                printing_end = None
+            elif submit_end is not None and t == submit_end:
+                queue.append(spooler.JobInfo(i, f"doc{i}.pdf", "", pages_list[i]))
+                i += 1
+                submit_end = None
+                next_poll = t   # 投入直後は問い合わせ直す（JobTracker.submitted の poke と同じ）
+            else:
+                snap = QueueSnapshot(len(queue), list(queue), t, True)
+                if tuner is not None:
+                    tuner.observe(snap)
+                if submit_end is None and i < len(pages_list):
+                    if budget.admits(snap, pages_list[i], 0):
+                        budget.reserve(f"doc{i}.pdf", pages_list[i], now=t)
+                        submit_end = t + self.submit_sec
+                    else:
+                        budget.hold(snap)
+                next_poll = t + (tuner.poll_sec if tuner is not None else poll_sec)
+
+            if printing_end is None and queue:
+                sec = self.service_sec + queue[0].pages * self.page_sec
+                printing_end = t + sec
+                busy += sec
+            waiting = sum(j.pages for j in queue[1:])
+            peak = max(peak, waiting)
+            waiting_area += waiting * (min(x for x in (printing_end, submit_end, next_poll) if x is not None) - t)
+        return t, busy, peak, waiting_area / t
+
+
+def bench_tune(args) -> None:
+    pages_list = _doc_mix(args.jobs, args.big_every, args.big_pages)
+    sim = PrinterSim(args.service_sec, args.page_sec, args.submit_sec)
+    print(f"{args.jobs} ジョブ / 計 {sum(pages_list)} ページ / 1件 {args.service_sec} s + "
+          f"1ページ {args.page_sec} s / 投入 {args.submit_sec} s（模擬時間）")
+
+    def show(label, t, busy, peak, mean_waiting):
+        print(f"{label:<22}: {t:8.1f} s  {sum(pages_list) / t:5.2f} ページ/s  稼働率 {busy / t * 100:5.1f}%  "
+              f"待ち 平均 {mean_waiting:5.1f} / 最大 {peak:4d} ページ")
+
+    show(f"固定 queue_limit=1 {args.poll_sec}s", *sim.run(pages_list, QueueBudget(max_jobs=1), args.poll_sec))
+    show(f"固定 max_pages=20 {args.poll_sec}s", *sim.run(pages_list, QueueBudget(max_pages=20), args.poll_sec))
+
+    state = {"poll_sec": args.poll_sec}
+    for run in range(1, args.runs + 1):
+        budget = QueueBudget()
+        tuner = QueueTuner(budget, **state)
+        result = sim.run(pages_list, budget, tuner=tuner)
+        show(f"自動調整 {run} 回目", *result)
+        print(f"    増加 {tuner.starved} 回 / 減少 {tuner.backoffs} 回 -> {tuner.state()}")
+        state = tuner.state()   # 次の実行へ引き継ぐ（実運用では printer_tuning.json）
+
+
+# ===== batch: 1件ずつ投入 vs 同じフォルダの PDF をまとめて投入 =====
+def _make_small_pdfs(root: Path, n_folders: int, per_folder: int) -> List[List[Path]]:
+    """1〜2ページの小さな PDF（ページ数だけ読めればよい）をフォルダごとに作る"""
+    folders = []
+    for i in range(n_folders):
+        sub = root / f"client{i:05d}"
+        sub.mkdir(parents=True)
+        paths = []
+        for j in range(per_folder):
+            p = sub / f"report{j}.pdf"
+            p.write_bytes(b"%PDF-1.4\n1 0 obj << /Type /Pages /Count " + str(1 + j % 2).encode() + b" >> endobj\n")
+            paths.append(p)
+        folders.append(paths)
+    return folders
+
+
+def bench_batch(args) -> None:
+    tmp = Path(tempfile.mkdtemp(prefix="bench_batch_"))
+    try:
+        folders = _make_small_pdfs(tmp, args.folders, args.per_folder)
+        n_files = sum(len(f) for f in folders)
+        print(f"{n_files} 件（{args.folders} フォルダ） / 投入 {args.submit_ms} ms / "
+              f"ジョブ1件 {args.service_ms} ms + 1ページ {args.page_ms} ms")
+        base = None
+        for size in args.batch:
+            backend = printer_backend.make_backend(
+                "fake", submit_ms=args.submit_ms, service_ms=args.service_ms, page_ms=args.page_ms
+            )
+            mon = QueueMonitor("P", inspector=backend.inspector, min_interval=0.05, max_interval=0.5,
+                               notifier=spooler.make_notifier(backend.inspector, "P"))
+            mon.start()
+            budget = QueueBudget(max_pages=args.max_pages)
+            jobs = 0
+            t0 = time.perf_counter()
+            for paths in folders:
+                for k in range(0, len(paths), size):
+                    group = paths[k:k + size]
+                    budget.acquire(mon, group[0].name, pages=sum(1 + j % 2 for j in range(k, k + len(group))))
+                    if len(group) > 1:
+                        backend.submit_batch("P", group)
+                    else:
+                        backend.submit("P", group[0])
+                    jobs += 1
+            mon.wait_until(lambda s: s.empty)
+            t = time.perf_counter() - t0
+            mon.stop()
+            backend.close()
+            base = base or t
+            label = "1件ずつ" if size == 1 else f"{size}件まとめ"
+            print(f"{label:<8}: {t:7.2f} s  ジョブ {jobs:4d} 件  {n_files / t:6.1f} 件/s  (x{base / t:.2f})")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ===== pool: 複数プリンタへのフォルダ単位の振り分け =====
+def _make_folders(root: Path, n_folders: int, seed: int = 1) -> List[List[Path]]:
+    """2〜6件・1〜8ページの PDF が入ったフォルダ（ページ数だけ読めればよい）"""
+    rnd = random.Random(seed)
+    folders = []
+    for i in range(n_folders):
+        sub = root / f"client{i:05d}"
+        sub.mkdir(parents=True)
+        paths = []
+        for j in range(rnd.randint(2, 6)):
+            p = sub / f"report{j}.pdf"
+            p.write_bytes(b"%%PDF-1.4\n1 0 obj << /Type /Pages /Count %d >> endobj\n" % rnd.randint(1, 8))
+            paths.append(p)
+        folders.append(paths)
+    return folders
+
+
+def _run_pool(folders: List[List[Path]], names: List[str], speeds: List[float], mode: str, args):
+    """
+    mode: "single"（1台だけ） / "round-robin"（フォルダを順番に配る） /
+          "weights"（見積もり: 設定した速さ） / "learned"（見積もり: 速さは全台同じから実測で学習）
+    戻り値: (全部印刷し終わるまでの秒数, {プリンタ: 印刷していた秒数})
+    """
+    backend = printer_backend.make_backend(
+        "fake", submit_ms=args.submit_ms, service_ms=args.service_ms, page_ms=args.page_ms,
+        fake_speeds=dict(zip(names, speeds)),
+    )
+    spooler.set_default_inspector(backend.inspector)
+    queue_monitor.configure(0.05, 0.5)
+    active = names[:1] if mode == "single" else names
+    budgets = {n: QueueBudget(max_pages=args.max_pages) for n in active}
+    tuners = {}
+    if mode == "learned":
+        for n in active:
+            tuners[n] = QueueTuner(budgets[n], window=args.max_pages, min_window=args.max_pages,
+                                   max_window=args.max_pages)
+            tuners[n].attach(queue_monitor.get_monitor(n))
+    weights = speeds if mode == "weights" else [1.0] * len(active)
+    rate = 1000.0 / args.page_ms   # 速さ1のプリンタのページ/秒（未学習時の見積もり）
+    pool = PrinterPool([PoolPrinter(n, weight=w, tuner=tuners.get(n)) for n, w in zip(active, weights)],
+                       default_rate=rate)
+
+    def lane(name, lane_q):
+        while True:
+            item = lane_q.get()
+            if item is None:
+                return
+            paths, pages = item
+            budgets[name].acquire(queue_monitor.get_monitor(name), paths[0].name, pages=pages)
+            backend.submit_batch(name, paths)
+            pool.finished(pool.get(name), pages)
+
+    import queue as _queue
+    lane_qs = {n: _queue.Queue() for n in active}
+    threads = [threading.Thread(target=lane, args=(n, lane_qs[n]), daemon=True) for n in active]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for k, paths in enumerate(folders):
+        pages = sum(count_pages(p) or 1 for p in paths)
+        if mode == "round-robin":
+            target = pool.assign(pool.printers[k % len(active)], pages)
+        else:
+            target = pool.choose(pages)
+        lane_qs[target.name].put((paths, pages))
+    for n in active:
+        lane_qs[n].put(None)
+    for t in threads:
+        t.join()
+    for n in active:
+        queue_monitor.get_monitor(n).wait_until(lambda s: s.empty)
+    elapsed = time.perf_counter() - t0
+    for n, tuner in tuners.items():
+        tuner.detach(queue_monitor.get_monitor(n))
+    queue_monitor.stop_all()
+    busy = {n: backend.busy_sec(n) for n in active}
+    backend.close()
+    return elapsed, busy
+
+
+def bench_pool(args) -> None:
+    tmp = Path(tempfile.mkdtemp(prefix="bench_pool_"))
+    try:
+        folders = _make_folders(tmp, args.folders)
+        names = [f"P{i + 1}" for i in range(len(args.speeds))]
+        n_files = sum(len(f) for f in folders)
+        print(f"{args.folders} フォルダ {n_files} 件 / プリンタ {len(names)} 台（速さ {args.speeds}） / "
+              f"ジョブ1件 {args.service_ms} ms + 1ページ {args.page_ms} ms")
+        base = None
+        for mode in args.modes:
+            t, busy = _run_pool(folders, names, args.speeds, mode, args)
+            base = base or t
+            lanes = "  ".join(f"{n}:{b:5.1f}s" for n, b in busy.items())
+            print(f"{mode:<11}: {t:6.2f} s  (x{base / t:.2f})  印刷時間 {lanes}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ===== merge: フォルダの PDF 連結のメモリ使用量 =====
+def _make_scanned_pdf(path: Path, pages: int, page_bytes: int, indirect_length: bool) -> None:
+    """スキャン PDF 相当（1ページ1枚の画像）。画像は乱数なので中身は表示できないが構造は正しい"""
+    with open(path, "wb") as f:
+        offsets = {}
+
+        def obj(num: int, body: bytes):
+            offsets[num] = f.tell()
+            f.write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        kids = b" ".join(b"%d 0 R" % (3 + k * 4) for k in range(pages))
+        obj(2, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages)
+        for k in range(pages):
+            page, content, image, length = 3 + k * 4, 4 + k * 4, 5 + k * 4, 6 + k * 4
+            obj(page, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                      b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>" % (image, content))
+            draw = b"q 595 0 0 842 0 0 cm /Im0 Do Q"
+            obj(content, b"<< /Length %d >>\nstream\n" % len(draw) + draw + b"\nendstream")
+            # 画像本体はチャンクで書く（生成側もメモリを食わないように）
+            offsets[image] = f.tell()
+            length_ref = b"%d 0 R" % length if indirect_length else b"%d" % page_bytes
+            f.write(b"%d 0 obj\n<< /Type /XObject /Subtype /Image /Width 2480 /Height 3508 "
+                    b"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /DCTDecode /Length %s >>\nstream\n"
+                    % (image, length_ref))
+            remaining = page_bytes
+            while remaining > 0:
+                n = min(remaining, 1024 * 1024)
+                f.write(os.urandom(n))
+                remaining -= n
+            f.write(b"\nendstream\nendobj\n")
+            obj(length, b"%d" % page_bytes)
+        xref = f.tell()
+        size = 3 + pages * 4
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for num in range(1, size):
+            f.write(b"%010d 00000 n \n" % offsets[num])
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+
+
+# 子プロセスで1回だけ連結し、最大常駐メモリを測る（親のメモリに引きずられないように）
+_MERGE_CHILD = r"""
+import sys, time, json
+sys.path.insert(0, sys.argv[1])
+from pdf_merge import merge_pdfs
+tool, out, paths = sys.argv[2], sys.argv[3], sys.argv[4:]
+t0 = time.perf_counter()
+if tool == "readall":
+    # 比較用: 全ファイルを読み込んでから書く（メモリ上で連結するライブラリ相当）
+    data = [open(p, "rb").read() for p in paths]
+    with open(out, "wb") as f:
+        for d in data:
+            f.write(d)
+    used = tool
+else:
+    used = merge_pdfs(paths, out, tool=tool)
+t = time.perf_counter() - t0
+try:
+    import resource
+    scale = 1 if sys.platform == "darwin" else 1024
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+except ImportError:
+    rss = -1
+print(json.dumps({"used": used, "sec": t, "rss": rss}))
+"""
+
+
+def bench_merge(args) -> None:
+    import json
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_merge_"))
+    try:
+        page_bytes = int(args.total_mb * 1024 * 1024 / args.files / args.pages)
+        paths = []
+        for i in range(args.files):
+            p = tmp / f"scan{i:03d}.pdf"
+            _make_scanned_pdf(p, args.pages, page_bytes, indirect_length=(i % 2 == 1))
+            paths.append(p)
+        total = sum(p.stat().st_size for p in paths)
+        print(f"入力: {args.files} 件 × {args.pages} ページ / 合計 {total / 1024 / 1024:.0f} MB")
+        for tool in args.tools:
+            out = tmp / f"merged_{tool}.pdf"
+            r = subprocess.run([sys.executable, "-c", _MERGE_CHILD, str(Path(__file__).parent), tool, str(out)]
+                               + [str(p) for p in paths], capture_output=True, text=True)
+            if r.returncode != 0:
+                print(f"{tool:<9}: 失敗 {r.stderr.strip().splitlines()[-1] if r.stderr.strip() else ''}")
+                continue
+            res = json.loads(r.stdout.strip().splitlines()[-1])
+            pages = count_pages(out) if tool != "readall" else "-"
+            rss = f"{res['rss'] / 1024 / 1024:7.1f} MB" if res["rss"] >= 0 else "      -"
+            print(f"{tool:<9}: {res['sec']:6.2f} s  最大常駐 {rss}  "
+                  f"{total / 1024 / 1024 / res['sec']:7.1f} MB/s  ページ {pages}  ({res['used']})")
+            out.unlink(missing_ok=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ===== hang: 固まる外部コマンドを混ぜた一括印刷（時間制限と watchdog） =====
+# 偽の PDFtoPrinter / soffice。対象のファイル名に "hang" を含むと、孫プロセスを作ってから固まる。
+# 孫は BENCH_BEAT_DIR に心拍ファイルを書き続けるので、プロセスツリーごと止まったかを確かめられる。
+_FAKE_EXE = r"""
+import os, sys, time, shutil, subprocess
+args = sys.argv[1:]
+convert = "--outdir" in args
+target = args[-1] if convert else args[0]
+if "hang" in os.path.basename(target):
+    beat = os.path.join(os.environ["BENCH_BEAT_DIR"], os.path.basename(target) + ".beat")
+    subprocess.Popen([sys.executable, "-c",
+                      "import sys, time\nwhile True:\n    open(sys.argv[1], 'w').write(str(time.time()))\n"
+                      "    time.sleep(0.1)", beat])
+    time.sleep(3600)
+time.sleep(float(os.environ.get("BENCH_WORK_SEC", "0")))
+if convert:
+    out = args[args.index("--outdir") + 1]
+    shutil.copyfile(os.environ["BENCH_PDF"], os.path.join(out, os.path.splitext(os.path.basename(target))[0] + ".pdf"))
+"""
+
+
+def _fake_exe(root: Path) -> Path:
+    script = root / "fake_exe.py"
+    script.write_text(_FAKE_EXE, encoding="utf-8")
+    if os.name == "nt":
+        exe = root / "fake_exe.cmd"
+        exe.write_text(f'@"{sys.executable}" "{script}" %*\r\n', encoding="utf-8")
+    else:
+        exe = root / "fake_exe"
+        exe.write_text(f"#!{sys.executable}\n" + _FAKE_EXE, encoding="utf-8")
+        exe.chmod(0o755)
+    return exe
+
+
+def _run_hang(items: List[Tuple[str, Path]], exe: Path, policy: TimeoutPolicy, workers: int):
+    """main と同じ流れ（Word は先に並列変換、投入は元の順番で1件ずつ）。戻り値: (成功数, 失敗数, 失敗の理由)"""
+    backend = printer_backend.WindowsBackend(exe, inspector=spooler.FakeInspector())
+    backend.timeouts = policy
+    pool = ConvertPool(exe, workers=workers, timeouts=policy)
+    ok, errors = 0, []
+    try:
+        pool.prefetch(p for kind, p in items if kind == "word")
+        for kind, path in items:
+            try:
+                if kind == "word":
+                    path = pool.convert(path)
+                backend.submit("P", path, "pdf")
+                ok += 1
+            except Exception as e:
+                errors.append(str(e))
+    finally:
+        pool.close()
+        backend.close()
+    return ok, errors
+
+
+def bench_hang(args) -> None:
+    tmp = Path(tempfile.mkdtemp(prefix="bench_hang_"))
+    beat_dir = tmp / "beat"
+    beat_dir.mkdir()
+    try:
+        exe = _fake_exe(tmp)
+        pdf = tmp / "src.pdf"
+        pdf.write_bytes(b"%PDF-1.4\n1 0 obj << /Type /Pages /Count 1 >> endobj\n")
+        os.environ.update(BENCH_BEAT_DIR=str(beat_dir), BENCH_WORK_SEC=str(args.work_ms / 1000), BENCH_PDF=str(pdf))
+
+        def make_items(faults: bool) -> List[Tuple[str, Path]]:
+            d = tmp / ("faults" if faults else "clean")
+            d.mkdir()
+            items = []
+            for i in range(args.items):
+                kind = "word" if i % 4 == 3 else "pdf"
+                hang = faults and i % args.every == args.every - 1
+                p = d / f"{'hang' if hang else 'doc'}{i:04d}.{'docm' if kind == 'word' else 'pdf'}"
+                shutil.copyfile(pdf, p)
+                items.append((kind, p))
+            return items
+
+        limited = TimeoutPolicy(base={k: args.timeout_sec for k in TimeoutPolicy.BASE},
+                                per_mb={k: 0 for k in TimeoutPolicy.BASE}, per_page={k: 0 for k in TimeoutPolicy.BASE})
+        unlimited = TimeoutPolicy(base={k: 0 for k in TimeoutPolicy.BASE})
+        clean, faults = make_items(False), make_items(True)
+        n_hang = sum(1 for _, p in faults if p.name.startswith("hang"))
+        print(f"{args.items} 件（うち固まるもの {n_hang} 件） / 1件 {args.work_ms} ms / 時間制限 {args.timeout_sec} 秒 / "
+              f"変換 {args.workers} 並列")
+
+        for label, items, policy in (("固まるもの無し", clean, limited), ("時間制限あり", faults, limited),
+                                     ("時間制限なし", faults, unlimited)):
+            child_process.reset()
+            before = child_process.timeouts()
+            result = {}
+            t0 = time.perf_counter()
+            th = threading.Thread(target=lambda: result.update(r=_run_hang(items, exe, policy, args.workers)),
+                                  daemon=True)
+            th.start()
+            th.join(args.stuck_sec)
+            t = time.perf_counter() - t0
+            if th.is_alive():
+                # 止まったまま: 後片付けのため中止扱いで全部終了させる
+                child_process.kill_all()
+                th.join()
+                print(f"{label:<10}: {args.stuck_sec:.0f} 秒たっても終わらない（止まったまま）")
+            else:
+                ok, errors = result["r"]
+                print(f"{label:<10}: {t:6.2f} s  成功 {ok:3d} / 失敗 {len(errors):2d}  "
+                      f"成功分 {ok / t:5.1f} 件/s  終了させた {child_process.timeouts() - before} 件")
+            time.sleep(0.5)
+            beats = list(beat_dir.glob("*.beat"))
+            stamp = {b: b.stat().st_mtime for b in beats}
+            time.sleep(0.5)
+            alive = sum(1 for b in beats if b.stat().st_mtime != stamp[b])
+            print(f"{'':<10}  残った子プロセス {child_process.running()} / 動き続けている孫プロセス {alive}")
+            for b in beats:
+                b.unlink()
+    finally:
+        child_process.reset()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_history(args) -> None:
+    tmp = Path(tempfile.mkdtemp(prefix="bench_history_"))
+    try:
+        rnd = random.Random(1)
+        targets = []
+        for i in range(args.folders):
+            sub = tmp / "tree" / f"client{i:05d}"
+            sub.mkdir(parents=True)
+            for j in range(args.per_folder):
+                p = sub / f"report{j}.pdf"
+                p.write_bytes(b"%PDF-1.4\n" + rnd.randbytes(args.size_kb * 1024))
+                targets.append(("pdf", p, p.name))
+        total_mb = len(targets) * args.size_kb / 1024
+        print(f"{args.folders} フォルダ × {args.per_folder} 件 / 1件 {args.size_kb} KB（計 {total_mb:.0f} MB）")
+
+        # ハッシュ計算: 並列数ごとのコールド（全部読む）とウォーム（サイズ・更新時刻が同じなら読まない）
+        for w in args.workers:
+            db = tmp / f"hash{w}.sqlite3"
+            history = PrintHistory(db, workers=w)
+            try:
+                t0 = time.perf_counter()
+                history.hash_files(p for _, p, _ in targets)
+                cold = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                history.hash_files(p for _, p, _ in targets)
+                warm = time.perf_counter() - t0
+            finally:
+                history.close()
+            db.unlink()
+            print(f"ハッシュ {w:2d} 並列: コールド {cold:6.3f} s（{total_mb / cold:7.1f} MB/s） / ウォーム {warm:6.3f} s")
+
+        # 再実行日: 全部を印刷済みにしてから、全ファイルの更新時刻を変え、changed フォルダだけ中身を変える
+        history = PrintHistory(tmp / "history.sqlite3", workers=max(args.workers))
+        try:
+            for _, p, _ in targets:
+                history.record(p, "P")
+            changed = set(rnd.sample(range(args.folders), min(args.changed, args.folders)))
+            for _, p, _ in targets:
+                if int(p.parent.name[len("client"):]) in changed and p.name == "report0.pdf":
+                    with open(p, "ab") as f:
+                        f.write(b"% changed\n")
+                os.utime(p)
+            t0 = time.perf_counter()
+            kept, notes = history.filter_targets(targets, "skip")
+            t = time.perf_counter() - t0
+        finally:
+            history.close()
+        print(f"再実行（全部の更新時刻が変わり、{len(changed)} フォルダだけ中身が変わった）:")
+        print(f"  履歴なし: {len(targets):5d} 件を印刷")
+        print(f"  履歴あり: {len(kept):5d} 件を印刷 / 印刷済みで除外 {len(notes)} 件 / 判定 {t:.3f} s")
+        print(f"  1件 {args.sec_per_doc:.0f} 秒として、プリンタ時間 {len(notes) * args.sec_per_doc / 60:.0f} 分の節約")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="zaitaku-print-tool ベンチマーク")
+    sub = parser.add_subparsers(dest="name", required=True)
+
+    p = sub.add_parser("scan", help="サブフォルダ走査の比較")
+    p.add_argument("--folders", type=int, default=10000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_scan)
+
+    p = sub.add_parser("soffice", help="Word印刷: 都度起動と常駐ワーカーの比較")
+    p.add_argument("--soffice", default="")
+    p.add_argument("--printer", default="PDF")
+    p.add_argument("--docs", type=int, default=20)
+    p.set_defaults(func=bench_soffice)
+
+    p = sub.add_parser("convert", help="Word→PDF 並列変換のスループット")
+    p.add_argument("--soffice", default="")
+    p.add_argument("--docs", type=int, default=32)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.set_defaults(func=bench_convert)
+
+    p = sub.add_parser("notify", help="キュー空き待ち: 変化通知と一定間隔問い合わせの比較")
+    p.add_argument("--jobs", type=int, default=300)
+    p.add_argument("--queue-limit", type=int, default=1)
+    p.add_argument("--service-ms", type=float, default=20)
+    p.add_argument("--poll-sec", type=float, default=0.5)
+    p.set_defaults(func=bench_notify)
+
+    p = sub.add_parser("throttle", help="キュー上限: ジョブ数とページ数予算の比較")
+    p.add_argument("--jobs", type=int, default=200)
+    p.add_argument("--big-every", type=int, default=15)
+    p.add_argument("--big-pages", type=int, default=80)
+    p.add_argument("--service-ms", type=float, default=30)
+    p.add_argument("--page-ms", type=float, default=10)
+    p.add_argument("--submit-ms", type=float, default=60)
+    p.add_argument("--queue-limits", type=int, nargs="+", default=[1, 8])
+    p.add_argument("--max-pages", type=int, nargs="+", default=[20])
+    p.set_defaults(func=bench_throttle)
+
+    p = sub.add_parser("tune", help="キュー予算・問い合わせ間隔の自動調整（離散イベント模擬）")
+    p.add_argument("--jobs", type=int, default=400)
+    p.add_argument("--big-every", type=int, default=15)
+    p.add_argument("--big-pages", type=int, default=80)
+    p.add_argument("--service-sec", type=float, default=3.0)
+    p.add_argument("--page-sec", type=float, default=1.5)
+    p.add_argument("--submit-sec", type=float, default=2.0)
+    p.add_argument("--poll-sec", type=float, default=5.0)
+    p.add_argument("--runs", type=int, default=3)
+    p.set_defaults(func=bench_tune)
+
+    p = sub.add_parser("batch", help="PDF投入: 1件ずつとまとめて投入の比較（模擬プリンタ）")
+    p.add_argument("--folders", type=int, default=30)
+    p.add_argument("--per-folder", type=int, default=6)
+    p.add_argument("--submit-ms", type=float, default=30)
+    p.add_argument("--service-ms", type=float, default=40)
+    p.add_argument("--page-ms", type=float, default=5)
+    p.add_argument("--max-pages", type=int, default=20)
+    p.add_argument("--batch", type=int, nargs="+", default=[1, 3, 6])
+    p.set_defaults(func=bench_batch)
+
+    p = sub.add_parser("pool", help="プリンタプール: フォルダの振り分け方の比較（模擬プリンタ）")
+    p.add_argument("--folders", type=int, default=40)
+    p.add_argument("--speeds", type=float, nargs="+", default=[1, 1, 2])
+    p.add_argument("--submit-ms", type=float, default=10)
+    p.add_argument("--service-ms", type=float, default=50)
+    p.add_argument("--page-ms", type=float, default=20)
+    p.add_argument("--max-pages", type=int, default=20)
+    p.add_argument("--modes", nargs="+", default=["single", "round-robin", "weights", "learned"])
+    p.set_defaults(func=bench_pool)
+
+    p = sub.add_parser("merge", help="フォルダの PDF 連結: 方法ごとの最大常駐メモリと速度")
+    p.add_argument("--total-mb", type=float, default=500)
+    p.add_argument("--files", type=int, default=50)
+    p.add_argument("--pages", type=int, default=5)
+    p.add_argument("--tools", nargs="+", default=["readall", "stream", "qpdf", "pdfunite", "pypdf"])
+    p.set_defaults(func=bench_merge)
+
+    p = sub.add_parser("hang", help="固まる外部コマンドを混ぜた一括印刷: 時間制限と watchdog の効果")
+    p.add_argument("--items", type=int, default=40)
+    p.add_argument("--every", type=int, default=6, help="何件に1件を固まらせるか")
+    p.add_argument("--work-ms", type=float, default=100)
+    p.add_argument("--timeout-sec", type=float, default=2)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--stuck-sec", type=float, default=30, help="時間制限なしの実行を打ち切るまでの秒数")
+    p.set_defaults(func=bench_hang)
+
+    p = sub.add_parser("since", help="前回の印刷以降の収集: 全走査と走査インデックス（更新時刻の索引）の比較")
+    p.add_argument("--folders", type=int, nargs="+", default=[2000, 10000])
+    p.add_argument("--changed", type=int, default=30)
+    p.set_defaults(func=bench_since)
+
+    p = sub.add_parser("history", help="印刷履歴: 内容ハッシュの並列計算と、再実行日に印刷済みを除く効果")
+    p.add_argument("--folders", type=int, default=200)
+    p.add_argument("--per-folder", type=int, default=3)
+    p.add_argument("--size-kb", type=int, default=512)
+    p.add_argument("--changed", type=int, default=10, help="中身が変わったフォルダ数")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    p.add_argument("--sec-per-doc", type=float, default=20, help="1件の印刷にかかる秒数（節約時間の見積もり用）")
+    p.set_defaults(func=bench_history)
+
+    p = sub.add_parser("scan-latency", help="遅延注入した共有での並列走査の比較")
+    p.add_argument("--folders", type=int, default=2000)
+    p.add_argument("--latency-ms", type=float, default=2.0)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    p.set_defaults(func=bench_scan_latency)
+
+    p = sub.add_parser("index", help="走査インデックスのコールド/ウォーム比較")
+    p.add_argument("--folders", type=int, default=10000)
+    p.add_argument("--changed", type=int, default=30)
+    p.set_defaults(func=bench_index)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# child_process.py
+# 子プロセス（PDFtoPrinter / soffice / lp）の起動と、中止時のまとめて強制終了
+#
+# 以前は subprocess.run で起動していたので、中止ボタンを押しても実行中の
+# PDFtoPrinter・soffice はそのまま最後まで動き、投入された分は印刷されていた。
+# ここで起動した子プロセスは一覧に登録しておき、kill_all() で子孫プロセスごと終了させる。
+#   Windows : taskkill /T /F（PDFtoPrinter が呼ぶ印刷プロセスも止める）
+#   それ以外: 新しいセッション（プロセスグループ）で起動して、グループごと SIGKILL
+# kill_all() の後は reset() するまで新しい起動を断る（ProcessCancelled）。
+# 準備段の変換などが、中止した後に soffice を立ち上げ直すことはない。
+#
+# 時間制限: 壊れた .docm やマクロのダイアログで soffice が止まると、以前は一括印刷全体が止まっていた。
+# timeout を付けて起動したものは見張り役のスレッド（watchdog）が期限を見て、過ぎたら子孫ごと終了させる。
+# 呼び出し側には ProcessTimeout（subprocess.TimeoutExpired）が返るので、その1件だけ失敗にして先へ進める。
+# 期限の長さは TimeoutPolicy が種類（pdf / word / convert / merge / lp）とファイルの大きさ・ページ数から決める。
+#
+# 使い方:
+#   child_process.run([exe, arg], check=True, timeout=300)   # subprocess.run と同じ感覚
+#   with child_process.track(worker.proc): ...               # 自分で起動した常駐プロセスも対象にする
+#   timeout = TimeoutPolicy().for_item("convert", word_path)
+#   child_process.kill_all()   # 中止ボタン
+#   child_process.reset()      # 次の実行の前
+
+import os
+import time
+import signal
+import threading
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from spooler import NO_WINDOW
+from pdf_info import count_pages
+
+
+class ProcessCancelled(RuntimeError):
+    """中止で子プロセスを終了させた／中止後なので起動しなかった"""
+
+
+class ProcessTimeout(subprocess.TimeoutExpired):
+    """期限を過ぎたので watchdog が子孫ごと終了させた"""
+
+    def __str__(self):
+        return f"応答が無いため終了させました（{self.timeout:.0f} 秒）: {os.path.basename(str(self.cmd[0]))}"
+
+
+_lock = threading.Lock()
+_wake = threading.Condition(_lock)
+_running: Dict[int, subprocess.Popen] = {}   # pid -> Popen
+_killed: Set[int] = set()
+_deadlines: Dict[int, Tuple[float, float]] = {}   # pid -> (期限, 時間制限の秒数)
+_timed_out: Set[int] = set()
+_cancelled = False
+_watchdog: Optional[threading.Thread] = None
+_timeouts = 0   # watchdog が終了させた数
+
+
+# ===== 時間制限 =====
+class TimeoutPolicy:
+    """
+    種類ごとの時間制限（秒）= base + 1MB あたり per_mb + 1ページあたり per_page（上限 max_sec）。
+    ページ数は PDF だけ数える（pdf_info は mmap で読むので大きなファイルでも速い）。
+    """
+
+    BASE = {"pdf": 30.0, "word": 60.0, "convert": 60.0, "merge": 30.0, "lp": 30.0}
+    PER_MB = {"pdf": 3.0, "word": 5.0, "convert": 5.0, "merge": 1.0, "lp": 0.5}
+    PER_PAGE = {"pdf": 1.0, "word": 0.0, "convert": 0.0, "merge": 0.0, "lp": 0.0}
+
+    def __init__(self, base: Optional[Dict[str, float]] = None, per_mb: Optional[Dict[str, float]] = None,
+                 per_page: Optional[Dict[str, float]] = None, max_sec: float = 900.0):
+        """base / per_mb / per_page: 既定値を種類ごとに上書きする分。0 以下の base はその種類を無制限にする"""
+        self.base = dict(self.BASE, **(base or {}))
+        self.per_mb = dict(self.PER_MB, **(per_mb or {}))
+        self.per_page = dict(self.PER_PAGE, **(per_page or {}))
+        self.max_sec = max_sec
+
+    def for_item(self, kind: str, path, pages: Optional[int] = None) -> Optional[float]:
+        """path（リストなら合計）を kind で処理するときの時間制限。None は無制限"""
+        base = self.base.get(kind, 0.0)
+        if base <= 0:
+            return None
+        paths = [Path(p) for p in path] if isinstance(path, (list, tuple)) else [Path(path)]
+        size = 0
+        for p in paths:
+            try:
+                size += p.stat().st_size
+            except OSError:
+                pass
+        if pages is None and self.per_page.get(kind):
+            pages = sum(count_pages(p) or 1 for p in paths if p.suffix.lower() == ".pdf")
+        sec = base + size / (1024 * 1024) * self.per_mb.get(kind, 0.0) + (pages or 0) * self.per_page.get(kind, 0.0)
+        return min(sec, self.max_sec) if self.max_sec else sec
+
+
+def _watch():
+    """期限を過ぎた子プロセスを子孫ごと終了させる（1本だけ常駐）"""
+    global _timeouts
+    while True:
+        with _wake:
+            now = time.monotonic()
+            overdue = [pid for pid, (deadline, _) in _deadlines.items() if deadline <= now]
+            for pid in overdue:
+                del _deadlines[pid]
+                _timed_out.add(pid)
+            procs = [_running[pid] for pid in overdue if pid in _running]
+            _timeouts += len(procs)
+            if not procs:
+                nearest = min((d for d, _ in _deadlines.values()), default=None)
+                _wake.wait(None if nearest is None else max(nearest - now, 0.01))
+                continue
+        for p in procs:
+            kill_tree(p)
+
+
+def popen_options() -> dict:
+    """子孫ごと終了できるように起動するための Popen 引数"""
+    if os.name == "nt":
+        return {"creationflags": NO_WINDOW}
+    return {"start_new_session": True}
+
+
+def kill_tree(proc: subprocess.Popen):
+    """proc とその子孫を強制終了する（終わっていれば何もしない）"""
+    if proc.poll() is not None:
+        return
+    if os.name == "nt":
+        try:
+            subprocess.run(["taskkill", "/T", "/F", "/PID", str(proc.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                           creationflags=NO_WINDOW, timeout=10)
+        except (OSError, subprocess.SubprocessError):
+            pass
+    else:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (OSError, AttributeError):
+            pass
+    if proc.poll() is None:
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+
+def _register(proc: subprocess.Popen, timeout: Optional[float] = None):
+    global _watchdog
+    with _lock:
+        _running[proc.pid] = proc
+        cancelled = _cancelled
+        if timeout:
+            _deadlines[proc.pid] = (time.monotonic() + timeout, timeout)
+            if _watchdog is None:
+                _watchdog = threading.Thread(target=_watch, daemon=True, name="child-watchdog")
+                _watchdog.start()
+            _wake.notify_all()
+    if cancelled:
+        # 登録と中止がすれ違った
+        kill_tree(proc)
+        with _lock:
+            _killed.add(proc.pid)
+
+
+def _unregister(proc: subprocess.Popen) -> Optional[str]:
+    """登録を外す。kill_all で終了させたものなら "cancelled"、watchdog なら "timeout"（どちらでもなければ None）"""
+    with _lock:
+        _running.pop(proc.pid, None)
+        _deadlines.pop(proc.pid, None)
+        if proc.pid in _killed:
+            _killed.discard(proc.pid)
+            _timed_out.discard(proc.pid)
+            return "cancelled"
+        if proc.pid in _timed_out:
+            _timed_out.discard(proc.pid)
+            return "timeout"
+        return None
+
+
+# ===== 起動 =====
+def run(args: List[str], check: bool = True, timeout: Optional[float] = None,
+        stdout=None, stderr=None, text: bool = False) -> subprocess.CompletedProcess:
+    """
+    subprocess.run の代わり。実行中は kill_all の対象になる。
+    中止で終了させられたら ProcessCancelled。
+    timeout（秒）を過ぎたら watchdog が子孫ごと終了させ、ProcessTimeout（TimeoutExpired）。
+    """
+    if _cancelled:
+        raise ProcessCancelled(f"中止したため起動しません: {os.path.basename(str(args[0]))}")
+    proc = subprocess.Popen(args, stdout=stdout, stderr=stderr, text=text, **popen_options())
+    _register(proc, timeout)
+    try:
+        try:
+            # 子孫ごと終了させればパイプも閉じるので、ここは期限なしで待ってよい
+            out, err = proc.communicate()
+        except BaseException:
+            kill_tree(proc)
+            raise
+    finally:
+        reason = _unregister(proc)
+    if reason == "cancelled":
+        raise ProcessCancelled(f"中止したため終了させました: {os.path.basename(str(args[0]))}")
+    if reason == "timeout":
+        raise ProcessTimeout(args, timeout, out, err)
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args, out, err)
+    return subprocess.CompletedProcess(args, proc.returncode, out, err)
+
+
+@contextmanager
+def track(proc: Optional[subprocess.Popen], timeout: Optional[float] = None):
+    """with の間だけ、よそで起動した proc を kill_all（と timeout 秒の watchdog）の対象にする"""
+    if proc is None:
+        yield
+        return
+    _register(proc, timeout)
+    try:
+        yield
+    finally:
+        reason = _unregister(proc)
+        if reason == "cancelled":
+            raise ProcessCancelled("中止したため終了させました")
+        if reason == "timeout":
+            raise ProcessTimeout(proc.args, timeout)
+
+
+# ===== 中止 =====
+def kill_all() -> int:
+    """実行中の子プロセスを全部（子孫ごと）終了させ、以後の起動を断る。新しく終了させた数を返す"""
+    global _cancelled
+    with _lock:
+        _cancelled = True
+        procs = [p for p in _running.values() if p.pid not in _killed]
+        _killed.update(p.pid for p in procs)
+    for p in procs:
+        kill_tree(p)
+    return len(procs)
+
+
+def running() -> int:
+    with _lock:
+        return len(_running)
+
+
+def cancelled() -> bool:
+    return _cancelled
+
+
+def timeouts() -> int:
+    """これまでに watchdog が期限切れで終了させた数"""
+    return _timeouts
+
+
+def reset():
+    """中止状態を解除する（次の実行の前に呼ぶ）"""
+    global _cancelled
+    with _lock:
+        _cancelled = False
+        _killed.clear()
@@ -0,0 +1,194 @@
+# convert_cache.py
+# Word → PDF 変換結果のキャッシュ（内容ハッシュ + LRU 容量上限）
+#
+# 同じテンプレート・報告書が日をまたいで何度も印刷されるので、
+# 「元文書の内容ハッシュ + LibreOffice のバージョン + 変換設定」をキーにして
+# 変換済み PDF を保存しておき、ヒットしたら変換をまるごと飛ばす。
+# 容量が max_bytes を超えたら最後に使われたのが古いものから消す（LRU）。
+# 管理情報は cache_dir/index.sqlite3 に持つ。
+#
+# 注意: DATE / TIME / PRINTDATE フィールド（「今日の日付」など）は変換した時点の値で PDF に固まる。
+# 内容が同じでも印刷する日で結果が変わるので、こうしたフィールドを含む文書はキャッシュしない
+# （key が None を返し、毎回変換する）。
+
+import os
+import re
+import time
+import shutil
+import sqlite3
+import hashlib
+import zipfile
+import threading
+from pathlib import Path
+from typing import Optional, Set
+
+CHUNK = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key       TEXT PRIMARY KEY,
+    size      INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used);
+"""
+
+# 変換するたびに値が変わるフィールド（CREATEDATE / SAVEDATE は文書の内容なので対象外）
+_VOLATILE = rb"(?:DATE|TIME|PRINTDATE)"
+# docx / docm: <w:instrText> DATE \@ ...</w:instrText> と <w:fldSimple w:instr=" TIME ">
+_OOXML_FIELD = re.compile(rb'(?:<w:instrText[^>]*>|w:instr=")\s*' + _VOLATILE + rb"\b", re.IGNORECASE)
+# doc: フィールド開始文字 0x13 の直後のフィールド名
+_DOC_FIELD = re.compile(r"\x13\s*" + _VOLATILE.decode() + r"[\s\\\x14]", re.IGNORECASE)
+
+
+def has_volatile_fields(word_path: Path) -> bool:
+    """
+    DATE / TIME / PRINTDATE フィールドを含むか（含むなら変換結果をキャッシュできない）。
+    docx / docm は本文・ヘッダー・フッター等の XML を、doc は本文の文字列（8bit と UTF-16）を見る。
+    読めなければ安全側に倒して True
+    """
+    try:
+        if zipfile.is_zipfile(word_path):
+            with zipfile.ZipFile(word_path) as z:
+                return any(
+                    _OOXML_FIELD.search(z.read(name))
+                    for name in z.namelist()
+                    if name.startswith("word/") and name.endswith(".xml")
+                )
+        data = Path(word_path).read_bytes()
+    except (OSError, zipfile.BadZipFile, RuntimeError):
+        return True
+    texts = [data.decode("latin-1")] + [data[k:].decode("utf-16-le", "ignore") for k in (0, 1)]
+    return any(_DOC_FIELD.search(t) for t in texts)
+
+
+def libreoffice_version(soffice_path: Path) -> str:
+    """
+    LibreOffice のバージョン識別子。
+    soffice を起動せずに済むよう、同じフォルダの version.ini（Windows）/ versionrc（Linux）の
+    内容ハッシュを使う。見つからなければ soffice 本体のサイズと更新時刻で代用する。
+    """
+    program = Path(soffice_path).resolve().parent
+    for name in ("version.ini", "versionrc"):
+        p = program / name
+        if p.is_file():
+            return hashlib.sha256(p.read_bytes()).hexdigest()[:16]
+    try:
+        st = Path(soffice_path).stat()
+        return f"{st.st_size}-{int(st.st_mtime)}"
+    except OSError:
+        return "unknown"
+
+
+class ConvertCache:
+    """
+    使い方:
+        cache = ConvertCache(cache_dir, max_bytes=2 * 1024**3, lo_version=libreoffice_version(soffice))
+        key = cache.key(word_path)        # 日付フィールドを含む文書は None（キャッシュしない）
+        pdf = cache.get(key) if key else None
+        if pdf is None:
+            pdf = converted_pdf if key is None else cache.put(key, converted_pdf)
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int, lo_version: str = "", settings: str = "pdf"):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.salt = f"{lo_version}\n{settings}\n".encode("utf-8")
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.volatile = 0   # 日付フィールドを含むためキャッシュしなかった数
+
+        self._lock = threading.Lock()
+        self._pinned: Set[str] = set()   # この実行で返したもの（印刷前に消さない）
+        self.conn = sqlite3.connect(str(self.cache_dir / "index.sqlite3"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def key(self, word_path: Path) -> Optional[str]:
+        """キャッシュのキー。変換するたびに中身が変わる文書（has_volatile_fields）は None"""
+        if has_volatile_fields(word_path):
+            with self._lock:
+                self.volatile += 1
+            return None
+        h = hashlib.sha256(self.salt)
+        with open(word_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.pdf"
+
+    def get(self, key: str) -> Optional[Path]:
+        p = self._path(key)
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM entries WHERE key=?", (key,)).fetchone()
+            if row is None or not p.exists():
+                if row is not None:
+                    # 管理情報だけ残っている（手で消された等）
+                    with self.conn:
+                        self.conn.execute("DELETE FROM entries WHERE key=?", (key,))
+                self.misses += 1
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE entries SET last_used=? WHERE key=?", (time.time(), key))
+            self.hits += 1
+            self._pinned.add(key)
+            return p
+
+    def put(self, key: str, pdf_path: Path) -> Path:
+        """変換済み PDF をキャッシュに取り込み、キャッシュ側のパスを返す"""
+        dest = self._path(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_suffix(f".{threading.get_ident()}.tmp")
+        shutil.copyfile(pdf_path, tmp)
+        os.replace(tmp, dest)  # 途中で落ちても壊れたPDFを残さない
+
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)",
+                    (key, dest.stat().st_size, time.time()),
+                )
+            self._pinned.add(key)
+            self._evict()
+        return dest
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+        with self.conn:
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if key in self._pinned:
+                    continue
+                try:
+                    self._path(key).unlink()
+                except FileNotFoundError:
+                    pass
+                self.conn.execute("DELETE FROM entries WHERE key=?", (key,))
+                total -= size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "volatile": self.volatile,
+            "entries": entries,
+            "bytes": total,
+        }
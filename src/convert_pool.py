@@ -0,0 +1,187 @@
+# convert_pool.py
+# Word → PDF 並列変換プール
+#
+# LibreOffice は同じユーザープロファイルに2つのインスタンスを同時に立てられない。
+# そこでワーカーごとに専用のプロファイル（-env:UserInstallation）を持たせ、
+# 最大 N 本の soffice --convert-to pdf を同時に走らせる。
+# 変換できた PDF は既存の PDF 印刷経路（PDFtoPrinter）で印刷する。
+# soffice は child_process の対象にして起動するので、中止ボタンで変換中のものも止まる。
+# close() は変換中の soffice を先に終了させてから片付ける（中止せずに終わったときも待たない）。
+#
+# 使い方:
+# cache（ConvertCache）を渡すと、同じ内容の文書は変換せずキャッシュ済みPDFを返す。
+#
+#   pool = ConvertPool(soffice_path, workers=4, cache=cache)
+#   pool.prefetch(word_paths)          # 先に全部投入しておく
+#   pdf = pool.convert(word_path)      # 変換済みPDFのパス（終わるまで待つ）
+#   pool.close()
+
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+import child_process
+from child_process import TimeoutPolicy
+from convert_cache import ConvertCache
+
+
+class ConvertError(RuntimeError):
+    pass
+
+
+def default_workers() -> int:
+    # soffice 1本でほぼ1コアを使い切るので CPU 数が目安
+    return max(os.cpu_count() or 1, 1)
+
+
+class ConvertPool:
+    def __init__(self, soffice_path: Path, workers: Optional[int] = None,
+                 work_dir: Optional[Path] = None, timeout: float = 300.0,
+                 cache: Optional[ConvertCache] = None, timeouts: Optional[TimeoutPolicy] = None):
+        """
+        timeout: 1件の変換の時間制限（秒）
+        timeouts: 渡すとファイルの大きさから1件ごとの時間制限を決める（timeout の代わり）
+        """
+        self.soffice_path = Path(soffice_path)
+        self.cache = cache
+        self.workers = workers or default_workers()
+        self.timeout = timeout
+        self.timeouts = timeouts
+
+        self._own_work_dir = work_dir is None
+        self.work_dir = Path(work_dir) if work_dir else Path(tempfile.mkdtemp(prefix="convert_pool_"))
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+
+        # プロファイルは「貸し出し」式: 変換中のプロファイルは他の変換に使わせない
+        self._profiles: "queue.Queue[Path]" = queue.Queue()
+        for i in range(self.workers):
+            p = self.work_dir / f"profile{i}"
+            p.mkdir(exist_ok=True)
+            self._profiles.put(p)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="convert")
+        self._futures: Dict[Path, Future] = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._procs: Set[subprocess.Popen] = set()   # 変換中の soffice（close で終了させる）
+        self._closed = False
+
+    # ===== 変換本体 =====
+    def _out_dir(self) -> Path:
+        # 別フォルダの同名ファイル（Word_sample1.docx 等）がぶつからないよう1件ごとに分ける
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        d = self.work_dir / "out" / f"{seq:05d}"
+        d.mkdir(parents=True, exist_ok=True)
+        return d
+
+    def _convert(self, word_path: Path) -> Path:
+        if self.cache is None:
+            return self._convert_soffice(word_path)
+
+        key = self.cache.key(word_path)
+        if key is None:
+            # 日付フィールドを含む文書は印刷する日で結果が変わるのでキャッシュしない
+            return self._convert_soffice(word_path)
+        pdf = self.cache.get(key)
+        if pdf is not None:
+            return pdf
+        return self.cache.put(key, self._convert_soffice(word_path))
+
+    def _convert_soffice(self, word_path: Path) -> Path:
+        if not self.soffice_path.exists():
+            raise FileNotFoundError(f"soffice が見つかりません: {self.soffice_path}")
+
+        out_dir = self._out_dir()
+        profile = self._profiles.get()
+        try:
+            self._run_soffice(
+                [
+                    str(self.soffice_path),
+                    f"-env:UserInstallation={profile.resolve().as_uri()}",
+                    "--headless", "--norestore", "--nologo", "--nodefault",
+                    "--convert-to", "pdf",
+                    "--outdir", str(out_dir),
+                    str(word_path),
+                ],
+                self.timeouts.for_item("convert", word_path) if self.timeouts else self.timeout,
+            )
+        finally:
+            self._profiles.put(profile)
+
+        pdf = out_dir / (Path(word_path).stem + ".pdf")
+        if not pdf.exists():
+            # soffice は変換に失敗しても終了コード0のことがある
+            raise ConvertError(f"PDFに変換できませんでした: {word_path}")
+        return pdf
+
+    def _run_soffice(self, args, timeout: Optional[float]):
+        """
+        child_process.run と同じ（中止・時間制限の対象）だが、close() で終了させられるように
+        変換中のプロセスを覚えておく
+        """
+        if child_process.cancelled():
+            raise child_process.ProcessCancelled("中止したため変換しません")
+        with self._lock:
+            if self._closed:
+                raise ConvertError("変換プールを閉じたため変換しません")
+            proc = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                    **child_process.popen_options())
+            self._procs.add(proc)
+        try:
+            with child_process.track(proc, timeout):
+                try:
+                    proc.wait()
+                except BaseException:
+                    child_process.kill_tree(proc)
+                    raise
+        finally:
+            with self._lock:
+                self._procs.discard(proc)
+        if self._closed:
+            raise ConvertError("変換プールを閉じたため変換を打ち切りました")
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, args)
+
+    # ===== 投入・取得 =====
+    def submit(self, word_path: Path) -> Future:
+        """変換を投入する（同じパスは1回だけ変換）。close() の後は ConvertError"""
+        word_path = Path(word_path)
+        with self._lock:
+            if self._closed:
+                raise ConvertError(f"変換プールを閉じたため変換しません: {word_path}")
+            fut = self._futures.get(word_path)
+            if fut is None:
+                fut = self._executor.submit(self._convert, word_path)
+                self._futures[word_path] = fut
+            return fut
+
+    def prefetch(self, word_paths: Iterable[Path]) -> None:
+        for p in word_paths:
+            self.submit(p)
+
+    def convert(self, word_path: Path) -> Path:
+        """変換済みPDFのパスを返す。未投入なら投入してから待つ（close() で取り消されたら ConvertError）"""
+        try:
+            return self.submit(word_path).result()
+        except CancelledError:
+            raise ConvertError(f"変換プールを閉じたため変換を取り消しました: {word_path}") from None
+
+    def close(self):
+        # 未着手の変換は取り消し、実行中の soffice は終了させてから片付ける
+        # （終わるまで待つと、大きな文書の変換が残っているだけで終了が数分遅れる）
+        with self._lock:
+            self._closed = True
+            procs = list(self._procs)
+        for proc in procs:
+            child_process.kill_tree(proc)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._own_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
@@ -1,12 +1,17 @@
 # gui_input.py
 from datetime import datetime
+from typing import Optional, Union
 import tkinter as tk
 from tkinter import messagebox
 
-def input_date_gui() -> datetime:
+from scanner import TimeRange
+
+def input_date_gui(since: Optional[float] = None) -> Union[datetime, TimeRange, None]:
     """
     YYYY/MM/DDをGUIで入力させてdatetime型で返す。
     キャンセルされたらNoneを返す。
+    since（前回の印刷の時刻）を渡すと「前回の印刷以降」ボタンも出し、
+    押されたら TimeRange.since(since)（その時刻から今までに更新されたもの）を返す。
     """    
 
     def on_ok():
@@ -23,6 +28,10 @@ def input_date_gui() -> datetime:
         result["target_date"] = None
         root.destroy()
 
+    def on_since():
+        result["target_date"] = TimeRange.since(since)
+        root.destroy()
+
      # Enterキーで「実行」と同じ動作
     def on_enter(event):
         on_ok()
@@ -32,7 +41,7 @@ def input_date_gui() -> datetime:
 
     root = tk.Tk()
     root.title("日付入力")
-    root.geometry("320x140")
+    root.geometry("320x140" if since is None else "320x200")
 
     result = {"target_date": None}
     
@@ -80,6 +89,16 @@ def input_date_gui() -> datetime:
         command=on_cancel
     )
     cancel_btn.pack(side="left",padx=6)
+
+    #前回の印刷以降（差分）
+    if since is not None:
+        since_btn = tk.Button(
+            root,
+            text=f"前回の印刷以降（{datetime.fromtimestamp(since).strftime('%m/%d %H:%M')}〜）",
+            width=30,
+            command=on_since
+        )
+        since_btn.pack(pady=8)
     
     root.mainloop()
     return result["target_date"]
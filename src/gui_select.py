@@ -1,17 +1,20 @@
 # gui_select.py
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 from pathlib import Path
+import threading
+import queue
 
-def select_targets_gui(targets: List[Tuple[str, Path, str]]) -> List[Tuple[str, Path, str]]:
+
+def _build_window(title: str):
     """
-    targets をチェックボックス付きで表示し、選ばれたものだけ返す。
-    tkinter標準のみ。
+    スクロール可能なチェックボックス一覧の器を作る。
+    戻り値: (root, scroll_frame, btn_frame)
     """
     import tkinter as tk
     from tkinter import ttk
 
     root = tk.Tk()
-    root.title("印刷するファイルを選択")
+    root.title(title)
     root.geometry("600x600")
 
     # --- スクロール可能な領域を作る ---
@@ -33,19 +36,44 @@ def select_targets_gui(targets: List[Tuple[str, Path, str]]) -> List[Tuple[str,
     canvas.pack(side="left", fill="both", expand=True)
     scrollbar.pack(side="right", fill="y")
 
-    # --- チェックボックス行を生成 ---
-    vars_ = []  # (BooleanVar, (kind, path))
-    for kind, path, fname in targets:
-        v = tk.BooleanVar(value=True)  # デフォルト全選択
-        text = f"[{kind.upper():4}]  {fname}"
-        cb = ttk.Checkbutton(scroll_frame, text=text, variable=v)
-        cb.pack(anchor="w", padx=8, pady=2)
-        vars_.append((v, (kind, path,fname)))
-
     # --- 下部ボタン群 ---
     btn_frame = ttk.Frame(root)
     btn_frame.pack(fill="x", pady=6)
 
+    return root, scroll_frame, btn_frame
+
+
+def _add_row(scroll_frame, vars_, kind, path, fname, note: Optional[str] = None):
+    import tkinter as tk
+    from tkinter import ttk
+
+    # デフォルト全選択（注記のある行＝印刷済みは外しておく）
+    v = tk.BooleanVar(value=note is None)
+    text = f"[{kind.upper():4}]  {fname}"
+    if note:
+        text += f"    ※ {note}"
+    cb = ttk.Checkbutton(scroll_frame, text=text, variable=v)
+    cb.pack(anchor="w", padx=8, pady=2)
+    vars_.append((v, (kind, path, fname)))
+
+
+def select_targets_gui(targets: List[Tuple[str, Path, str]],
+                       notes: Optional[Dict[Path, str]] = None) -> List[Tuple[str, Path, str]]:
+    """
+    targets をチェックボックス付きで表示し、選ばれたものだけ返す。
+    tkinter標準のみ。
+    notes: {path: 注記}。注記のある行（印刷済みなど）はチェックを外して出す。
+    """
+    from tkinter import ttk
+
+    root, scroll_frame, btn_frame = _build_window("印刷するファイルを選択")
+
+    # --- チェックボックス行を生成 ---
+    vars_ = []  # (BooleanVar, (kind, path, fname))
+    notes = notes or {}
+    for kind, path, fname in targets:
+        _add_row(scroll_frame, vars_, kind, path, fname, notes.get(path))
+
     def select_all():
         for v, _ in vars_:
             v.set(True)
@@ -68,3 +96,124 @@ def select_targets_gui(targets: List[Tuple[str, Path, str]]) -> List[Tuple[str,
     root.mainloop()
     return selected
 
+
+def _read_stream(stream: Iterable, q: "queue.Queue", stop_event: threading.Event):
+    """
+    stream を読み進めて q に ("folder", 項目) を積み、最後に ("end", 最後まで読めたか) を積む。
+    stop_event が立ったらそこでやめて stream を閉じる（最後まで読めなかった扱い）。
+    途中で例外になったら ("error", メッセージ) を積んで、最後まで読めなかった扱い。
+    """
+    it = iter(stream)
+    complete = False
+    try:
+        for item in it:
+            if stop_event.is_set():
+                break
+            q.put(("folder", item))
+        else:
+            complete = True
+    except Exception as e:
+        q.put(("error", str(e)))
+    finally:
+        close = getattr(it, "close", None)
+        if close is not None:
+            close()
+        q.put(("end", complete))
+
+
+def select_targets_streaming_gui(
+        stream: Iterable[Tuple[str, List[Tuple[str, Path, str]], bool]],
+        notes: Optional[Dict[Path, str]] = None) -> Tuple[List[Tuple[str, Path, str]], bool]:
+    """
+    走査しながら選択させる版。
+    stream は (フォルダ名, そのフォルダの対象, wordなしか) をフォルダごとに返すもの
+    （module1.iter_targets）。別スレッドで読み進め、届いた分から行を追加する。
+    走査中でも「選択したものを印刷」を押せる（その時点で表示済みの分だけが対象）。
+    wordファイルの無いフォルダは一覧の中に注記として出す。
+    notes は select_targets_gui と同じ（stream がフォルダを返す前に書き足してよい）。
+    戻り値: (選んだ対象, 走査を最後まで終えて全部表示してから選んだか)
+      走査の途中で押した・走査が失敗したときは False（まだ見ていないフォルダがある）。
+    """
+    import tkinter as tk
+    from tkinter import ttk
+
+    POLL_MS = 100
+
+    root, scroll_frame, btn_frame = _build_window("印刷するファイルを選択")
+
+    lbl_status = ttk.Label(btn_frame, text="スキャン中… 0 フォルダ")
+    lbl_status.pack(side="left", padx=5)
+
+    q: "queue.Queue" = queue.Queue()
+    stop_event = threading.Event()
+
+    threading.Thread(target=_read_stream, args=(stream, q, stop_event), daemon=True).start()
+
+    vars_ = []  # (BooleanVar, (kind, path, fname))
+    state = {"folders": 0, "scanning": True, "complete": False}
+
+    def update_status(text=None):
+        if text is None:
+            text = f"スキャン中… {state['folders']} フォルダ / {len(vars_)} 件"
+        lbl_status.configure(text=text)
+
+    def poll():
+        try:
+            while True:
+                ev = q.get_nowait()
+                if ev[0] == "folder":
+                    name, folder_targets, no_word = ev[1]
+                    state["folders"] += 1
+                    for kind, path, fname in folder_targets:
+                        _add_row(scroll_frame, vars_, kind, path, fname, (notes or {}).get(path))
+                    if no_word:
+                        tk.Label(
+                            scroll_frame, text=f"※ wordファイルなし: {name}", fg="#b00000"
+                        ).pack(anchor="w", padx=8, pady=2)
+                elif ev[0] == "error":
+                    tk.Label(
+                        scroll_frame, text=f"※ スキャンエラー: {ev[1]}", fg="#b00000"
+                    ).pack(anchor="w", padx=8, pady=2)
+                elif ev[0] == "end":
+                    state["scanning"] = False
+                    state["complete"] = ev[1]
+        except queue.Empty:
+            pass
+
+        if state["scanning"]:
+            update_status()
+            root.after(POLL_MS, poll)
+        elif state["complete"]:
+            update_status(f"スキャン完了: {state['folders']} フォルダ / {len(vars_)} 件")
+        else:
+            update_status(f"スキャン中断: {state['folders']} フォルダ / {len(vars_)} 件")
+
+    def select_all():
+        for v, _ in vars_:
+            v.set(True)
+
+    def clear_all():
+        for v, _ in vars_:
+            v.set(False)
+
+    selected: List[Tuple[str, Path, str]] = []
+
+    def done():
+        nonlocal selected
+        selected = [item for v, item in vars_ if v.get()]
+        stop_event.set()
+        root.destroy()
+
+    def on_close():
+        stop_event.set()
+        root.destroy()
+
+    ttk.Button(btn_frame, text="全選択", command=select_all).pack(side="left", padx=5)
+    ttk.Button(btn_frame, text="全解除", command=clear_all).pack(side="left", padx=5)
+    ttk.Button(btn_frame, text="選択したものを印刷", command=done).pack(side="right", padx=5)
+    root.protocol("WM_DELETE_WINDOW", on_close)
+
+    root.after(POLL_MS, poll)
+    root.mainloop()
+    # 押した時点で "end" を受け取っていなければ、まだ届いていないフォルダがある
+    return selected, state["complete"]
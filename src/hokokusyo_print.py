@@ -1,59 +1,335 @@
 # hokokusyo_print.py
 from pathlib import Path
 from datetime import datetime
+from typing import Optional
 import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
 import tkinter as tk
 from tkinter import messagebox
 import module1 as m
+import spooler
+import queue_monitor
 import gui_select as gs
 import gui_input as gi
 import no_word_folder as nw
+from soffice_worker import SofficeWorker
+from convert_pool import ConvertPool
+from convert_cache import ConvertCache, libreoffice_version
+from pdf_info import count_pages
+from queue_budget import QueueBudget
+import autotune
+import printer_backend
+import run_journal
+from printer_pool import PrinterPool, PoolPrinter
+from printer_health import Failover, HealthMonitor
+from pdf_merge import merge_pdfs, MergeError
+from child_process import TimeoutPolicy
+from scanner import TimeRange, as_range
+from spooler import NotSubmitted, SpoolerError
 
 
-def main():
-    # 1) 設定読み込み（config.json が無い/壊れている時はGUIで通知）
+def _collect_and_select(args, parent_folder: Path, stream_scan: bool, use_scan_index: bool, scan_workers: int,
+                        already_printed: str = "off", hash_workers: int = 4, since: Optional[float] = None,
+                        overlap_sec: float = 0.0, index_full_hours: float = 0.0, since_full: bool = False):
+    """
+    日付入力 → 対象収集 → wordなしフォルダ表示 → 選択。途中でやめたら None、
+    それ以外は (集めた更新時刻の範囲, 選択した対象)。範囲の終わり（前回の印刷の記録用）は
+      - 走査を始めた時刻から overlap_sec 引いたところまで（共有フォルダ側の時計とのずれ・走査中の更新に備える）
+      - 選ばなかった対象があれば、そのフォルダの対象PDFのいちばん古い更新時刻まで（次の差分モードでまた出る）
+      - 走査が終わる前に選んだら範囲の始まりのまま（まだ見ていないフォルダを次の差分モードで集める）
+    since は前回の印刷の時刻（high water mark）。日付の代わりに「前回の印刷以降」を選べる。
+    走査インデックスは日付・「前回の印刷以降」とも変わったフォルダだけ読み直し、
+    前回の全走査から index_full_hours 経っていれば全部読み直す（その場で上書きされたファイルはそれまで拾えない。
+    「前回の印刷以降」では、その間に時刻が進むと次の全走査でも拾えない）。
+    since_full なら「前回の印刷以降」は毎回全部読み直す（上書きを取りこぼさない代わりに共有全体を読む）。
+    headless では日付は --date（省略時は今日）か --since-last、wordなしフォルダは表示だけ、対象は全部選択。
+    already_printed が "skip" / "flag" なら、印刷履歴で同じ内容を印刷済みのものを外す / 注記してチェックを外す。
+    headless では "flag" も外す（選ぶ画面が無いので）。
+    """
+    check_printed = already_printed in ("skip", "flag")
+    mode = "skip" if args.headless else already_printed
+    notes = {}
+    # 日付入力
+    if args.headless and args.since_last:
+        if since is None:
+            # 記録が無い（初回）は今日の0時から
+            since = TimeRange.day(datetime.now()).start
+            print("前回の印刷の記録が無いので、今日の更新分から集めます")
+        target_date = TimeRange.since(since)
+    elif args.headless:
+        target_date = datetime.strptime(args.date, "%Y-%m-%d") if args.date else datetime.now()
+    else:
+        target_date = gi.input_date_gui(since=since)
+    if target_date is None:
+        print("キャンセルのため終了")
+        return None
+    else:
+        full = since_full and isinstance(target_date, TimeRange)
+        target_date = as_range(target_date)
+        print(f"\n対象：{target_date.label} に更新されたPDF\n")        
+    scan_started = time.time()
+    candidates = []   # 選択に出した対象（選ばなかった分のフォルダを記録から外すため）
+    covered = True    # 全フォルダを走査してから選んだか（途中なら前回の印刷の時刻を進めない）
+
+    # 対象収集 → wordなしフォルダ表示 → GUIで選択
+    if stream_scan and not args.headless:
+        # 走査しながら選択GUIに流し込む（wordなしフォルダは一覧内に注記）
+        no_word_folder = []
+
+        def _stream():
+            index = m.open_scan_index(index_full_hours) if use_scan_index else None
+            history = m.open_print_history(hash_workers) if check_printed else None
+            try:
+                for name, folder_targets, no_word in m.iter_targets(
+                        parent_folder, target_date, index=index, workers=scan_workers, full=full):
+                    if history is not None:
+                        folder_targets, found = history.filter_targets(folder_targets, mode)
+                        notes.update(found)
+                        no_word = no_word and bool(folder_targets)   # 全部除外したフォルダは注記しない
+                    candidates.extend(folder_targets)
+                    if no_word:
+                        no_word_folder.append(name)
+                    yield name, folder_targets, no_word
+            finally:
+                if index is not None:
+                    index.close()
+                if history is not None:
+                    history.close()
+
+        selected, covered = gs.select_targets_streaming_gui(_stream(), notes)
+        # 選んだ中に wordファイルの無いフォルダがあれば、一括版と同じく続けるか確かめる
+        # （走査の途中で選んだときは読み取りスレッドがまだ書き足しているかもしれないので写しを見る）
+        if selected:
+            chosen_folders = {Path(p).parent.name for _, p, _ in selected}
+            missing = [name for name in list(no_word_folder) if name in chosen_folders]
+            if missing and not nw.no_word(missing):
+                return None
+    else:
+        index = m.open_scan_index(index_full_hours) if use_scan_index else None
+        try:
+            targets, no_word_folder = m.collect_targets(
+                parent_folder, target_date, index=index, workers=scan_workers, full=full
+            )
+        finally:
+            if index is not None:
+                index.close()
+        if check_printed:
+            history = m.open_print_history(hash_workers)
+            try:
+                targets, notes = history.filter_targets(targets, mode)
+            finally:
+                history.close()
+            remaining = {Path(p).parent.name for _, p, _ in targets}
+            no_word_folder = [name for name in no_word_folder if name in remaining]
+        print(f"印刷対象件数: {len(targets)}")
+        if notes:
+            verb = "除外" if mode == "skip" else "チェックを外して表示"
+            print(f"印刷済みと同じ内容のため{verb}: {len(notes)} 件")
+            if args.headless:
+                for path, note in notes.items():
+                    print(f"  {Path(path).name}（{note}）")
+
+        # wordファイルの無いフォルダの表示
+        if no_word_folder:
+            if args.headless:
+                print("wordファイルの無いフォルダ: " + ", ".join(no_word_folder))
+            elif not nw.no_word(no_word_folder):
+                return None
+
+        candidates = targets
+        selected = targets if args.headless else gs.select_targets_gui(targets, notes)
+    if selected is None:
+        return None
+    if not covered:
+        # まだ走査していないフォルダがある（candidates も途中まで）。時刻を進めると次の差分で拾えなくなる
+        print("走査が終わる前に選んだため、前回の印刷の時刻は進めません")
+        return target_date._replace(end=target_date.start), selected
+
+    chosen = {Path(p) for _, p, _ in selected}
+    skipped = [p for _, p, _ in candidates if Path(p) not in chosen]
+    end = _covered_until(candidates, skipped, min(target_date.end, scan_started) - overlap_sec)
+    if skipped:
+        print(f"選ばなかった {len(skipped)} 件のフォルダは、次の「前回の印刷以降」でもう一度対象になります")
+    return target_date._replace(end=max(end, target_date.start)), selected
+
+
+def _covered_until(items, held, end: float) -> float:
+    """
+    差分モードの次の開始時刻。held（投入しなかった項目のパス）のフォルダにある items の対象PDFのうち
+    いちばん古い更新時刻まで（そこから集め直せばそのフォルダがまた対象になる）。無ければ end
+    """
+    folders = {Path(p).parent for p in held}
+    until = end
+    for kind, path, _ in items:
+        if kind == "pdf" and Path(path).parent in folders:
+            try:
+                until = min(until, Path(path).stat().st_mtime)
+            except OSError:
+                pass
+    return until
+
+
+def _ask_resume(unfinished: run_journal.UnfinishedRun, args) -> bool:
+    """前回の途中で終わった実行を再開するか。--resume / --fresh が無ければ聞く（headless は端末で）"""
+    remaining = unfinished.remaining
+    c = unfinished.counts()
+    started = datetime.fromtimestamp(unfinished.started).strftime("%Y/%m/%d %H:%M")
+    msg = (f"{started} に始めた印刷が途中で終わっています。\n"
+           f"全 {len(unfinished.items)} 件のうち 未投入 {len(remaining)} 件 / "
+           f"投入済み {c[run_journal.SUBMITTED]} 件 / 印刷完了 {c[run_journal.COMPLETED]} 件")
+    if not remaining:
+        print(msg + "\n未投入の分は無いので、新しく始めます。")
+        return False
+    if args.resume or args.fresh:
+        return args.resume
+    msg += "\n\n未投入の分だけ続きから印刷しますか？"
+    if args.headless:
+        print(msg)
+        if not sys.stdin or not sys.stdin.isatty():
+            print("（続きから印刷するには --resume を付けて起動してください）")
+            return False
+        return input("[y/N] ").strip().lower() in ("y", "yes")
+    root = tk.Tk()
+    root.withdraw()
+    try:
+        return messagebox.askyesno("前回の印刷の再開", msg)
+    finally:
+        root.destroy()
+
+
+def _fatal(args, title: str, text: str):
+    """続けられないエラーを知らせる（headless は標準出力、それ以外はメッセージボックス）"""
+    if args.headless:
+        print(f"{title}: {text}")
+        return
+    root = tk.Tk()
+    root.withdraw()  # 余計な空ウィンドウを出さない
+    messagebox.showerror(title, text)
+    root.destroy()
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="報告書一括印刷")
+    parser.add_argument("--headless", action="store_true",
+                        help="画面を出さずに実行する（対象は全部選択、進捗は標準出力）")
+    parser.add_argument("--date", default="", help="対象日 YYYY-MM-DD（headless 用。省略時は今日）")
+    parser.add_argument("--since-last", action="store_true",
+                        help="対象日の代わりに、前回の印刷以降に更新されたものを全部集める（headless 用）")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--resume", action="store_true", help="途中で終わった前回の実行を聞かずに再開する")
+    group.add_argument("--fresh", action="store_true", help="途中で終わった前回の実行を再開せずに新しく始める")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+
+    # 1) 設定読み込み（config.json が無い/壊れている時はGUIで通知。headless は標準出力）
     try:
         cfg = m.load_config()
     
     except Exception as e:
-        # GUIメッセージボックスで致命エラー表示
-        root = tk.Tk()
-        root.withdraw()  # 余計な空ウィンドウを出さない
-        messagebox.showerror(
+        _fatal(
+            args,
             "設定ファイルエラー",
             f"config.json を読み込めませんでした。\n\n"
             f"exe と同じフォルダに config.json があるか確認してください。\n\n"
             f"詳細: {e}"
         )
-        root.destroy()
         return
     
     parent_folder = Path(cfg["parent_folder"])
     printer_name = cfg["printer_name"]
     soffice_path = Path(cfg["soffice_path"])
     pdftoprinter_path = Path(cfg["pdftoprinter_path"])
-    queue_limit = int(cfg.get("queue_limit", 6))
+    # プリンタプール: [{"name": ..., "weight": 速さの比, "queue_max_pages": ..., ...}, ...]
+    # 2台以上あればフォルダ単位で振り分けて並列に印刷する。無ければ printer_name の1台
+    pool_cfg = [e for e in cfg.get("printer_pool", []) if e.get("name")]
+    printers = [e["name"] for e in pool_cfg] or [printer_name]
+    printer_name = printers[0]
+    pool_default_rate = float(cfg.get("pool_default_rate", 0.2))  # 速度未学習のプリンタの見積もり（ページ/秒）
+    # 予備プリンタ: 故障で遮断したらこちらに回す（プールでは各項目の "backup"）
+    backups = {e["name"]: e["backup"] for e in pool_cfg if e.get("backup")}
+    if cfg.get("backup_printer") and printer_name not in backups:
+        backups[printer_name] = cfg["backup_printer"]
+    all_printers = printers + [b for b in backups.values() if b not in printers]
+    limits = {p: m.printer_limits(cfg, p) for p in all_printers}
+    health_check = bool(cfg.get("health_check", True))  # プリンタの故障検知（遮断・予備への切り替え）
+    health_interval_sec = float(cfg.get("health_interval_sec", 2))
+    health_failures = int(cfg.get("health_failures", 3))  # 何回続けて故障を見たら遮断するか
+    health_reset_sec = float(cfg.get("health_reset_sec", 30))
+    health_stall_sec = float(cfg.get("health_stall_sec", 120))
+    queue_throttle = cfg.get("queue_throttle", "jobs")  # "jobs": ジョブ数で制限 / "pages": ページ数・容量で制限
     queue_wait_interval_sec = float(cfg.get("queue_wait_interval_sec", 1))
+    # 走査インデックス: 更新時刻が変わったフォルダだけ読み直す。その場での上書きはフォルダの時刻が変わらず
+    # 取りこぼすことがあるので、scan_index_full_hours ごとに全部読み直す（日付・差分モードとも）
+    use_scan_index = bool(cfg.get("scan_index", False))
+    scan_index_full_hours = float(cfg.get("scan_index_full_hours", 24))
+    scan_index_full_since = bool(cfg.get("scan_index_full_since", False))  # True: 差分モードは毎回全部読み直す（共有全体を読むので遅い）
+    scan_workers = int(cfg.get("scan_workers", 1))
+    stream_scan = bool(cfg.get("stream_scan", False))
+    use_print_history = bool(cfg.get("print_history", False))  # 印刷した内容（ハッシュ）・日時・プリンタを記録するか
+    already_printed = cfg.get("already_printed", "off") if use_print_history else "off"  # 印刷済みの内容: skip / flag / off
+    hash_workers = int(cfg.get("hash_workers", 4))  # 内容ハッシュを並列に計算する数
+    # 「前回の印刷」の記録を走査開始からこの秒数だけ手前にする（共有フォルダ側の時計のずれ・走査中の更新の分）
+    # 重なった分は次回また集まるので、印刷履歴（already_printed）で印刷済みとして外す / 注記する
+    since_overlap_sec = float(cfg.get("since_overlap_sec", 300))
+    word_mode = cfg.get("word_mode", "print")  # "print": soffice で直接印刷 / "convert": PDF化して印刷
+    # 常駐 LibreOffice で印刷するか（word_mode が "print" のときだけ。"convert" は ConvertPool がワーカーごとに変換する）
+    use_soffice_worker = bool(cfg.get("soffice_worker", False))
+    convert_workers = int(cfg.get("convert_workers", 0)) or None
+    convert_cache_mb = int(cfg.get("convert_cache_mb", 0))  # 0 ならキャッシュしない（日付フィールドを含む文書は常に変換）
+    prepare_lookahead = int(cfg.get("prepare_lookahead", 0))  # 0 なら準備段なし（1件ずつ）
+    queue_backend = cfg.get("queue_backend", "auto")  # auto / win32 / powershell / cups / fake
+    queue_poll_min_sec = float(cfg.get("queue_poll_min_sec", 0.3))
+    queue_notify = bool(cfg.get("queue_notify", True))  # スプーラの変化通知を使うか
+    track_jobs = bool(cfg.get("track_jobs", False))  # ジョブIDを追いかけて完了を判定するか
+    gui_diagnostics = bool(cfg.get("gui_diagnostics", False))  # GUI の応答時間（最大停止・中止ボタンの反応）を最後に出すか
+    queue_autotune = bool(cfg.get("queue_autotune", False))  # ページ数予算と問い合わせ間隔を自動調整するか
+    printer_backend_kind = cfg.get("printer_backend", "auto")  # auto / windows / cups / directory / fake
+    batch_max_files = int(cfg.get("batch_max_files", 0))  # 同じフォルダのPDFを何件まで1回で投入するか（0/1 はまとめない）
+    batch_max_pages = int(cfg.get("batch_max_pages", 20))
+    batch_max_mb = float(cfg.get("batch_max_mb", 32))
+    merge_folders = bool(cfg.get("merge_folders", False))  # フォルダごとにPDFを1つに連結して1ジョブで印刷するか
+    merge_tool = cfg.get("merge_tool", "auto")  # auto（qpdf → pdfunite → pypdf）/ qpdf / pdfunite / pypdf / stream（内蔵。明示したときだけ）
+    merge_max_mb = float(cfg.get("merge_max_mb", 0))  # 1ジョブに連結する上限（0 は無制限）
+    # 外部コマンドの時間制限: 種類（pdf / word / convert / merge / lp）ごとの基本秒数 + 大きさ・ページ数の分
+    # 過ぎたら子孫プロセスごと終了させ、その1件を失敗にして先へ進む（基本秒数 0 は無制限）
+    timeouts = TimeoutPolicy(
+        base=cfg.get("timeout_base_sec", {}),
+        per_mb=cfg.get("timeout_per_mb_sec", {}),
+        per_page=cfg.get("timeout_per_page_sec", {}),
+        max_sec=float(cfg.get("timeout_max_sec", 900)),
+    )
 
-    # 2) 日付入力
-    target_date = gi.input_date_gui()
-    if target_date is None:
-        print("キャンセルのため終了")
-        return
-    else:
-        print(f"\n対象：{target_date.strftime('%Y/%m/%d')} に更新されたPDF\n")        
-
-    # 3) 対象収集
-    targets, no_word_folder = m.collect_targets(parent_folder, target_date)
-    print(f"印刷対象件数: {len(targets)}")
+    # 2) 途中で終わった前回の実行（run_journal）があれば、未投入の分から再開するか聞く
+    journal_path = m.base_dir() / "run_journal.jsonl"
+    selected = None
+    meta = {"printer": printer_name}
+    unfinished = run_journal.load_unfinished(journal_path)
+    if unfinished is not None:
+        if _ask_resume(unfinished, args):
+            selected = unfinished.remaining
+            meta.update(unfinished.meta, resumed_from=unfinished.run_id)
+            if unfinished.in_spool:
+                print(f"投入済みで印刷完了を確認できていない {len(unfinished.in_spool)} 件は投入し直しません")
+        else:
+            run_journal.discard(journal_path)
 
-    # 4) wordファイルの無いフォルダの表示
-    if no_word_folder:
-        if not nw.no_word(no_word_folder):
+    # 3)〜5) 日付入力 → 対象収集 → wordなしフォルダ表示 → GUIで選択
+    if selected is None:
+        chosen = _collect_and_select(args, parent_folder, stream_scan, use_scan_index, scan_workers,
+                                     already_printed, hash_workers, since=m.load_high_water(parent_folder),
+                                     overlap_sec=since_overlap_sec, index_full_hours=scan_index_full_hours,
+                                     since_full=scan_index_full_since)
+        if chosen is None:
             return
-
-    # 5) GUIで選択
-    selected = gs.select_targets_gui(targets)
+        period, selected = chosen
+        meta.update(target=period.label, period=[period.start, period.end])
     print(f"選択された印刷件数: {len(selected)}")
     if not selected:
         print("何も選択されなかったので終了します。")
@@ -62,23 +338,247 @@ def main():
     # 6) 印刷実行（進捗GUIつき）
     from print_progress_gui import run_print_with_gui
 
-    # --- 既存の module1 の印刷関数をGUI用にラップ ---
-    def _print_pdf(path):
-        # キュー上限付き投入（元コードと同じ）
-        m.wait_if_queue_full(printer_name, queue_limit, queue_wait_interval_sec)
-        m.print_pdf_with_pdftoprinter(pdftoprinter_path, printer_name, path)
-
-    def _print_word(path):
-        m.wait_if_queue_full(printer_name, queue_limit, queue_wait_interval_sec)
-        m.print_word_with_soffice(soffice_path, printer_name, path)
-
-    # --- GUI付きで印刷を走らせる ---
-    ok = run_print_with_gui(
-        selected,
-        print_pdf_func=_print_pdf,
-        print_word_func=_print_word,
-        printer_name=printer_name
-    )
+    # 常駐 LibreOffice（最初の Word 投入時に起動）
+    word_worker = None
+    if word_mode != "convert" and use_soffice_worker:
+        word_worker = SofficeWorker(soffice_path)
+    elif use_soffice_worker:
+        print('word_mode が "convert" のため soffice_worker は使いません（変換は ConvertPool が行います）')
+
+    # 投入先（windows / cups / directory / fake）。キューの問い合わせもバックエンドに合わせる
+    try:
+        backend = printer_backend.make_backend(
+            printer_backend_kind,
+            pdftoprinter_path=pdftoprinter_path,
+            soffice_path=soffice_path,
+            word_worker=word_worker,
+            queue_backend=queue_backend,
+            spool_dir=Path(cfg.get("spool_dir") or m.base_dir() / "spool"),
+            submit_ms=float(cfg.get("fake_submit_ms", 50)),
+            service_ms=float(cfg.get("fake_service_ms", 500)),
+            page_ms=float(cfg.get("fake_page_ms", 100)),
+            fake_speeds={e["name"]: float(e["fake_speed"]) for e in pool_cfg if "fake_speed" in e},
+        )
+    except (SpoolerError, ValueError) as e:
+        _fatal(args, "プリンタエラー", f"印刷の投入先を用意できませんでした。\n\n詳細: {e}")
+        return
+    backend.timeouts = timeouts
+    if word_mode != "convert" and not backend.capabilities().word:
+        print(f"{backend.name} は Word を直接印刷できないため、PDFに変換してから投入します")
+        word_mode = "convert"
+    if merge_folders:
+        # Word も変換後のPDFとして同じ束に入れる。束ねるには準備段で種類を確定させる必要がある
+        word_mode = "convert"
+        prepare_lookahead = max(prepare_lookahead, 1)
+
+    # 印刷キューの問い合わせ方式（module1 と進捗GUIで共用）
+    spooler.set_default_inspector(backend.inspector)
+    # キュー監視はプリンタごとに1本。変化が無い間は queue_wait_interval_sec まで間隔を伸ばす
+    # 変化通知が使えれば、ジョブが抜けた瞬間に次を投入できる
+    queue_monitor.configure(queue_poll_min_sec, queue_wait_interval_sec, notify=queue_notify)
+
+    # "pages" のときは queue_limit（ジョブ数）の代わりにキュー内の総ページ数・総容量で制限する
+    # 予算・自動調整はプリンタごと
+    budgets = {}
+    if queue_throttle == "pages" or queue_autotune:
+        for p in all_printers:
+            budgets[p] = QueueBudget(
+                max_pages=int(limits[p]["queue_max_pages"]) or 20,
+                max_bytes=int(float(limits[p]["queue_max_mb"]) * 1024 * 1024),
+            )
+
+    # 自動調整: 前回までに学習した値から始め、実測した印刷速度で予算と問い合わせ間隔を動かす
+    tuners = {}
+    tuning_path = m.base_dir() / "printer_tuning.json"
+    if queue_autotune:
+        for p in all_printers:
+            initial = {"window": budgets[p].max_pages, "poll_sec": queue_poll_min_sec}
+            initial.update(autotune.load_state(tuning_path, p))
+            tuners[p] = autotune.QueueTuner(budgets[p], max_poll=queue_wait_interval_sec, **initial)
+            tuners[p].attach(queue_monitor.get_monitor(p))
+
+    # 故障検知: 遮断したプリンタの空き待ちは打ち切って（PrinterUnavailable）予備に回す
+    health = None
+    if health_check:
+        health = Failover(
+            {p: HealthMonitor(p, backend.inspector, interval=health_interval_sec, failures=health_failures,
+                              reset_sec=health_reset_sec, stall_sec=health_stall_sec)
+             for p in all_printers},
+            backups=backups,
+        )
+        health.start()
+
+    # 中止ボタン: 進捗GUIと共有して、キューの空き待ちも中止で打ち切る
+    cancel_event = threading.Event()
+
+    # 準備段で数えたページ数（パス -> ページ数）。投入時に予算の予約に使い、同じPDFを2回数えない
+    prepared_pages = {}
+    prepared_lock = threading.Lock()
+
+    def _known_pages(path, budget):
+        # 全部を準備段で数えてあればその合計。1つでも数えていなければ None（その場で数える）
+        paths = path if isinstance(path, (list, tuple)) else [path]
+        with prepared_lock:
+            if not all(str(p) in prepared_pages for p in paths):
+                return None
+            counts = [prepared_pages.pop(str(p)) for p in paths]
+        return sum(c or budget.default_pages for c in counts)
+
+    def _wait_queue(path, printer):
+        # キュー上限付き投入（キューを持たない投入先では待たない）。path はリストでもよい（まとめて1ジョブ）
+        if not backend.capabilities().queue:
+            return
+
+        def abort():
+            return cancel_event.is_set() or (health is not None and not health.available(printer))
+        if printer in budgets:
+            m.wait_for_queue_budget(printer, budgets[printer], path,
+                                    pages=_known_pages(path, budgets[printer]), abort=abort)
+        else:
+            m.wait_if_queue_full(printer, int(limits[printer]["queue_limit"]), queue_wait_interval_sec,
+                                 abort=abort)
+
+    # --- バックエンドの投入をGUI用にラップ（戻り値はジョブID。分からなければ None） ---
+    # printer はプリンタプールのときに進捗GUIから渡される
+    def _print_pdf(path, printer=None):
+        printer = printer or printer_name
+        _wait_queue(path, printer)
+        return backend.submit(printer, path, "pdf")
+
+    def _print_pdf_batch(paths, printer=None):
+        # まとめた分の合計ページ数で予算を待ち、1回で投入する
+        printer = printer or printer_name
+        _wait_queue(paths, printer)
+        return backend.submit_batch(printer, paths)
+
+    merge_dir = None
+
+    def _print_pdf_merged(paths, printer=None):
+        # フォルダの PDF を1つに連結して1ジョブで投入する。連結できなければまとめて投入に任せる
+        # ジョブIDが返らない投入先でも文書名で追えるよう、先頭ファイルと同じ名前にする
+        # （プールでは複数のレーンが同時に連結するので、1回ごとに別のフォルダに作る）
+        merged = Path(tempfile.mkdtemp(dir=merge_dir)) / Path(paths[0]).name
+        try:
+            used = merge_pdfs(paths, merged, tool=merge_tool, timeout=timeouts.for_item("merge", paths))
+        except MergeError as e:
+            if not backend.capabilities().batch:
+                raise NotSubmitted(str(e)) from e   # まだ何も投入していないので1件ずつ投入し直せる
+            print(f"連結できないため、まとめて投入します: {e}")
+            return _print_pdf_batch(paths, printer)
+        try:
+            print(f"{len(paths)} 件を連結して投入します（{used}）: {Path(paths[0]).parent.name}")
+            job_id = _print_pdf(merged, printer)
+        finally:
+            shutil.rmtree(merged.parent, ignore_errors=True)
+        return [job_id] * len(paths)
+
+    use_batch = batch_max_files > 1 and backend.capabilities().batch
+    if batch_max_files > 1 and not use_batch and not merge_folders:
+        print(f"{backend.name} は複数PDFをまとめて投入できないため、1件ずつ投入します")
+    batch_func = _print_pdf_batch if use_batch else None
+    batch_limits = (batch_max_files, batch_max_pages, int(batch_max_mb * 1024 * 1024))
+    if merge_folders:
+        # フォルダ単位で1ジョブ（件数・ページ数は無制限、容量だけ merge_max_mb まで）
+        merge_dir = tempfile.mkdtemp(prefix="hokokusyo_merge_")
+        batch_func = _print_pdf_merged
+        batch_limits = (0, 0, int(merge_max_mb * 1024 * 1024))
+
+    convert_pool = None
+    if word_mode == "convert":
+        # Word は並列で先にPDF化しておき、順番が来たらPDFとして印刷する
+        convert_cache = None
+        if convert_cache_mb > 0:
+            convert_cache = ConvertCache(
+                m.base_dir() / "convert_cache",
+                max_bytes=convert_cache_mb * 1024 * 1024,
+                lo_version=libreoffice_version(soffice_path),
+            )
+        convert_pool = ConvertPool(soffice_path, workers=convert_workers, cache=convert_cache, timeouts=timeouts)
+        if prepare_lookahead <= 0:
+            convert_pool.prefetch(path for kind, path, _ in selected if kind == "word")
+
+    def _print_word(path, printer=None):
+        printer = printer or printer_name
+        if convert_pool is not None:
+            return _print_pdf(convert_pool.convert(path), printer)
+        _wait_queue(path, printer)
+        return backend.submit(printer, path, "word")
+
+    pool = None
+    if len(printers) > 1:
+        pool = PrinterPool(
+            [PoolPrinter(e["name"], weight=float(e.get("weight", 1.0)),
+                         rate=autotune.load_state(tuning_path, e["name"]).get("rate", 0.0),
+                         tuner=tuners.get(e["name"]))
+             for e in pool_cfg],
+            default_rate=pool_default_rate,
+        )
+        print(f"プリンタプール: {', '.join(printers)}")
+
+    # --- 準備段（変換・存在確認・ページ数）。投入より先に lookahead 件まで進む ---
+    def _prepare(kind, path):
+        if not Path(path).exists():
+            raise FileNotFoundError(f"ファイルが見つかりません: {path}")
+        if kind == "word" and convert_pool is not None:
+            kind, path = "pdf", convert_pool.convert(path)
+        if kind != "pdf":
+            return kind, path, None
+        pages = count_pages(path)
+        with prepared_lock:
+            prepared_pages[str(path)] = pages
+        return kind, path, pages
+
+    # --- GUI付きで印刷を走らせる（実行の記録をつけながら） ---
+    journal = run_journal.RunJournal.create(journal_path, selected, meta=meta)
+    history = m.open_print_history(hash_workers) if use_print_history else None
+    try:
+        ok = run_print_with_gui(
+            selected,
+            print_pdf_func=_print_pdf,
+            print_word_func=_print_word,
+            printer_name=printer_name,
+            prepare_func=_prepare if prepare_lookahead > 0 else None,
+            lookahead=prepare_lookahead,
+            track_jobs=track_jobs,
+            print_batch_func=batch_func,
+            batch_max_files=batch_limits[0],
+            batch_max_pages=batch_limits[1],
+            batch_max_bytes=batch_limits[2],
+            pool=pool,
+            health=health,
+            cancel_job_func=backend.cancel if backend.capabilities().cancel else None,
+            cancel_event=cancel_event,
+            journal=journal,
+            headless=args.headless,
+            history=history,
+            diagnostics=gui_diagnostics,
+        )
+    finally:
+        journal.close()
+        if history is not None:
+            history.close()
+        if word_worker is not None:
+            word_worker.stop()
+        for p, tuner in tuners.items():
+            tuner.detach(queue_monitor.get_monitor(p))
+            autotune.save_state(tuning_path, p, tuner)
+            st = tuner.state()
+            print(f"キュー自動調整（{p}）: 予算 {st['window']:.0f} ページ / 問い合わせ {st['poll_sec']:.2f} 秒 / "
+                  f"印刷速度 {st['rate']:.2f} ページ/秒")
+        if health is not None:
+            health.stop()
+        queue_monitor.stop_all()
+        backend.close()
+        if merge_dir is not None:
+            shutil.rmtree(merge_dir, ignore_errors=True)
+        if convert_pool is not None:
+            convert_pool.close()
+            if convert_pool.cache is not None:
+                st = convert_pool.cache.stats()
+                print(f"変換キャッシュ: ヒット {st['hits']} / ミス {st['misses']} / "
+                      f"日付フィールドのため対象外 {st['volatile']} / "
+                      f"{st['entries']} 件 {st['bytes'] / 1024 / 1024:.1f} MB")
+                convert_pool.cache.close()
 
     # --- 結果表示（GUIは「キュー空」まで待ってから完了になる） ---
     if ok:
@@ -89,6 +589,14 @@ def main():
         print("\n=== 終了 ===")
         print("中止または失敗がありました。")
 
+    # 「前回の印刷」を進める。投入できなかった項目があれば、次の差分モードで集め直せる時刻までにとどめる
+    if meta.get("period"):
+        start, end = meta["period"]
+        until = _covered_until(selected, [selected[i][1] for i in journal.pending()], end)
+        high_water = m.save_high_water(parent_folder, start, until)
+        if high_water is not None:
+            print(f"前回の印刷: {datetime.fromtimestamp(high_water).strftime('%Y/%m/%d %H:%M')} までの更新を印刷済み")
+
 if __name__ == "__main__":
     try:
         main()
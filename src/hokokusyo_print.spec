@@ -33,8 +33,28 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+# --headless（タスクスケジューラ等）用。console=False の exe では標準出力が無く進捗も結果も出ないので、
+# 同じフォルダにコンソール版も入れる（中身は同じ。hokokusyo_print_console.exe --headless ...）
+exe_console = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='hokokusyo_print_console',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=True,
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
 coll = COLLECT(
     exe,
+    exe_console,
     a.binaries,
     a.datas,
     strip=False,
@@ -0,0 +1,172 @@
+# job_tracker.py
+# 投入したファイルとスプーラのジョブIDの対応付け
+#
+# 以前は「キューが空の判定が3回続いたら完了」としていたので、
+# 最後に最低でも 2.1 秒の待ちが入り、どの文書がまだ印刷中なのかも分からなかった。
+# ここでは投入ごとにスプーラに現れたジョブ（文書名が一致する新しいジョブID）を捕まえ、
+# キューから消えるまで追いかけて、文書ごとの完了時刻を出す。
+# 追いかけるのはこの実行で投入したジョブだけなので、他の人のジョブで完了が遅れない。
+# 文書名で結び付けるのは、名前が完全に一致し、所有者が分かる方式ならこのユーザーのジョブだけ。
+# 投入したのにスプーラに現れなかったジョブは完了とはみなさず「不明」にする
+# （問い合わせの合間に印刷し終わったのか、どこにも届いていないのか区別できないため）。
+#
+# 使い方（印刷スレッド側）:
+#   tracker = JobTracker(monitor, on_event=q.put)
+#   tracker.expect(idx, fname, path)   # 投入直前
+#   print_func(path)
+#   tracker.submitted(idx)             # 投入成功（失敗なら tracker.discard(idx)）
+#
+# on_event に渡すイベント:
+#   ("job_bound", idx, name, job_id)
+#   ("job_done", idx, name, seconds)         # 投入から完了までの秒数
+#   ("job_error", idx, name, status)
+#   ("job_unknown", idx, name, seconds)      # 投入後 unseen_grace_sec 経ってもスプーラに現れない
+
+import time
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from queue_monitor import QueueMonitor, QueueSnapshot
+from spooler import current_user, document_matches, owner_matches
+
+# ジョブの状態文字列にこれが含まれていたらエラー扱い（win32 / PowerShell 共通）
+ERROR_WORDS = ("error", "エラー", "offline", "paperout", "blocked")
+
+
+class TrackedJob:
+    def __init__(self, idx: int, name: str, document: str, baseline: Set[int]):
+        self.idx = idx
+        self.name = name                      # 画面表示用の名前
+        self.document = document.lower()      # スプーラ上の文書名として期待する名前
+        self.baseline = baseline              # 投入前からあったジョブID
+        self.job_id: Optional[int] = None
+        self.submitted_at: Optional[float] = None
+        self.done_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.verified = False                 # 投入方法が返したID、または名前と所有者の一致で結び付けた
+        self.unknown = False                  # スプーラで見つからないまま猶予を過ぎた
+
+    def matches(self, document: str) -> bool:
+        return document_matches(self.document, document)
+
+
+class JobTracker:
+    def __init__(self, monitor: QueueMonitor, on_event: Callable[[tuple], None] = lambda ev: None,
+                 unseen_grace_sec: float = 3.0, owner: Optional[str] = None):
+        """
+        unseen_grace_sec: 投入後この時間スプーラに現れなければ「不明」にする（完了にはしない）。
+                          その後に現れたら改めて結び付けて追いかける。
+        owner: この実行のジョブの所有者。None ならこのプロセスのユーザー。
+               所有者が分かる方式では、他のユーザーのジョブには結び付けない。
+        """
+        self.monitor = monitor
+        self.on_event = on_event
+        self.unseen_grace_sec = unseen_grace_sec
+        self.owner = current_user() if owner is None else owner
+
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, TrackedJob] = {}
+        self._claimed: Set[int] = set()
+        monitor.subscribe(self._on_snapshot)
+
+    def close(self):
+        self.monitor.unsubscribe(self._on_snapshot)
+
+    # ===== 印刷スレッドから =====
+    def expect(self, idx: int, name: str, path: Path):
+        baseline = {j.job_id for j in self.monitor.snapshot().jobs}
+        with self._lock:
+            self._jobs[idx] = TrackedJob(idx, name, Path(path).name, baseline)
+
+    def submitted(self, idx: int, job_id: Optional[int] = None):
+        """投入成功。投入方法がジョブIDを返してくれる場合（lp 等）は job_id で直接結び付ける"""
+        with self._lock:
+            job = self._jobs.get(idx)
+            if job is not None:
+                job.submitted_at = time.monotonic()
+                if job_id is not None:
+                    job.job_id = job_id
+                    job.verified = True
+                    self._claimed.add(job_id)
+        if job is not None and job_id is not None:
+            self.on_event(("job_bound", job.idx, job.name, job_id))
+        self.monitor.poke()
+
+    def discard(self, idx: int):
+        with self._lock:
+            self._jobs.pop(idx, None)
+
+    # ===== 状態 =====
+    def job_ids(self) -> List[int]:
+        """この実行で投入し、まだキューに残っているジョブID"""
+        with self._lock:
+            return [j.job_id for j in self._jobs.values() if j.job_id is not None and j.done_at is None]
+
+    def pending_jobs(self) -> List[Tuple[int, Optional[int], bool]]:
+        """
+        投入済みでまだ印刷し終わっていない (idx, job_id, verified)。job_id はまだ見つかっていなければ None。
+        verified は投入方法が返したIDか、名前と所有者（このユーザー）の一致で結び付けたもの。
+        スプーラから消してよいのは verified のものだけ（所有者が分からない方式では名前だけで結び付けている）。
+        「不明」になったもの（見つからないまま猶予を過ぎた）は、待っても現れないかもしれないので入れない
+        """
+        with self._lock:
+            return [(j.idx, j.job_id, j.verified) for j in self._jobs.values()
+                    if j.submitted_at is not None and j.done_at is None
+                    and (j.job_id is not None or not j.unknown)]
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.submitted_at is not None and j.done_at is None)
+
+    def unknown(self) -> int:
+        """投入したがスプーラで見つからないままのジョブの数"""
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.unknown and j.job_id is None)
+
+    def all_done(self) -> bool:
+        return self.pending() == 0
+
+    # ===== 監視スレッドから =====
+    def _on_snapshot(self, snap: QueueSnapshot):
+        if not snap.ok:
+            return
+        now = time.monotonic()
+        current = {j.job_id: j for j in snap.jobs}
+        events = []
+
+        with self._lock:
+            for job in self._jobs.values():
+                if job.submitted_at is None or job.done_at is not None:
+                    continue
+
+                if job.job_id is None:
+                    # 投入前に無かった・まだ誰にも割り当てていない・文書名が一致する・
+                    # 所有者が分かるならこのユーザーのジョブを探す
+                    for info in snap.jobs:
+                        if info.job_id in job.baseline or info.job_id in self._claimed:
+                            continue
+                        if info.owner and not owner_matches(self.owner, info.owner):
+                            continue
+                        if job.matches(info.document):
+                            job.job_id = info.job_id
+                            job.verified = bool(info.owner)
+                            self._claimed.add(info.job_id)
+                            events.append(("job_bound", job.idx, job.name, info.job_id))
+                            break
+                    else:
+                        if not job.unknown and now - job.submitted_at >= self.unseen_grace_sec:
+                            job.unknown = True
+                            events.append(("job_unknown", job.idx, job.name, now - job.submitted_at))
+                        continue
+
+                info = current.get(job.job_id)
+                if info is None:
+                    job.done_at = now
+                    events.append(("job_done", job.idx, job.name, now - job.submitted_at))
+                elif job.error is None and any(w in info.status.lower() for w in ERROR_WORDS):
+                    job.error = info.status
+                    events.append(("job_error", job.idx, job.name, info.status))
+
+        for ev in events:
+            self.on_event(ev)
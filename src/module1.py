@@ -2,10 +2,19 @@
 import sys
 import json
 import time
-import subprocess
 from pathlib import Path
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import Iterator, List, Tuple, Optional, Union
+
+import scanner
+import spooler
+import child_process
+import queue_monitor
+from scan_index import ScanIndex
+from scanner import TimeRange
+from print_history import PrintHistory
+from queue_budget import QueueBudget
+from pdf_info import count_pages
 
 # ===== パス基準（exeの隣を見るための定番） =====
 def base_dir() -> Path:
@@ -22,116 +31,184 @@ def load_config() -> dict:
     return json.loads(cfg_path.read_text(encoding="utf-8"))
 
 
+def printer_limits(cfg: dict, printer_name: str) -> dict:
+    """
+    プリンタのキュー上限。全体の設定（queue_limit / queue_max_pages / queue_max_mb）を
+    config.json の "printer_limits": {プリンタ名: {...}} と "printer_pool" の項目で上書きしたもの。
+    """
+    limits = {
+        "queue_limit": int(cfg.get("queue_limit", 6)),
+        "queue_max_pages": int(cfg.get("queue_max_pages", 0)),
+        "queue_max_mb": float(cfg.get("queue_max_mb", 0)),
+    }
+    limits.update(cfg.get("printer_limits", {}).get(printer_name, {}))
+    # プリンタプールの各プリンタの項目に書いた上限が最優先
+    for entry in cfg.get("printer_pool", []):
+        if entry.get("name") == printer_name:
+            limits.update({k: entry[k] for k in limits if k in entry})
+    return limits
+
+
+# ===== 走査インデックス =====
+def open_scan_index(full_every_hours: float = 0.0) -> ScanIndex:
+    """config.json の隣の走査インデックス（SQLite）を開く。full_every_hours ごとに全走査する（0 はしない）"""
+    return ScanIndex(base_dir() / "scan_index.sqlite3", full_every_sec=full_every_hours * 3600)
+
+
+def open_print_history(workers: int = 4) -> PrintHistory:
+    """config.json の隣の印刷履歴（SQLite）を開く。workers はハッシュ計算の並列数"""
+    return PrintHistory(base_dir() / "print_history.sqlite3", workers=workers)
+
+
+# ===== 前回の印刷（差分モード） =====
+# 「ここより前の更新は全部印刷した」という時刻（high water mark）を exe の隣の last_run.json に持つ。
+# 差分モードでは TimeRange.since(この時刻) の範囲を集める。
+def _last_run_path() -> Path:
+    return base_dir() / "last_run.json"
+
+
+def load_high_water(parent_folder: Path) -> Optional[float]:
+    """parent_folder について、これより前の更新は印刷済みという時刻。記録が無ければ None"""
+    try:
+        data = json.loads(_last_run_path().read_text(encoding="utf-8"))
+        return float(data[str(Path(parent_folder).resolve())]["high_water"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_high_water(parent_folder: Path, start: float, end: float) -> Optional[float]:
+    """
+    [start, end) の更新を漏れなく印刷し終えた。前回の時刻とつながっていれば end まで進める。
+    （前回の時刻より後から始まる範囲だと間が抜けるので進めない）戻り値は新しい時刻
+    """
+    path = _last_run_path()
+    key = str(Path(parent_folder).resolve())
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        data = {}
+    prev = load_high_water(parent_folder)
+    if prev is not None and (start > prev or end <= prev):
+        return prev
+    data[key] = {"high_water": end, "updated": time.time()}
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(path)
+    return end
+
+
 # ===== ファイル収集 =====
-def collect_targets(parent_folder: Path, target_date: datetime) -> Tuple[List[Tuple[str, Path, str]], List[str]]:
+def collect_targets(parent_folder: Path, target_date: Union[datetime, TimeRange],
+                    index: Optional[ScanIndex] = None, workers: int = 1,
+                    full: bool = False) -> Tuple[List[Tuple[str, Path, str]], List[str]]:
     """
     バッチ仕様：
       - parent 配下の各サブフォルダを走査
-      - target_dateに更新されたPDFを印刷対象
+      - target_dateに更新されたPDFを印刷対象（日付、または TimeRange で「前回の印刷以降」など任意の範囲）
       - そのサブフォルダでPDFが1つでも対象になったら、同フォルダのwordファイルも全部対象
     戻り値: [("pdf", pdf_path, pdf_name), ("word", docm_path, pdf_name), ...]
       - サブフォルダに対象PDFがあるのにwordファイルがない場合、そのサブフォルダ名も返す
+
+    走査そのものは scanner（os.scandir 1パス）に任せる。
+    index を渡した場合は、変更のあったサブフォルダだけ再列挙してから DB で答える
+    （full=True なら全サブフォルダを再列挙する。その場で上書きされたファイルも拾える）。
+    workers > 1 ならサブフォルダの列挙をスレッドプールで並列に行う（順番は変わらない）。
+    """
+    if index is not None:
+        index.refresh(parent_folder, full=full, workers=workers)
+        return index.collect_targets(parent_folder, target_date)
+    return scanner.collect_targets(parent_folder, target_date, workers=workers)
+
+
+def iter_targets(parent_folder: Path, target_date: Union[datetime, TimeRange],
+                 index: Optional[ScanIndex] = None, workers: int = 1,
+                 full: bool = False) -> Iterator[Tuple[str, List[Tuple[str, Path, str]], bool]]:
+    """
+    collect_targets の逐次版。フォルダ1つ分ずつ (フォルダ名, 対象, wordなしか) を返す。
+    選択GUIを走査完了前に開いて、届いた分から並べるために使う。
     """
-    targets: List[Tuple[str, Path, str]] = []
-    no_word_folder: List[str] = []
-
-    for sub in sorted(parent_folder.iterdir()):
-        if not sub.is_dir():
-            continue
-
-        # PDFの中から更新日がtarget_dateのものだけ拾う
-        pdfs = sorted(sub.glob("*.pdf"))
-        recent_pdfs = []
-        for p in pdfs:
-            mtime = datetime.fromtimestamp(p.stat().st_mtime) #pdfファイルの更新時刻を取得、datetime型に変換
-            if mtime.date() == target_date.date():
-                recent_pdfs.append(p)
-
-        if recent_pdfs:
-            # PDFを対象に追加
-            for p in recent_pdfs:
-                targets.append(("pdf", p, p.name))
-            
-            # PDFがあったフォルダだけwordファイルを対象に追加
-            doc_exts = {".doc", ".docx", ".docm"}
-            docms = [
-                p for p in sorted(sub.glob("*.doc*")) 
-                if p.suffix.lower() in doc_exts and not p.name.startswith("~$")
-                ]
-            if docms:
-                for w in docms:
-                   targets.append(("word", w, w.name))
-            else:
-                no_word_folder.append(sub.name)
-            
-    return targets, no_word_folder
+    if index is None:
+        yield from scanner.iter_targets(parent_folder, target_date, workers=workers)
+        return
+
+    # 変わったフォルダを再列挙しながら返す（インデックスが空の初回でも全走査を待たない）
+    yield from index.iter_targets(parent_folder, target_date, full=full, workers=workers)
 
 
 # ===== 印刷：PDFtoPrinter =====
-def print_pdf_with_pdftoprinter(pdftoprinter_path: Path, printer_name: str, pdf_path: Path):
+def print_pdf_with_pdftoprinter(pdftoprinter_path: Path, printer_name: str, pdf_path: Path,
+                                timeout: Optional[float] = None):
     if not pdftoprinter_path.exists():
         raise FileNotFoundError(f"PDFtoPrinter.exe が見つかりません: {pdftoprinter_path}")
     # PDFtoPrinter.exe "file.pdf" "Printer Name"
-    subprocess.run(
+    # 中止ボタンで子孫ごと止められるように child_process 経由で起動する
+    # timeout を過ぎたら watchdog が止めて ProcessTimeout（その1件だけ失敗にする）
+    child_process.run(
         [str(pdftoprinter_path),str(pdf_path), printer_name],
         check=True,
-        creationflags=subprocess.CREATE_NO_WINDOW
+        timeout=timeout,
     )
 
 # ===== 印刷：LibreOffice headless =====
-def print_word_with_soffice(soffice_path: Path, printer_name: str, word_path: Path):
+def print_word_with_soffice(soffice_path: Path, printer_name: str, word_path: Path,
+                            timeout: Optional[float] = None):
     if not soffice_path.exists():
         raise FileNotFoundError(f"soffice.com が見つかりません: {soffice_path}")
     # soffice --headless --pt "Printer Name" "file.docm"
-    subprocess.run(
+    child_process.run(
         [str(soffice_path), "--headless", "--pt", printer_name, str(word_path)],
         check=True,
-        creationflags=subprocess.CREATE_NO_WINDOW
+        timeout=timeout,
     )
 
 
 # ===== キュー制御（骨組み） =====
 def get_print_queue_size(printer_name: str) -> int:
     """
-    PowerShellで印刷キュー内ジョブ数を取得（Windows標準）。
+    印刷キュー内ジョブ数を取得（問い合わせ方式は spooler の既定バックエンド）。
     失敗時は None ではなく大きめの値を返して安全側に倒す。
     """
-    
     try:
-        # Get-PrintJob は Windows 8/Server2012 以降で使える標準コマンド
-        # 返り値はジョブ数のみを数値で出す
-        safe_name = printer_name.replace("'", "''")
-        cmd = [
-            "powershell",
-            "-NoProfile",
-            "-Command",
-            f"(Get-PrintJob -PrinterName '{safe_name}' | Measure-Object).Count"
-        ]
-        out = subprocess.check_output(
-            cmd,
-            stderr=subprocess.STDOUT,
-            text=True,
-            creationflags=subprocess.CREATE_NO_WINDOW
-        ).strip()
-        if out == "":
-            return 0
-        return int(out)
-
+        return spooler.default_inspector().queue_size(printer_name)
     except Exception:
         # 判定不能なら「多い」扱いにして待ち側へ寄せる
         return 9999
 
 
-def wait_if_queue_full(printer_name: str, queue_limit: int, queue_wait_interval_sec: float):
+def wait_if_queue_full(printer_name: str, queue_limit: int, queue_wait_interval_sec: float, abort=None):
     """
     キュー上限付き高速投入の骨組み。
-    queue_limit 以上たまっていたら空くまで sleep_sec ごとに待つ。
+    queue_limit 以上たまっていたら空くまで待つ。
+    問い合わせはプリンタごとの共有監視（queue_monitor）に任せ、
+    呼び出し後に取れた新しい状態で判定する（直前に投入したジョブを見落とさないため）。
+    queue_wait_interval_sec は監視の最長問い合わせ間隔として queue_monitor.configure で渡す。
+    abort() が True になったら（printer_health がプリンタを遮断した等）待つのをやめて PrinterUnavailable。
+    問い合わせ失敗（9999 件扱い）が続いても、abort が無ければ従来どおり待ち続ける。
+    """
+    since = time.monotonic()
+    queue_monitor.get_monitor(printer_name).wait_until(
+        lambda s: (abort is not None and abort()) or (s.timestamp >= since and s.depth < queue_limit)
+    )
+    if abort is not None and abort():
+        raise spooler.PrinterUnavailable(f"プリンタが使えません: {printer_name}")
+
+
+def wait_for_queue_budget(printer_name: str, budget: QueueBudget, path, pages: Optional[int] = None,
+                          abort=None):
+    """
+    ページ数・バイト数で見たキュー上限付き投入。path の分が予算に収まるまで待って予約する。
+    pages を省略したら PDF はその場で数える（mmap で読むので大きなファイルでも速い）。
+    path にリストを渡すと、まとめて1ジョブで投入する分として合計で予約する。
+    abort は wait_if_queue_full と同じ（True になったら PrinterUnavailable）。
     """
-    size = get_print_queue_size(printer_name)
-    if size is None:
-        return  # 未実装なら待たない
-    while size >= queue_limit:
-        time.sleep(queue_wait_interval_sec)
-        size = get_print_queue_size(printer_name)
-        if size is None:
-            return  # 待機中に取得不能になったら諦めて抜ける
+    paths = [Path(p) for p in path] if isinstance(path, (list, tuple)) else [Path(path)]
+    if pages is None:
+        counts = [count_pages(p) if p.suffix.lower() == ".pdf" else None for p in paths]
+        pages = sum(c or budget.default_pages for c in counts) if any(counts) else None
+    size = 0
+    for p in paths:
+        try:
+            size += p.stat().st_size
+        except OSError:
+            pass
+    budget.acquire(queue_monitor.get_monitor(printer_name), paths[0].name, pages=pages, size=size, abort=abort)
@@ -0,0 +1,53 @@
+# pdf_info.py
+# PDF のページ数をライブラリ無しで素早く数える
+#
+# ページツリーの /Type /Pages 辞書にある /Count の最大値（= ルートの総ページ数）を読む。
+# ファイルは mmap で開いて正規表現を直接かけるので、大きなスキャンPDFでも全読み込みしない。
+# 圧縮オブジェクトストリーム（/Type /ObjStm）の中にページツリーがある PDF は
+# そのストリームだけ展開して探す。数えられなかったら None。
+
+import re
+import mmap
+import zlib
+from pathlib import Path
+from typing import Optional
+
+_PAGES_COUNT = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b", re.S)
+_OBJSTM = re.compile(rb"/Type\s*/ObjStm\b.*?stream\r?\n", re.S)
+
+
+def _max_count(data) -> Optional[int]:
+    best = None
+    for m in _PAGES_COUNT.finditer(data):
+        n = int(m.group(1) or m.group(2))
+        if best is None or n > best:
+            best = n
+    return best
+
+
+def count_pages(path: Path) -> Optional[int]:
+    try:
+        with open(path, "rb") as f:
+            if f.seek(0, 2) == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                n = _max_count(mm)
+                if n is not None:
+                    return n
+
+                # ページツリーが圧縮オブジェクトストリームに入っている場合
+                for m in _OBJSTM.finditer(mm):
+                    start = m.end()
+                    end = mm.find(b"endstream", start)
+                    if end < 0:
+                        break
+                    try:
+                        data = zlib.decompress(mm[start:end])
+                    except zlib.error:
+                        continue
+                    c = _max_count(data)
+                    if c is not None and (n is None or c > n):
+                        n = c
+                return n
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,421 @@
+# pdf_merge.py
+# フォルダ内の PDF を1つの PDF に連結する（メモリ使用量はファイルサイズに比例しない）
+#
+# 利用者ごとのフォルダの報告書を1ジョブで印刷し、スプーラのジョブ数を減らすとともに
+# 他の人のジョブが間に挟まらないようにするためのもの。
+#
+# 内蔵の連結（tool="stream"）:
+#   各 PDF の相互参照表（xref テーブル / xref ストリーム、/Prev の追記分も）を読み、
+#   オブジェクトを番号を振り直しながら出力へ順に書き写す。
+#   スキャン画像などのストリーム本体は CHUNK ずつ読んでそのまま書くだけなので、
+#   500MB の PDF でも常駐メモリはほぼ一定。圧縮オブジェクトストリーム（/ObjStm）は
+#   1つずつ展開して通常のオブジェクトとして書き出す。
+#   ページツリーは、新しいルートの /Kids に各 PDF のルート /Pages をぶら下げる。
+#   暗号化された PDF など扱えないものは MergeError。
+#
+# 内蔵の連結は正規表現でオブジェクトを切り出す簡易なもので、壊れかけの PDF や
+# 文字列中の "endobj" などで誤ることがある。そのため tool="stream" と明示したときだけ使う。
+# tool="auto" は qpdf → pdfunite → pypdf の順に、使えるもので連結する（どれも無ければ MergeError）。
+#
+# 使い方:
+#   used = merge_pdfs([a, b, c], out_path)   # 使った方法の名前を返す
+
+import re
+import zlib
+import shutil
+import subprocess
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import child_process
+
+try:
+    import pypdf  # type: ignore
+except ImportError:
+    pypdf = None
+
+CHUNK = 1024 * 1024
+WINDOW = 64 * 1024
+
+_REF = re.compile(rb"(?<![\d.])(\d+)\s+(\d+)\s+R\b")
+_OBJ_HEADER = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj\b")
+_STREAM = re.compile(rb"\bstream(?:\r\n|\n|\r)")
+_ENDOBJ = re.compile(rb"\bendobj\b")
+
+
+class MergeError(RuntimeError):
+    pass
+
+
+def _int_key(d: bytes, key: bytes) -> Optional[int]:
+    m = re.search(rb"/" + key + rb"\s+(\d+)\b(?!\s+\d+\s+R)", d)
+    return int(m.group(1)) if m else None
+
+
+def _ref_key(d: bytes, key: bytes) -> Optional[int]:
+    m = re.search(rb"/" + key + rb"\s+(\d+)\s+\d+\s+R", d)
+    return int(m.group(1)) if m else None
+
+
+class _Source:
+    """入力 PDF 1つ分。相互参照を読み、オブジェクトを取り出す"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.f: BinaryIO = open(self.path, "rb")
+        self.size = self.f.seek(0, 2)
+        # objnum -> (1, offset) / (2, objstm番号, index)
+        self.entries: Dict[int, Tuple[int, ...]] = {}
+        self.root: Optional[int] = None
+        try:
+            self._read_xref_chain(self._startxref())
+        except (ValueError, IndexError, zlib.error) as e:
+            self.close()
+            raise MergeError(f"相互参照を読めません: {self.path.name} ({e})") from e
+        if self.root is None:
+            self.close()
+            raise MergeError(f"/Root がありません: {self.path.name}")
+
+    def close(self):
+        self.f.close()
+
+    def _read(self, offset: int, size: int) -> bytes:
+        self.f.seek(offset)
+        return self.f.read(size)
+
+    def _startxref(self) -> int:
+        tail = self._read(max(self.size - 2048, 0), 2048)
+        i = tail.rfind(b"startxref")
+        if i < 0:
+            raise MergeError(f"startxref がありません: {self.path.name}")
+        return int(tail[i + 9:].split()[0])
+
+    # ===== 相互参照 =====
+    def _read_xref_chain(self, offset: int):
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            head = self._read(offset, 16).lstrip()
+            if head.startswith(b"xref"):
+                trailer = self._read_xref_table(offset)
+                # 追記型（hybrid）: 圧縮オブジェクトは /XRefStm 側に載っている
+                stm = _int_key(trailer, b"XRefStm")
+                if stm is not None:
+                    self._read_xref_stream(stm)
+            else:
+                trailer = self._read_xref_stream(offset)
+            if b"/Encrypt" in trailer:
+                raise MergeError(f"暗号化された PDF は連結できません: {self.path.name}")
+            if self.root is None:
+                self.root = _ref_key(trailer, b"Root")
+            offset = _int_key(trailer, b"Prev")
+
+    def _add(self, num: int, entry: Tuple[int, ...]):
+        # 新しい方（先に読んだ方）を優先する
+        self.entries.setdefault(num, entry)
+
+    def _read_xref_table(self, offset: int) -> bytes:
+        data = b""
+        size = WINDOW
+        while True:
+            data = self._read(offset, size)
+            i = data.find(b"trailer")
+            if i >= 0 and data.find(b">>", i) >= 0 or offset + size >= self.size:
+                break
+            size *= 4
+        i = data.find(b"trailer")
+        if i < 0:
+            raise MergeError(f"trailer がありません: {self.path.name}")
+        tokens = data[data.find(b"xref") + 4:i].split()
+        pos = 0
+        while pos + 1 < len(tokens):
+            start, count = int(tokens[pos]), int(tokens[pos + 1])
+            pos += 2
+            for k in range(count):
+                off, _gen, kind = tokens[pos:pos + 3]
+                pos += 3
+                if kind == b"n":
+                    self._add(start + k, (1, int(off)))
+        return data[i:data.find(b">>", i) + 2] if b"<<" in data[i:] else data[i:]
+
+    def _read_xref_stream(self, offset: int) -> bytes:
+        d, data = self._stream_object(offset)
+        w = [int(x) for x in re.search(rb"/W\s*\[([^\]]*)\]", d).group(1).split()]
+        size = _int_key(d, b"Size")
+        m = re.search(rb"/Index\s*\[([^\]]*)\]", d)
+        index = [int(x) for x in m.group(1).split()] if m else [0, size]
+        row = sum(w)
+        pos = 0
+        for start, count in zip(index[0::2], index[1::2]):
+            for k in range(count):
+                fields = []
+                for width in w:
+                    fields.append(int.from_bytes(data[pos:pos + width], "big") if width else None)
+                    pos += width
+                kind = fields[0] if w[0] else 1
+                if kind == 1:
+                    self._add(start + k, (1, fields[1]))
+                elif kind == 2:
+                    self._add(start + k, (2, fields[1], fields[2] or 0))
+        if pos > len(data) or row == 0:
+            raise MergeError(f"xref ストリームが壊れています: {self.path.name}")
+        return d
+
+    # ===== オブジェクト =====
+    def object_at(self, offset: int) -> Tuple[int, bytes, Optional[Tuple[int, int]]]:
+        """
+        offset のオブジェクトを読む。
+        戻り値: (番号, 本体 or ストリームの辞書部分, ストリームなら (データ開始位置, 長さ))
+        """
+        size = WINDOW
+        while True:
+            data = self._read(offset, size)
+            h = _OBJ_HEADER.match(data)
+            if h is None:
+                raise MergeError(f"オブジェクトがありません: {self.path.name} @{offset}")
+            s = _STREAM.search(data, h.end())
+            e = _ENDOBJ.search(data, h.end())
+            if s is not None and (e is None or s.start() < e.start()):
+                body = data[h.end():s.start()]
+                length = self._length(body)
+                return int(h.group(1)), body, (offset + s.end(), length)
+            if e is not None:
+                return int(h.group(1)), data[h.end():e.start()], None
+            if offset + size >= self.size:
+                raise MergeError(f"endobj がありません: {self.path.name} @{offset}")
+            size *= 4
+
+    def _length(self, d: bytes) -> int:
+        n = _int_key(d, b"Length")
+        if n is not None:
+            return n
+        ref = _ref_key(d, b"Length")
+        if ref is None:
+            raise MergeError(f"/Length がありません: {self.path.name}")
+        return int(self.resolve(ref).split()[0])
+
+    def resolve(self, num: int) -> bytes:
+        """ストリームでないオブジェクトの本体を返す（/Length の間接参照、/Root など）"""
+        entry = self.entries.get(num)
+        if entry is None:
+            raise MergeError(f"オブジェクト {num} がありません: {self.path.name}")
+        if entry[0] == 1:
+            return self.object_at(entry[1])[1]
+        for n, body in self.objstm_objects(entry[1]):
+            if n == num:
+                return body
+        raise MergeError(f"オブジェクト {num} がありません: {self.path.name}")
+
+    def _stream_object(self, offset: int) -> Tuple[bytes, bytes]:
+        """小さなストリーム（xref / ObjStm）を展開して (辞書, データ) を返す"""
+        _, d, stream = self.object_at(offset)
+        if stream is None:
+            raise MergeError(f"ストリームではありません: {self.path.name} @{offset}")
+        raw = self._read(*stream)
+        if b"/FlateDecode" in d:
+            raw = zlib.decompress(raw)
+        elif b"/Filter" in d:
+            raise MergeError(f"未対応のフィルタです: {self.path.name}")
+        m = re.search(rb"/Predictor\s+(\d+)", d)
+        if m and int(m.group(1)) >= 10:
+            raw = _png_unpredict(raw, _int_key(d, b"Columns") or 1)
+        return d, raw
+
+    def objstm_objects(self, stm_num: int) -> Iterator[Tuple[int, bytes]]:
+        entry = self.entries.get(stm_num)
+        if entry is None or entry[0] != 1:
+            raise MergeError(f"オブジェクトストリーム {stm_num} がありません: {self.path.name}")
+        d, data = self._stream_object(entry[1])
+        n, first = _int_key(d, b"N"), _int_key(d, b"First")
+        head = [int(x) for x in data[:first].split()]
+        nums, offs = head[0::2][:n], head[1::2][:n]
+        for k, num in enumerate(nums):
+            end = first + offs[k + 1] if k + 1 < len(offs) else len(data)
+            yield num, data[first + offs[k]:end]
+
+
+def _png_unpredict(data: bytes, columns: int) -> bytes:
+    """PNG 予測（/Predictor 10〜15）を戻す。xref ストリームはたいてい Up(2)"""
+    out = bytearray()
+    prev = bytearray(columns)
+    row_len = columns + 1
+    for pos in range(0, len(data) - columns, row_len):
+        ftype = data[pos]
+        row = bytearray(data[pos + 1:pos + row_len])
+        for i in range(len(row)):
+            left = row[i - 1] if i else 0
+            up = prev[i]
+            upleft = prev[i - 1] if i else 0
+            if ftype == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif ftype == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif ftype == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif ftype == 4:
+                p = left + up - upleft
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - upleft)
+                pred = left if pa <= pb and pa <= pc else (up if pb <= pc else upleft)
+                row[i] = (row[i] + pred) & 0xFF
+        out += row
+        prev = row
+    return bytes(out)
+
+
+class _Writer:
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.offsets: Dict[int, int] = {}
+        self.next_num = 1
+        out.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def reserve(self) -> int:
+        num = self.next_num
+        self.next_num += 1
+        return num
+
+    def begin(self, num: int):
+        self.offsets[num] = self.out.tell()
+        self.out.write(b"%d 0 obj\n" % num)
+
+    def finish(self, root: int):
+        xref = self.out.tell()
+        size = self.next_num
+        self.out.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for num in range(1, size):
+            off = self.offsets.get(num)
+            self.out.write(b"%010d 00000 n \n" % off if off is not None else b"0000000000 65535 f \n")
+        self.out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, root, xref))
+
+
+def _copy_source(src: _Source, w: _Writer, pages_root: int) -> Tuple[int, int]:
+    """src の全オブジェクトを書き写し、(ルート /Pages の新番号, ページ数) を返す"""
+    mapping = {num: w.reserve() for num in sorted(src.entries)}
+
+    def renumber(body: bytes) -> bytes:
+        return _REF.sub(lambda m: b"%d 0 R" % mapping[int(m.group(1))] if int(m.group(1)) in mapping
+                        else b"null", body)
+
+    catalog = src.resolve(src.root)
+    old_pages = _ref_key(catalog, b"Pages")
+    if old_pages is None:
+        raise MergeError(f"ページツリーがありません: {src.path.name}")
+    pages_body = src.resolve(old_pages)
+    count = _int_key(pages_body, b"Count") or 0
+
+    def write_plain(num: int, body: bytes):
+        body = renumber(body)
+        if num == old_pages:
+            # 各 PDF のルート /Pages を、新しいルートの子にする
+            body = re.sub(rb"/Parent\s+\d+\s+\d+\s+R", b"", body)
+            body = body.replace(b"<<", b"<< /Parent %d 0 R" % pages_root, 1)
+        w.begin(mapping[num])
+        w.out.write(body.strip() + b"\nendobj\n")
+
+    objstms = set()
+    for num, entry in sorted(src.entries.items(), key=lambda kv: kv[1]):
+        if entry[0] == 2:
+            objstms.add(entry[1])
+            continue
+        _, body, stream = src.object_at(entry[1])
+        if stream is None:
+            write_plain(num, body)
+            continue
+        if re.search(rb"/Type\s*/(XRef|ObjStm)\b", body):
+            continue   # 相互参照・圧縮オブジェクトは展開して書くので不要
+        w.begin(mapping[num])
+        w.out.write(renumber(body).strip() + b"\nstream\n")
+        remaining = stream[1]
+        src.f.seek(stream[0])
+        while remaining > 0:
+            chunk = src.f.read(min(CHUNK, remaining))
+            if not chunk:
+                raise MergeError(f"ストリームが途中で切れています: {src.path.name}")
+            w.out.write(chunk)
+            remaining -= len(chunk)
+        w.out.write(b"\nendstream\nendobj\n")
+
+    for stm in sorted(objstms):
+        for num, body in src.objstm_objects(stm):
+            if src.entries.get(num, (0,))[0] == 2:
+                write_plain(num, body)
+    return mapping[old_pages], count
+
+
+def merge_stream(paths: List[Path], out_path: Path):
+    """内蔵の連結（メモリはファイルサイズに比例しない）"""
+    out_path = Path(out_path)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    try:
+        with open(tmp, "wb") as out:
+            w = _Writer(out)
+            catalog, pages_root = w.reserve(), w.reserve()
+            kids, total = [], 0
+            for p in paths:
+                src = _Source(p)
+                try:
+                    kid, count = _copy_source(src, w, pages_root)
+                finally:
+                    src.close()
+                kids.append(kid)
+                total += count
+            w.begin(pages_root)
+            out.write(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) +
+                      b"] /Count %d >>\nendobj\n" % total)
+            w.begin(catalog)
+            out.write(b"<< /Type /Catalog /Pages %d 0 R >>\nendobj\n" % pages_root)
+            w.finish(catalog)
+        tmp.replace(out_path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _merge_external(cmd: List[str], timeout: Optional[float] = None):
+    try:
+        # 中止ボタンで止められるように child_process 経由（ProcessCancelled はそのまま上げる）
+        child_process.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+    except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        raise MergeError(str(e)) from e
+
+
+def merge_pdfs(paths: List[Path], out_path: Path, tool: str = "auto", timeout: Optional[float] = None) -> str:
+    """
+    paths を順に連結して out_path に書く。使った方法の名前を返す。
+    tool: "auto"（qpdf → pdfunite → pypdf）/ "stream"（内蔵。明示したときだけ）/ "qpdf" / "pdfunite" / "pypdf"
+    timeout: qpdf / pdfunite の時間制限（秒）。過ぎたら失敗として次の方法へ
+    """
+    paths = [Path(p) for p in paths]
+    out_path = Path(out_path)
+    candidates = ["qpdf", "pdfunite", "pypdf"] if tool == "auto" else [tool]
+    errors = []
+    for name in candidates:
+        try:
+            if name == "stream":
+                merge_stream(paths, out_path)
+            elif name == "qpdf":
+                if not shutil.which("qpdf"):
+                    raise MergeError("見つかりません")
+                _merge_external(["qpdf", "--empty", "--pages"] + [str(p) for p in paths] + ["--", str(out_path)],
+                                timeout)
+            elif name == "pdfunite":
+                if not shutil.which("pdfunite"):
+                    raise MergeError("見つかりません")
+                _merge_external(["pdfunite"] + [str(p) for p in paths] + [str(out_path)], timeout)
+            elif name == "pypdf":
+                if pypdf is None:
+                    raise MergeError("見つかりません")
+                try:
+                    writer = pypdf.PdfWriter()
+                    for p in paths:
+                        writer.append(str(p))
+                    with open(out_path, "wb") as f:
+                        writer.write(f)
+                except Exception as e:
+                    raise MergeError(str(e)) from e
+            else:
+                raise ValueError(f"不明な連結方法です: {name}")
+            return name
+        except MergeError as e:
+            errors.append(f"{name}: {e}")
+    raise MergeError("連結できませんでした: " + " / ".join(errors))
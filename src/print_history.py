@@ -0,0 +1,197 @@
+# print_history.py
+# 印刷履歴（内容ハッシュ → いつ・どのプリンタで印刷したか）
+#
+# collect_targets は「更新日時が指定日」で選ぶので、開いて閉じただけの PDF や、
+# 朝に一度印刷したものを昼にもう一度走らせた分も、同じ内容なのにまた印刷していた。
+# ここでは印刷したファイルの内容ハッシュ（sha256）を config.json の隣の DB に記録し、
+# 走査のときに同じ内容が印刷済みかどうかを答える。ファイル名や更新日時が変わっても内容が同じなら同じもの。
+# 同じ様式の PDF が別の利用者のフォルダにもあることがあるので、印刷済みとみなすのは同じフォルダで印刷した分だけ。
+#
+# ハッシュはスレッドプールで並列に計算する（mmap で読み、hashlib は計算中 GIL を離すので並列に効く）。
+# パス・サイズ・更新時刻が前回と同じファイルは読み直さず、記録しておいたハッシュを使う。
+#
+# 印刷済みの扱い（config.json の already_printed）:
+#   "skip" : 選択GUIに出さない
+#   "flag" : 選択GUIに「印刷済み」と注記して、チェックを外した状態で出す
+#   "off"  : 調べない（記録だけする）
+# PDF も Word もファイルごとに内容ハッシュで判定する（Word も中身が同じなら印刷済み）。
+#
+# 記録するときのハッシュは、走査のときに計算したもの（パス・サイズ・更新時刻が同じなら記録済みのもの）を使う。
+# 印刷完了の通知はキュー監視のスレッドから来るので、そこでは読まない（print_progress_gui が別スレッドで書く）。
+#
+# 使い方:
+#   history = PrintHistory(base_dir() / "print_history.sqlite3", workers=8)
+#   targets, notes = history.filter_targets(targets, "flag")   # notes: {path: "印刷済み …"}
+#   digest = history.hash_files([path])[path]         # 投入時
+#   history.record(path, printer_name, digest=digest)   # 印刷完了時
+#   history.close()
+
+import os
+import mmap
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+SKIP = "skip"
+FLAG = "flag"
+OFF = "off"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash     TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS printed (
+    hash       TEXT NOT NULL,
+    printed_at REAL NOT NULL,
+    printer    TEXT NOT NULL,
+    folder     TEXT NOT NULL,
+    path       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_printed_hash ON printed (hash, folder, printed_at);
+"""
+
+
+class Printed(NamedTuple):
+    printed_at: float
+    printer: str
+    path: str
+
+    def note(self) -> str:
+        when = datetime.fromtimestamp(self.printed_at).strftime("%m/%d %H:%M")
+        return f"印刷済み {when} {self.printer}"
+
+
+def content_hash(path: Path) -> Optional[str]:
+    """ファイル内容の sha256。読めなければ None"""
+    try:
+        with open(path, "rb") as f:
+            if f.seek(0, 2) == 0:
+                return hashlib.sha256(b"").hexdigest()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.sha256(mm).hexdigest()
+    except (OSError, ValueError):
+        return None
+
+
+def _key(path: Path) -> str:
+    return os.path.normcase(str(path))
+
+
+class PrintHistory:
+    def __init__(self, db_path: Path, workers: int = 4):
+        self.db_path = Path(db_path)
+        self.workers = max(int(workers), 1)
+        self.hashed = 0    # 実際に読んでハッシュを計算した数
+        self.reused = 0    # 記録しておいたハッシュを使った数
+        self._lock = threading.Lock()
+        self._ex: Optional[ThreadPoolExecutor] = None
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        if self._ex is not None:
+            self._ex.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self.conn.close()
+
+    # ===== ハッシュ =====
+    def hash_files(self, paths: Iterable[Path]) -> Dict[Path, Optional[str]]:
+        """paths の内容ハッシュ。変わっていないファイルは記録済みのものを使い、残りは並列に計算する"""
+        paths = list(dict.fromkeys(Path(p) for p in paths))
+        out: Dict[Path, Optional[str]] = {}
+        todo: List[Tuple[Path, int, int]] = []
+        with self._lock:
+            for p in paths:
+                try:
+                    st = p.stat()
+                except OSError:
+                    out[p] = None
+                    continue
+                row = self.conn.execute("SELECT size, mtime_ns, hash FROM hashes WHERE path=?", (_key(p),)).fetchone()
+                if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+                    out[p] = row[2]
+                    self.reused += 1
+                else:
+                    todo.append((p, st.st_size, st.st_mtime_ns))
+
+        if len(todo) > 1 and self.workers > 1:
+            if self._ex is None:
+                self._ex = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hash")
+            digests = list(self._ex.map(lambda t: content_hash(t[0]), todo))
+        else:
+            digests = [content_hash(p) for p, _, _ in todo]
+
+        rows = []
+        for (p, size, mtime_ns), digest in zip(todo, digests):
+            out[p] = digest
+            if digest is not None:
+                rows.append((_key(p), size, mtime_ns, digest))
+        self.hashed += len(todo)
+        if rows:
+            with self._lock, self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO hashes (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)", rows
+                )
+        return out
+
+    # ===== 記録・問い合わせ =====
+    def record(self, path: Path, printer: str, printed_at: Optional[float] = None, digest: Optional[str] = None):
+        """
+        path を printer で印刷した（内容が読めなければ記録しない）。
+        digest は投入したときの内容ハッシュ。省略したらここで求める
+        """
+        if digest is None:
+            digest = self.hash_files([path]).get(Path(path))
+        if digest is None:
+            return
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO printed (hash, printed_at, printer, folder, path) VALUES (?, ?, ?, ?, ?)",
+                (digest, time.time() if printed_at is None else printed_at, printer or "",
+                 _key(Path(path).parent), str(path)),
+            )
+
+    def last_printed(self, digest: str, folder: Path) -> Optional[Printed]:
+        """folder で内容 digest を最後に印刷した記録（無ければ None）"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT printed_at, printer, path FROM printed WHERE hash=? AND folder=?"
+                " ORDER BY printed_at DESC LIMIT 1",
+                (digest, _key(folder)),
+            ).fetchone()
+        return Printed(*row) if row is not None else None
+
+    def printed(self, paths: Iterable[Path]) -> Dict[Path, Printed]:
+        """paths のうち、同じフォルダで同じ内容を印刷したことがあるもの"""
+        out: Dict[Path, Printed] = {}
+        for p, digest in self.hash_files(paths).items():
+            rec = self.last_printed(digest, p.parent) if digest else None
+            if rec is not None:
+                out[p] = rec
+        return out
+
+    def filter_targets(self, targets: List[Tuple[str, Path, str]],
+                       mode: str = FLAG) -> Tuple[List[Tuple[str, Path, str]], Dict[Path, str]]:
+        """
+        collect_targets の対象から印刷済みの内容を探す。戻り値: (targets, notes)
+          skip: 印刷済みを除いた targets と、除いたものの notes
+          flag: targets はそのまま。notes に入っているものが印刷済み
+        PDF も Word もファイルごとに、同じフォルダで同じ内容を印刷したことがあるかで判定する。
+        """
+        if mode not in (SKIP, FLAG) or not targets:
+            return targets, {}
+        found = self.printed(p for _, p, _ in targets)
+        notes: Dict[Path, str] = {Path(p): found[Path(p)].note() for _, p, _ in targets if Path(p) in found}
+        if mode == SKIP:
+            targets = [t for t in targets if Path(t[1]) not in notes]
+        return targets, notes
@@ -6,48 +6,108 @@
 # - 完了条件:
 #     1) 印刷対象リストが空（= 印刷投入が終わり "sent_all" を受信）
 #     2) OS印刷キューが空（空判定が連続N回続いたら確定）
+#   track_jobs=True の場合は 2) の代わりに、この実行で投入したジョブ（job_tracker で
+#   ジョブIDを捕まえたもの）が全てキューから消えたら完了。他の人のジョブは待たない。
+# - 印刷キューの問い合わせはプリンタごとの共有監視（queue_monitor）が別スレッドで行い、
+#   結果を ("spool", empty) で event_queue に入れる。投入側のキュー上限待ちも同じ監視を読む。
+#   GUI（Tkメインスレッド）は描画だけで、問い合わせ待ちで固まらない。
 #   => メッセージボックス「印刷完了しました」 + 「終了」ボタン有効化
 # - 中止ボタン押下時:
-#   cancel_event を立て、次の投入前で停止。
+#   cancel_event を立て、次の投入前で停止。さらに別スレッドで
+#     実行中の子プロセス（PDFtoPrinter / soffice / lp）を子孫ごと終了（child_process.kill_all）
+#     準備段の先読みを捨て、実行中の準備が抜けるのを待つ
+#     この実行で投入したジョブをスプーラから消す（track_jobs でジョブIDが分かったもの / cancel_job_func）
+#   を行い、全部止まるまでの時間（中止から停止まで）を画面に出す。
 #   完了時の表示は「印刷を中止しました」にする。
 #
+# - 2段パイプライン（prepare_func を渡した場合）:
+#     準備段: 変換・存在確認・ページ数取得などを、先読み上限 lookahead 件まで先行して並列実行
+#     投入段: 準備済みのものを元の並び順どおりにプリンタへ投入
+#   CPU を使う変換と、スプーラ待ちの投入を重ねて待ち時間を減らす。
+#
+# - まとめて投入（print_batch_func を渡した場合）:
+#     同じフォルダの PDF が続く間、件数・ページ数・容量の上限内で1回の投入にまとめる。
+#     プロセス起動とスプーラのジョブ1件ごとの手間を減らす。
+#     batch_max_files / batch_max_pages / batch_max_bytes は 0 なら無制限（フォルダ丸ごと1回。
+#     hokokusyo_print の merge_folders ではこれで1つの PDF に連結してから投入する）。
+#
+# - プリンタプール（pool を渡した場合）:
+#     利用者フォルダ単位で printer_pool の振り分けに従い、プリンタごとの投入スレッド（レーン）で並列に送る。
+#     フォルダの中は1台で元の順番どおり。進捗画面にはプリンタごとの行（レーン）を出す。
+#     印刷関数は print_pdf_func(path, printer=プリンタ名) のようにプリンタ名つきで呼ぶ。
+#
+# - 故障時の切り替え（health を渡した場合）:
+#     printer_health.Failover が遮断したプリンタには送らず、予備プリンタに送る（印刷関数はプリンタ名つき）。
+#     遮断されたプリンタに残っているこの実行のジョブは、cancel_job_func で消して予備に投入し直す
+#     （track_jobs でジョブIDが分かっているものだけ）。
+#     使えるプリンタが無くて止まっている間は「停止中」と出し、止まっていた時間を最後に出す。
+#
+# - 実行の記録（journal を渡した場合）:
+#     項目ごとの 準備済み / 投入済み / 印刷完了 / 失敗 を run_journal に fsync しながら書く。
+#     落ちても次の起動で未投入の分から再開できる。全部投入できたか中止したら終了の印を書く
+#     （失敗が残ったら書かないので、次の起動で失敗した分の再開を提案する）。
+#
+# - 印刷履歴（history を渡した場合）:
+#     印刷した文書の内容ハッシュ・日時・プリンタを print_history に記録する（次の走査で印刷済みを見分ける）。
+#
+# - 画面なし（headless=True）:
+#     進捗ウィンドウの代わりに ConsoleProgress が同じイベントを受けて標準出力に出す。Ctrl+C で中止。
+#
+# - 応答性の計測（diagnostics=True）:
+#     GUI のメインスレッドが止まっていた最長時間と、中止ボタンを押してから表示が変わるまでの時間を最後に出す。
+#     押した時刻はボタンのイベントの時刻（Windows ではイベントに付いた時刻でキューに溜まっていた分も数える）。
+#
 # 使い方:
 #   from print_progress_gui import run_print_with_gui
 #   ok = run_print_with_gui(selected, _print_pdf, _print_word, printer_name)
+#   ok = run_print_with_gui(selected, _print_pdf, _print_word, printer_name,
+#                           prepare_func=_prepare, lookahead=4)
 
+import os
 import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
 import queue
 import time
-import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import child_process
+import queue_monitor
+import run_journal
+from job_tracker import JobTracker
+from pdf_info import count_pages
+from spooler import NotSubmitted, PrinterUnavailable
+
+
+def _file_size(path) -> int:
+    try:
+        return Path(path).stat().st_size
+    except OSError:
+        return 0
+
+def _event_perf_time(event) -> float:
+    """
+    Tk のイベントが起きた時刻を time.perf_counter() の値で返す。
+    Windows の event.time は GetTickCount（起動からのミリ秒）なので、処理されるまで待たされた分を差し引く。
+    それ以外では比べられる時計が無いので、処理した時刻を返す。
+    """
+    now = time.perf_counter()
+    if os.name == "nt" and getattr(event, "time", 0):
+        import ctypes
+        lag_ms = (ctypes.windll.kernel32.GetTickCount() - event.time) & 0xFFFFFFFF
+        if lag_ms < 60_000:
+            return now - lag_ms / 1000
+    return now
+
 
 def is_printer_queue_empty(printer_name: str) -> bool:
     """
-    PowerShellで印刷キューが空か判定（Windows標準）
+    印刷キューが空か判定（プリンタごとの共有監視の最新状態を読む）
     """
     if not printer_name:
         return False
-    
-    try:
-        safe_name = printer_name.replace("'", "''")  # PS シングルクォートエスケープ
-        cmd = [
-            "powershell",
-            "-NoProfile",
-            "-Command",
-            f"(Get-PrintJob -PrinterName '{safe_name}' | Measure-Object).Count"
-        ]
-        out = subprocess.check_output(
-            cmd,
-            stderr=subprocess.STDOUT,
-            text=True,
-            creationflags=subprocess.CREATE_NO_WINDOW
-        ).strip()
-        if out == "":
-            return True
-        return int(out) == 0
-    except Exception:
-        return False
+    return queue_monitor.get_monitor(printer_name).snapshot().empty
 
 
 class PrintProgressWindow(tk.Tk):
@@ -56,22 +116,38 @@ class PrintProgressWindow(tk.Tk):
 
     印刷側から event_queue にイベントを put する。
       ("init", total)
+      ("prepared_item", idx, name, pages)   # 準備段が終わった（pages は不明なら None）
       ("start_item", idx, name)
-      ("done_item", idx, name)
+      ("done_item", idx, name, printer)     # printer: 実際に投入したプリンタ
       ("error_item", idx, name, msg)
       ("log", text)        # 任意
       ("sent_all", )       # 印刷対象リストを全てスプーラに送信し終わった合図
+      ("spool", empty)     # queue_monitor からのキュー状態
+      ("job_bound", idx, name, job_id)   # job_tracker: スプーラのジョブIDが分かった
+      ("job_done", idx, name, seconds)   # job_tracker: そのジョブが印刷し終わった
+      ("job_error", idx, name, status)   # job_tracker: そのジョブがエラー状態
+      ("job_unknown", idx, name, seconds)   # job_tracker: 投入したのにスプーラで見つからない（完了はキュー空で判定）
+      ("lane_folder", printer, folder, count, eta_sec)   # プール: フォルダをそのプリンタに振り分けた
+      ("lane_item", printer, name)       # プール: そのプリンタに投入中
+      ("lane_spool", printer, depth)     # プール: そのプリンタのキューのジョブ数
+      ("printer_state", printer, state, detail)   # printer_health: ok / degraded / failed
+      ("stalled", printer, reason)       # printer_health: 使えるプリンタが無く投入が止まった
+      ("resumed", printer, target, lost_sec)      # printer_health: 投入を再開した
+      ("rerouted", idx, name, from_printer, to_printer)   # 予備プリンタに投入した
+      ("reroute_failed", idx, name, msg) # 予備への投入し直しに失敗（完了扱いを失敗に直す）
+      ("cancelling", purged, jobs_left, busy)     # 中止処理中（消したジョブ数 / 残りジョブ数 / 投入・準備・子プロセスが動いているか）
+      ("cancelled", seconds, purged, killed)      # 中止処理が終わった（中止から停止までの秒数）
     """
 
     POLL_MS = 150
-    CHECK_SPOOL_MS = 700
     EMPTY_STREAK_REQUIRED = 3   # 空判定が連続N回続いたら完了確定
 
     def __init__(self, event_queue: queue.Queue, cancel_event: threading.Event,
-                 printer_name: str):
+                 printer_name: str, track_jobs: bool = False, lanes=None):
         super().__init__()
         self.title("印刷進捗")
-        self.geometry("560x260")
+        self.lanes = list(lanes or [])
+        self.geometry(f"560x{282 + 22 * len(self.lanes)}")
         self.resizable(False, False)
 
         self.q = event_queue
@@ -81,13 +157,33 @@ class PrintProgressWindow(tk.Tk):
         self.total = 0
         self.done = 0
         self.error = 0
+        self.prepared = 0
         self.sent_all = False
         self.empty_streak = 0
+        self.finished = False
+        self.track_jobs = track_jobs
+        self.sent_items = set()     # 投入できた idx（予備への投入に失敗したものは除く）
+        self.printed_items = set()  # 印刷完了を見た idx
+        self.job_times = {}   # idx -> 投入から印刷完了までの秒数
+        self.jobs_unknown = set()   # スプーラで見つからないままの idx（完了はキュー空の判定に戻す）
+        self.lane_state = {name: {"folder": "", "count": 0, "items": 0, "depth": None, "folders": 0}
+                           for name in self.lanes}
+        self.printer_states = {}   # プリンタ名 -> (state, detail)
+        self.stalled_since = None
+        self.lost_sec = 0.0
+        self.rerouted = 0
+
+        # 応答性の計測: _poll_queue の遅れ = メインスレッドが止まっていた時間
+        self.max_stall_ms = 0.0
+        self.cancel_feedback_ms = None
+        self.cancel_at = None          # 中止ボタンを押した時刻（perf_counter）
+        self.cancel_idle_sec = None    # 中止から全部止まるまでの秒数
+        self._last_tick = time.perf_counter()
+        self._press_at = None          # 中止ボタンのマウスを押した時刻（perf_counter）
 
         self._build_ui()
 
         self.after(self.POLL_MS, self._poll_queue)
-        self.after(self.CHECK_SPOOL_MS, self._check_completion_condition)
 
         # 完了/中止確定までは×で閉じさせない
         self.protocol("WM_DELETE_WINDOW", self._block_close)
@@ -120,25 +216,51 @@ class PrintProgressWindow(tk.Tk):
         )
         self.lbl_spool.pack(anchor="w", pady=(4, 0))
 
+        # プリンタの故障・切り替え（printer_health）
+        self.lbl_health = ttk.Label(main, text="")
+        self.lbl_health.pack(anchor="w", pady=(2, 0))
+
+        # プリンタプール: プリンタごとの行
+        self.lbl_lanes = {}
+        for name in self.lanes:
+            lbl = ttk.Label(main, text=f"{name}: (待機中)")
+            lbl.pack(anchor="w", pady=(2, 0))
+            self.lbl_lanes[name] = lbl
+
         # ボタン行
         btn_row = ttk.Frame(main)
         btn_row.pack(fill="x", pady=(14, 0))
 
         self.btn_cancel = ttk.Button(btn_row, text="中止", command=self._on_cancel)
+        self.btn_cancel.bind("<ButtonPress-1>", self._on_cancel_press, add="+")
         self.btn_cancel.pack(side="left")
 
         self.btn_exit = ttk.Button(btn_row, text="終了", command=self._on_exit)
         self.btn_exit.state(["disabled"])
         self.btn_exit.pack(side="right")
 
-    def _update_counts(self):
-        self.lbl_counts.configure(
-            text=f"{self.done + self.error} / {self.total} (失敗:{self.error})"
+    def _update_lane(self, name: str):
+        st = self.lane_state[name]
+        depth = "確認中" if st["depth"] is None else f"{st['depth']} 件"
+        folder = f"{st['folder']} ({st['items']}/{st['count']})" if st["folder"] else "(待機中)"
+        self.lbl_lanes[name].configure(
+            text=f"{name}: {folder} / フォルダ {st['folders']} / キュー {depth}"
         )
+
+    def _update_counts(self):
+        text = f"{self.done + self.error} / {self.total} (失敗:{self.error})"
+        if self.prepared:
+            text += f"  準備済み:{self.prepared}"
+        self.lbl_counts.configure(text=text)
         self.progress["maximum"] = max(self.total, 1)
         self.progress["value"] = self.done + self.error
 
     def _poll_queue(self):
+        now = time.perf_counter()
+        stall = (now - self._last_tick) * 1000 - self.POLL_MS
+        self.max_stall_ms = max(self.max_stall_ms, stall)
+        self._last_tick = now
+
         try:
             while True:
                 ev = self.q.get_nowait()
@@ -157,17 +279,23 @@ class PrintProgressWindow(tk.Tk):
             self.total = int(ev[1])
             self.done = 0
             self.error = 0
+            self.prepared = 0
             self.sent_all = False
             self.empty_streak = 0
             self._update_counts()
 
+        elif etype == "prepared_item":
+            self.prepared += 1
+            self._update_counts()
+
         elif etype == "start_item":
             _, idx, name = ev
             self.lbl_current.configure(text=f"現在の印刷対象: {name}")
 
         elif etype == "done_item":
-            _, idx, name = ev
+            idx = ev[1]
             self.done += 1
+            self.sent_items.add(idx)
             self._update_counts()
 
         elif etype == "error_item":
@@ -184,48 +312,183 @@ class PrintProgressWindow(tk.Tk):
             self.sent_all = True
             self.empty_streak = 0
 
-    def _check_completion_condition(self):
+        elif etype == "spool":
+            self._on_spool_state(ev[1])
+
+        elif etype == "lane_folder":
+            _, printer, folder, count, eta = ev
+            st = self.lane_state.get(printer)
+            if st is not None:
+                st.update(folder=folder, count=count, items=0, folders=st["folders"] + 1)
+                self._update_lane(printer)
+            print(f"{folder} → {printer}（{count} 件 / 見込み {eta:.0f} 秒）")
+
+        elif etype == "lane_item":
+            _, printer, name = ev
+            st = self.lane_state.get(printer)
+            if st is not None:
+                st["items"] += 1
+                self._update_lane(printer)
+
+        elif etype == "lane_spool":
+            _, printer, depth = ev
+            st = self.lane_state.get(printer)
+            if st is not None and st["depth"] != depth:
+                st["depth"] = depth
+                self._update_lane(printer)
+
+        elif etype == "printer_state":
+            _, printer, state, detail = ev
+            self.printer_states[printer] = (state, detail)
+            print(f"プリンタ状態: {printer} = {state} {detail}".rstrip())
+            names = {"ok": "正常", "degraded": "不調", "failed": "故障", "probing": "確認中"}
+            self.lbl_health.configure(text="プリンタ状態: " + " / ".join(
+                f"{p}={names.get(st, st)}" + (f"({d})" if d and st != "ok" else "")
+                for p, (st, d) in self.printer_states.items()
+            ))
+
+        elif etype == "stalled":
+            _, printer, reason = ev
+            self.stalled_since = time.perf_counter()
+            print(f"停止中: {printer} も予備も使えません（{reason}）")
+            if not self.cancel_event.is_set():
+                self.lbl_title.configure(text=f"停止中: {printer} が使えません")
+
+        elif etype == "resumed":
+            _, printer, target, lost = ev
+            self.stalled_since = None
+            self.lost_sec += lost
+            print(f"再開: {target or '(中止)'}（停止 {lost:.0f} 秒 / 累計 {self.lost_sec:.0f} 秒）")
+            if not self.cancel_event.is_set():
+                self.lbl_title.configure(text="印刷中")
+
+        elif etype == "rerouted":
+            _, idx, name, src, dst = ev
+            self.rerouted += 1
+            print(f"予備に切り替え: {name}（{src} → {dst}）")
+
+        elif etype == "reroute_failed":
+            _, idx, name, msg = ev
+            self.done -= 1
+            self.error += 1
+            self.sent_items.discard(idx)
+            print(f"予備への投入に失敗: {name}（{msg}）")
+            self._update_counts()
+
+        elif etype == "job_bound":
+            self.jobs_unknown.discard(ev[1])
+
+        elif etype == "job_unknown":
+            _, idx, name, seconds = ev
+            self.jobs_unknown.add(idx)
+            self.lbl_spool.configure(
+                text=f"プリンタ: {self.printer_name} / スプーラで見つかりません: {name}"
+            )
+
+        elif etype == "job_done":
+            _, idx, name, seconds = ev
+            self.printed_items.add(idx)
+            self.job_times[idx] = seconds
+            self.lbl_spool.configure(
+                text=f"プリンタ: {self.printer_name} / 印刷完了: {name} ({seconds:.1f} 秒)"
+            )
+
+        elif etype == "job_error":
+            _, idx, name, status = ev
+            self.lbl_spool.configure(
+                text=f"プリンタ: {self.printer_name} / エラー: {name} ({status})"
+            )
+
+        elif etype == "cancelling":
+            _, purged, jobs_left, busy = ev
+            text = f"中止処理中… ジョブ削除 {purged} 件"
+            if jobs_left:
+                text += f" / 残り {jobs_left} 件"
+            if busy:
+                text += " / 投入の停止待ち"
+            self.lbl_title.configure(text=text)
+
+        elif etype == "cancelled":
+            _, seconds, purged, killed = ev
+            self.cancel_idle_sec = seconds
+            print(f"中止完了: {seconds:.1f} 秒で停止（ジョブ削除 {purged} 件 / プロセス終了 {killed} 件）")
+            self._on_all_done()
+
+        self._check_tracked_completion()
+
+    def _tracked_left(self) -> set:
+        """投入したのに印刷完了をまだ見ていない idx"""
+        return self.sent_items - self.printed_items
+
+    def _check_tracked_completion(self):
+        # 投入できた項目のジョブが全部印刷し終わったら完了（中止したら "cancelled" を待つ）
+        # 件数ではなく idx で突き合わせる（同じ項目の完了が2回来ても、別の項目の分には数えない）
+        if self.cancel_event.is_set():
+            return
+        if self.track_jobs and self.sent_all and not self.finished and not self._tracked_left():
+            self._on_all_done()
+
+    def _on_spool_state(self, spool_empty: bool):
         """
         完了条件:
           1) 印刷対象リストが空（= sent_all 済み）
           2) OS印刷キューが空（連続N回）
+        track_jobs でも、残りが全部スプーラで見つからないジョブならこの判定に戻す（見つかった分は印刷完了済み）
         """
-        if self.sent_all:
-            spool_empty = is_printer_queue_empty(self.printer_name)
-            status = "空" if spool_empty else "残りあり"
-            self.lbl_spool.configure(
-                text=f"プリンタ: {self.printer_name} / キュー状態: {status}"
-            )
+        if self.finished:
+            return
 
-            if spool_empty:
-                self.empty_streak += 1
-            else:
-                self.empty_streak = 0
+        status = "空" if spool_empty else "残りあり"
+        text = f"プリンタ: {self.printer_name} / キュー状態: {status}"
+        if self.track_jobs:
+            text += f" / 印刷完了 {len(self.sent_items & self.printed_items)}/{len(self.sent_items)}"
+        self.lbl_spool.configure(text=text)
 
-            if self.empty_streak >= self.EMPTY_STREAK_REQUIRED:
-                self._on_all_done()
-                return
+        if self.cancel_event.is_set() or not self.sent_all:
+            return
+        left = self._tracked_left()
+        if self.track_jobs and not (left and left <= self.jobs_unknown):
+            return
+
+        if spool_empty:
+            self.empty_streak += 1
+        else:
+            self.empty_streak = 0
 
-        self.after(self.CHECK_SPOOL_MS, self._check_completion_condition)
+        if self.empty_streak >= self.EMPTY_STREAK_REQUIRED:
+            self._on_all_done()
 
     def _on_all_done(self):
+        self.finished = True
         # 完了/中止 表示を切り替え
         self.lbl_current.configure(text="現在の印刷対象: (なし)")
         self.btn_cancel.state(["disabled"])
         self.btn_exit.state(["!disabled"])
 
         if self.cancel_event.is_set():
-            self.lbl_title.configure(text="印刷を中止しました")
-            messagebox.showinfo("中止", "印刷を中止しました")
+            text = "印刷を中止しました"
+            if self.cancel_idle_sec is not None:
+                text += f"（{self.cancel_idle_sec:.1f} 秒で停止）"
+            self.lbl_title.configure(text=text)
+            messagebox.showinfo("中止", text)
         else:
             self.lbl_title.configure(text="印刷完了")
             messagebox.showinfo("完了", "印刷完了しました")
 
+    def _on_cancel_press(self, event):
+        self._press_at = _event_perf_time(event)
+
     def _on_cancel(self):
         # 印刷スレッドへ中止シグナル
+        # 押した時刻はボタンのイベントから取る（キーボードで押したときはここで取る）
+        t0 = self._press_at if self._press_at is not None else time.perf_counter()
+        self.cancel_at = t0
         self.cancel_event.set()
         self.btn_cancel.state(["disabled"])
         self.lbl_title.configure(text="中止処理中…")
+        self.update_idletasks()
+        # 押してから表示が変わるまでの時間
+        self.cancel_feedback_ms = (time.perf_counter() - t0) * 1000
 
     def _on_exit(self):
         self.destroy()
@@ -238,49 +501,690 @@ class PrintProgressWindow(tk.Tk):
         self._on_exit()
 
 
-def run_print_with_gui(selected, print_pdf_func, print_word_func, printer_name: str):
+class ConsoleProgress:
+    """
+    画面の無い実行（headless）用の進捗表示。PrintProgressWindow と同じイベントを受けて標準出力に出す。
+    完了の判定も同じ（送信完了 + キュー空 / 追跡したジョブが全部印刷完了 / 中止処理の完了）。
+    Ctrl+C は中止ボタンと同じ。
+    """
+
+    POLL_SEC = 0.15
+    EMPTY_STREAK_REQUIRED = 3
+
+    def __init__(self, event_queue: queue.Queue, cancel_event: threading.Event,
+                 printer_name: str, track_jobs: bool = False, lanes=None):
+        self.q = event_queue
+        self.cancel_event = cancel_event
+        self.printer_name = printer_name
+        self.track_jobs = track_jobs
+        self.total = 0
+        self.done = 0
+        self.error = 0
+        self.sent_items = set()
+        self.printed_items = set()
+        self.jobs_unknown = set()
+        self.sent_all = False
+        self.empty_streak = 0
+        self.finished = False
+        self.max_stall_ms = 0.0
+        self.cancel_feedback_ms = None
+        self.cancel_at = None
+        self.cancel_idle_sec = None
+
+    def mainloop(self):
+        while not self.finished:
+            try:
+                try:
+                    ev = self.q.get(timeout=self.POLL_SEC)
+                except queue.Empty:
+                    continue
+                self._handle_event(ev)
+            except KeyboardInterrupt:
+                if not self.cancel_event.is_set():
+                    print("中止します…")
+                    self.cancel_at = time.perf_counter()
+                    self.cancel_event.set()
+
+    def _handle_event(self, ev):
+        etype = ev[0]
+        if etype == "init":
+            self.total = int(ev[1])
+        elif etype == "done_item":
+            self.done += 1
+            self.sent_items.add(ev[1])
+            print(f"[{self.done + self.error}/{self.total}] 投入: {ev[2]}")
+        elif etype == "error_item":
+            self.error += 1
+            print(f"[{self.done + self.error}/{self.total}] 失敗: {ev[2]}（{ev[3]}）")
+        elif etype == "reroute_failed":
+            self.done -= 1
+            self.error += 1
+            self.sent_items.discard(ev[1])
+            print(f"予備への投入に失敗: {ev[2]}（{ev[3]}）")
+        elif etype == "log":
+            print(ev[1])
+        elif etype == "sent_all":
+            self.sent_all = True
+            self.empty_streak = 0
+        elif etype == "spool":
+            left = self.sent_items - self.printed_items
+            tracked = self.track_jobs and not (left and left <= self.jobs_unknown)
+            if not (self.finished or tracked or self.cancel_event.is_set()) and self.sent_all:
+                self.empty_streak = self.empty_streak + 1 if ev[1] else 0
+                if self.empty_streak >= self.EMPTY_STREAK_REQUIRED:
+                    self._on_all_done()
+        elif etype == "job_done":
+            self.printed_items.add(ev[1])
+            print(f"印刷完了: {ev[2]} ({ev[3]:.1f} 秒)")
+        elif etype == "job_error":
+            print(f"プリンタエラー: {ev[2]} ({ev[3]})")
+        elif etype == "job_bound":
+            self.jobs_unknown.discard(ev[1])
+        elif etype == "job_unknown":
+            self.jobs_unknown.add(ev[1])
+            print(f"スプーラで見つかりません: {ev[2]}（完了はキューが空になるのを待ちます）")
+        elif etype == "lane_folder":
+            print(f"{ev[2]} → {ev[1]}（{ev[3]} 件）")
+        elif etype == "printer_state":
+            print(f"プリンタ状態: {ev[1]} = {ev[2]} {ev[3]}".rstrip())
+        elif etype == "stalled":
+            print(f"停止中: {ev[1]} も予備も使えません（{ev[2]}）")
+        elif etype == "resumed":
+            print(f"再開: {ev[2] or '(中止)'}（停止 {ev[3]:.0f} 秒）")
+        elif etype == "rerouted":
+            print(f"予備に切り替え: {ev[2]}（{ev[3]} → {ev[4]}）")
+        elif etype == "cancelling":
+            print(f"中止処理中… ジョブ削除 {ev[1]} 件 / 残り {ev[2]} 件")
+        elif etype == "cancelled":
+            self.cancel_idle_sec = ev[1]
+            print(f"中止完了: {ev[1]:.1f} 秒で停止（ジョブ削除 {ev[2]} 件 / プロセス終了 {ev[3]} 件）")
+            self._on_all_done()
+        if (self.track_jobs and self.sent_all and not self.finished and not self.cancel_event.is_set()
+                and not self.sent_items - self.printed_items):
+            self._on_all_done()
+
+    def _on_all_done(self):
+        self.finished = True
+        print("印刷を中止しました" if self.cancel_event.is_set() else "印刷完了しました")
+
+
+class _RecordingQueue(queue.Queue):
+    """
+    put されたイベントのうち項目の状態が変わるものを記録してから渡す。
+      journal: run_journal に状態を書く（put したスレッドで書く）
+      history: print_history に「いつ・どのプリンタで印刷したか」を書く。
+               track_jobs なら印刷完了（job_done = スプーラから抜けたのを見たジョブ）で、そうでなければ投入（done_item）で記録する。
+               job_done はキュー監視のスレッドから来るので、ハッシュの計算と書き込みは専用のスレッドで行う。
+               内容ハッシュは投入したとき（done_item）に求めておく（走査のときに計算したものがあればそれを使う）
+    終わったら close() で書き込みを待つ。
+    """
+
+    STATES = {
+        "prepared_item": run_journal.PREPARED,
+        "done_item": run_journal.SUBMITTED,
+        "error_item": run_journal.FAILED,
+        "reroute_failed": run_journal.FAILED,
+        "job_done": run_journal.COMPLETED,
+    }
+
+    def __init__(self, journal=None, history=None, selected=None, track_jobs: bool = False):
+        super().__init__()
+        self.journal = journal
+        self.history = history
+        self.selected = selected
+        self.track_jobs = track_jobs
+        self.where = {}     # idx -> 投入したプリンタ
+        self.digests = {}   # idx -> 投入したときの内容ハッシュ
+        self._tasks = queue.Queue()
+        self._writer = None
+        if history is not None:
+            self._writer = threading.Thread(target=self._write_history, daemon=True, name="print-history")
+            self._writer.start()
+
+    def put(self, ev, block=True, timeout=None):
+        etype = ev[0] if ev else None
+        state = self.STATES.get(etype)
+        if state is not None and self.journal is not None:
+            self.journal.mark(ev[1], state)
+        if self.history is not None:
+            if etype == "done_item":
+                self.where[ev[1]] = ev[3] if len(ev) > 3 else ""
+                self._tasks.put(("hash", ev[1]))
+                if not self.track_jobs:
+                    self._tasks.put(("record", ev[1]))
+            elif etype == "rerouted":
+                self.where[ev[1]] = ev[4]
+            elif etype == "job_done" and self.track_jobs:
+                self._tasks.put(("record", ev[1]))
+        super().put(ev, block, timeout)
+
+    def _write_history(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            op, idx = task
+            path = Path(self.selected[idx][1])
+            try:
+                if op == "hash":
+                    self.digests[idx] = self.history.hash_files([path]).get(path)
+                else:
+                    self.history.record(path, self.where.get(idx, ""), digest=self.digests.get(idx))
+            except Exception as e:
+                super().put(("log", f"印刷履歴に記録できませんでした: {e}"))
+
+    def close(self):
+        """印刷履歴の書き込みが終わるのを待つ"""
+        if self._writer is not None:
+            self._tasks.put(None)
+            self._writer.join()
+            self._writer = None
+
+
+def _folder_ranges(selected):
+    """selected を、同じフォルダが続く範囲 [(start, end), ...] に分ける"""
+    ranges = []
+    start = 0
+    for k in range(1, len(selected) + 1):
+        if k == len(selected) or Path(selected[k][1]).parent != Path(selected[start][1]).parent:
+            ranges.append((start, k))
+            start = k
+    return ranges
+
+
+def _estimate_pages(kind, path) -> int:
+    """振り分け用のページ数の見積もり（PDF は数える。Word は変換前なので1）"""
+    if kind == "pdf":
+        return count_pages(path) or 1
+    return 1
+
+
+def run_print_with_gui(selected, print_pdf_func, print_word_func, printer_name: str,
+                       prepare_func=None, lookahead: int = 4, track_jobs: bool = False,
+                       print_batch_func=None, batch_max_files: int = 10, batch_max_pages: int = 0,
+                       batch_max_bytes: int = 0, pool=None, health=None, cancel_job_func=None,
+                       cancel_event=None, journal=None, headless: bool = False, history=None,
+                       diagnostics: bool = False):
     """
     既存印刷処理をGUI付きで走らせるためのラッパ。
 
     selected: [(kind, path, fname), ...]
-    print_pdf_func(path): 既存PDF印刷関数
-    print_word_func(path): 既存Word印刷関数
+    print_pdf_func(path): 既存PDF印刷関数（printer_backend の submit を包んだもの。ジョブIDを返してよい）
+    print_word_func(path): 既存Word印刷関数（同上）
     printer_name: config.json から渡す監視対象プリンタ名
+    prepare_func(kind, path) -> (kind, path, pages):
+        投入前の準備（Word→PDF変換、存在確認、ページ数取得など）。
+        印刷する実体を返す（Word を変換したら ("pdf", 変換後PDF, pages)）。
+        None なら準備段なしで1件ずつ投入する。
+    lookahead: 準備段が投入段より先に進んでよい件数
+    track_jobs: True なら投入ごとにスプーラのジョブIDを追いかけ、
+        この実行のジョブが全部印刷し終わった時点で完了にする
+    print_batch_func(paths) -> [job_id, ...]:
+        同じフォルダで続く PDF を1回の投入（1ジョブ）にまとめる関数。None ならまとめない。
+        まとめる数は batch_max_files 件・batch_max_pages ページ・batch_max_bytes バイトまで（0 は無制限）。
+        スプーラに渡す前の失敗（NotSubmitted）なら1件ずつ投入し直して、成功・失敗をファイルごとに出す。
+        それ以外の失敗は、一部がスプーラに渡っているかもしれないので、まとめた全部を失敗にする
+        （投入し直すと同じ報告書が2回印刷されることがある）。
+    pool: printer_pool.PrinterPool。渡すとフォルダ単位で複数プリンタに振り分けて並列に投入する。
+        印刷関数は (path, printer=プリンタ名) で呼ぶ。printer_name は使わない。
+    health: printer_health.Failover。渡すと遮断中のプリンタの分を予備プリンタに回す
+        （印刷関数はプリンタ名つきで呼ぶ。待っている間に遮断されたら PrinterUnavailable を投げてよい）。
+    cancel_job_func(printer, job_id): この実行のジョブをスプーラから消す関数
+        （遮断されたプリンタからの退避と、中止ボタンでの削除に使う。track_jobs が必要）
+    cancel_event: 中止の合図（threading.Event）。呼び出し側のキュー空き待ちなども
+        中止で打ち切れるように外から渡してよい。None ならここで作る
+    journal: run_journal.RunJournal（selected と同じ並び）。渡すと項目ごとの状態を記録し、
+        全部投入できたか中止したら最後に終了の印を書く
+    headless: True なら進捗ウィンドウを出さず、標準出力に進捗を出す（ConsoleProgress）
+    history: print_history.PrintHistory。渡すと印刷した内容を履歴に記録する（track_jobs なら印刷完了で）
+    diagnostics: True なら GUI の最大停止時間と中止ボタンの反応時間を最後に出す
 
     返り値:
       True  = 正常完了（失敗なし＆中止なし）
       False = 中止 or 失敗あり
     """
-    q = queue.Queue()
-    cancel_event = threading.Event()
+    if journal is not None or history is not None:
+        q = _RecordingQueue(journal, history, selected, track_jobs)
+    else:
+        q = queue.Queue()
+    if cancel_event is None:
+        cancel_event = threading.Event()
+    child_process.reset()
+    timeouts_before = child_process.timeouts()
 
-    gui = PrintProgressWindow(q, cancel_event, printer_name=printer_name)
+    printers = pool.names if pool is not None else [printer_name]
+    # 監視するプリンタ（予備プリンタも含む）
+    watched = list(printers)
+    if health is not None:
+        for p in printers:
+            watched += [b for b in health.chain(p) if b not in watched]
+    window_cls = ConsoleProgress if headless else PrintProgressWindow
+    gui = window_cls(q, cancel_event, printer_name=", ".join(printers), track_jobs=track_jobs,
+                     lanes=printers if pool is not None else None)
 
-    def worker():
-        q.put(("init", len(selected)))
+    monitors = {p: queue_monitor.get_monitor(p) for p in watched}
+    trackers = {p: JobTracker(monitors[p], on_event=q.put) for p in watched} if track_jobs else {}
+    sent = {}   # idx -> (kind, 投入した実体のパス)。予備へ投入し直すときに使う
 
-        for i, (kind, path, fname) in enumerate(selected):
-            if cancel_event.is_set():
-                break
+    def call(func, arg, printer):
+        return func(arg) if pool is None and health is None else func(arg, printer=printer)
 
-            q.put(("start_item", i, fname))
+    def route(printer):
+        """実際の投入先（遮断中なら予備。全部だめなら戻るまで待つ）"""
+        if health is None:
+            return printer
+        target = health.route(printer, stop=cancel_event)
+        if target is None:
+            raise PrinterUnavailable(f"中止しました（{printer} が使えないまま）")
+        return target
+
+    def health_ok(printer):
+        return health is None or health.available(printer)
+
+    def submit(i, fname, kind, path, printer):
+        while True:
+            target = route(printer)
+            tracker = trackers.get(target)
+            if tracker is not None:
+                tracker.expect(i, fname, path)
             try:
                 if kind == "pdf":
-                    print_pdf_func(path)
+                    job_id = call(print_pdf_func, path, target)
                 else:
-                    print_word_func(path)
+                    job_id = call(print_word_func, path, target)
+            except PrinterUnavailable:
+                if tracker is not None:
+                    tracker.discard(i)
+                if health is None or cancel_event.is_set():
+                    raise
+                continue   # 空き待ちの間に遮断された → 予備に回す
+            except Exception:
+                if tracker is not None:
+                    tracker.discard(i)
+                raise
+            sent[i] = (kind, path)
+            if tracker is not None:
+                # 投入方法がジョブIDを返したら、文書名で探さずにそれで結び付ける
+                tracker.submitted(i, job_id if isinstance(job_id, int) else None)
+                if not health_ok(target):
+                    evacuate_later(target)   # 投入中に遮断とすれ違った
+            if target != printer:
+                q.put(("rerouted", i, fname, printer, target))
+            return target
+
+    def submit_group(group, printer):
+        """group: [(i, fname, path), ...]（同じフォルダの PDF）を1回でまとめて投入する"""
+        for i, fname, path in group:
+            q.put(("start_item", i, fname))
+        try:
+            while True:
+                target = route(printer)
+                tracker = trackers.get(target)
+                for i, fname, path in group:
+                    if tracker is not None:
+                        tracker.expect(i, fname, path)
+                try:
+                    job_ids = call(print_batch_func, [path for _, _, path in group], target)
+                    break
+                except PrinterUnavailable:
+                    for i, _, _ in group:
+                        if tracker is not None:
+                            tracker.discard(i)
+                    if health is None or cancel_event.is_set():
+                        raise
+        except NotSubmitted as e:
+            # スプーラに渡す前に失敗した → 1件ずつ投入し直し、どのファイルが悪いかを個別に出す
+            q.put(("log", f"まとめて投入できなかったため1件ずつ投入します: {e}"))
+            for i, fname, path in group:
+                for tracker in trackers.values():
+                    tracker.discard(i)
+                try:
+                    q.put(("done_item", i, fname, submit(i, fname, "pdf", path, printer)))
+                except Exception as e1:
+                    q.put(("error_item", i, fname, str(e1)))
+            return
+        except Exception as e:
+            # スプーラに渡した後かもしれない → 投入し直さず、まとめた全部を失敗にする
+            msg = str(e) if isinstance(e, PrinterUnavailable) else \
+                f"まとめて投入に失敗しました（一部が印刷されているかもしれません）: {e}"
+            for i, fname, path in group:
+                for tracker in trackers.values():
+                    tracker.discard(i)
+                q.put(("error_item", i, fname, msg))
+            return
+        for (i, fname, path), job_id in zip(group, job_ids):
+            sent[i] = ("pdf", path)
+            if tracker is not None:
+                tracker.submitted(i, job_id if isinstance(job_id, int) else None)
+            if target != printer:
+                q.put(("rerouted", i, fname, printer, target))
+            q.put(("done_item", i, fname, target))
+        if tracker is not None and not health_ok(target):
+            evacuate_later(target)
 
-                q.put(("done_item", i, fname))
+    evacuate_lock = threading.Lock()
+
+    def evacuate(printer):
+        """
+        遮断されたプリンタに残っているこの実行のジョブを消して、予備に投入し直す（消すのは中止と同じく確かめられたジョブだけ）。
+        スプーラでまだ見つかっていないジョブは、見つかるか「不明」になるまで待って回す。
+        """
+        tracker = trackers.get(printer)
+        if tracker is None or cancel_job_func is None:
+            return
+        skipped = set()
+        with evacuate_lock:
+            while not cancel_event.is_set() and health.pick(printer) not in (None, printer):
+                by_job = {}
+                waiting = False
+                for idx, job_id, verified in tracker.pending_jobs():
+                    if job_id is None:
+                        waiting = True   # スプーラ上で見つかっていないものはまだ消せない
+                    elif not verified:
+                        # 名前だけで結び付けたジョブは他人のものかもしれないので消さない（遮断したプリンタに残す）
+                        if job_id not in skipped:
+                            skipped.add(job_id)
+                            q.put(("log", f"ジョブ {job_id} はこの実行のものと確かめられないため予備に回しません"))
+                    else:
+                        by_job.setdefault(job_id, []).append(idx)
+                for job_id, idxs in by_job.items():
+                    if cancel_event.is_set():
+                        return
+                    # 消している間に抜けたのを印刷完了と見ないよう、先に追跡から外す
+                    for idx in idxs:
+                        tracker.discard(idx)
+                    try:
+                        cancel_job_func(printer, job_id)
+                    except Exception as e:
+                        q.put(("log", f"ジョブ {job_id} を消せませんでした（遮断したプリンタに残り、印刷完了は確かめません）: {e}"))
+                        continue
+                    for idx in idxs:
+                        kind, path = sent.get(idx, selected[idx][:2])
+                        fname = selected[idx][2]
+                        try:
+                            submit(idx, fname, kind, path, printer)
+                        except Exception as e:
+                            q.put(("reroute_failed", idx, fname, str(e)))
+                if not waiting:
+                    return
+                time.sleep(0.2)
+
+    def evacuate_later(printer):
+        threading.Thread(target=evacuate, args=(printer,), daemon=True, name=f"evacuate:{printer}").start()
+
+    def on_health(ev):
+        q.put(ev)
+        if ev[0] == "printer_state" and ev[2] == "failed" and ev[1] in trackers:
+            evacuate_later(ev[1])
+
+    if health is not None:
+        health.subscribe(on_health)
+
+    def fits(group_pages, group_bytes, n_files, path, pages):
+        if batch_max_files and n_files >= batch_max_files:
+            return False
+        if batch_max_pages and group_pages + (pages or 1) > batch_max_pages:
+            return False
+        if batch_max_bytes and group_bytes + _file_size(path) > batch_max_bytes:
+            return False
+        return True
+
+    # 準備段: prepare_func があれば lookahead 件先まで並列で準備しておく
+    n = len(selected)
+    ex = None
+    futures = {}
+    started = set()
+    preparing = set()   # 準備中の番号（中止時に抜けるのを待つ）
+    prep_lock = threading.Lock()
+    if prepare_func is not None:
+        ex = ThreadPoolExecutor(max_workers=max(lookahead, 1) * len(printers), thread_name_prefix="prepare")
+
+    def prepare(j, kind, path, fname):
+        with prep_lock:
+            preparing.add(j)
+        try:
+            result = prepare_func(kind, path)
+        finally:
+            with prep_lock:
+                preparing.discard(j)
+        q.put(("prepared_item", j, fname, result[2]))
+        return result
+
+    def prepared(j, end):
+        """j 番目の印刷する実体 (kind, path, pages)。準備で失敗したら例外。先読みは end の手前まで"""
+        if ex is None:
+            kind, path, _ = selected[j]
+            return kind, path, None
+        with prep_lock:
+            for k in range(j, min(j + 1 + lookahead, end)):
+                if k not in started:
+                    started.add(k)
+                    kk, p, f = selected[k]
+                    futures[k] = ex.submit(prepare, k, kk, p, f)
+            fut = futures[j]
+        return fut.result()
+
+    def process(start, end, printer):
+        """selected[start:end] を printer に元の順番どおりに投入する"""
+        i = start
+        while i < end:
+            if cancel_event.is_set():
+                break
+            fname = selected[i][2]
+
+            # 投入段: 元の並び順どおりに、準備が済んだものから送る
+            try:
+                pkind, ppath, pages = prepared(i, end)
             except Exception as e:
-                q.put(("error_item", i, fname, str(e)))
+                futures.pop(i, None)
+                q.put(("error_item", i, fname, "中止しました" if cancel_event.is_set() else str(e)))
+                i += 1
+                continue
+            futures.pop(i, None)
+
+            if cancel_event.is_set():
+                break
+
+            # 同じフォルダの PDF が続く間は、上限内でまとめて1回で投入する
+            group = [(i, fname, ppath)]
+            if print_batch_func is not None and pkind == "pdf":
+                folder = Path(selected[i][1]).parent
+                if batch_max_pages and pages is None:
+                    pages = count_pages(ppath)
+                g_pages, g_bytes = pages or 1, _file_size(ppath)
+                j = i + 1
+                while j < end and Path(selected[j][1]).parent == folder:
+                    try:
+                        jkind, jpath, jpages = prepared(j, end)
+                    except Exception:
+                        break   # 失敗は自分の番で error_item にする
+                    if jkind != "pdf":
+                        break
+                    if batch_max_pages and jpages is None:
+                        jpages = count_pages(jpath)
+                    if not fits(g_pages, g_bytes, len(group), jpath, jpages):
+                        break
+                    futures.pop(j, None)
+                    group.append((j, selected[j][2], jpath))
+                    g_pages += jpages or 1
+                    g_bytes += _file_size(jpath)
+                    j += 1
+
+            if pool is not None:
+                for _, gname, _ in group:
+                    q.put(("lane_item", printer, gname))
+            if len(group) > 1:
+                submit_group(group, printer)
+            else:
+                q.put(("start_item", i, fname))
+                try:
+                    q.put(("done_item", i, fname, submit(i, fname, pkind, ppath, printer)))
+                except Exception as e:
+                    q.put(("error_item", i, fname, "中止しました" if cancel_event.is_set() else str(e)))
+            i = group[-1][0] + 1
+
+    def lane(printer, lane_q):
+        # プール: 振り分けられたフォルダを順に投入する
+        while True:
+            item = lane_q.get()
+            if item is None:
+                return
+            start, end, pages = item
+            try:
+                process(start, end, printer)
+            finally:
+                pool.finished(pool.get(printer), pages)
+
+    def dispatch():
+        # プール: フォルダごとに、いちばん早く終わるプリンタへ振り分ける
+        lane_qs = {p: queue.Queue() for p in printers}
+        threads = [threading.Thread(target=lane, args=(p, lane_qs[p]), daemon=True, name=f"lane:{p}")
+                   for p in printers]
+        for t in threads:
+            t.start()
+        try:
+            for start, end in _folder_ranges(selected):
+                if cancel_event.is_set():
+                    break
+                pages = sum(_estimate_pages(k, p) for k, p, _ in selected[start:end])
+                target = pool.choose(pages, stop=cancel_event)
+                if target is None:
+                    break
+                eta = pool.estimate(target, 0)
+                q.put(("lane_folder", target.name, Path(selected[start][1]).parent.name, end - start, eta))
+                lane_qs[target.name].put((start, end, pages))
+        finally:
+            for p in printers:
+                lane_qs[p].put(None)
+            for t in threads:
+                t.join()
+
+    def worker():
+        q.put(("init", n))
+        try:
+            if pool is None:
+                process(0, n, printer_name)
+            else:
+                dispatch()
+        finally:
+            if ex is not None:
+                ex.shutdown(wait=False, cancel_futures=True)
 
         # 印刷対象リストが空になった合図（送信完了）
         q.put(("sent_all",))
 
+    # キュー状態は共有監視を購読する（投入側の上限待ちと問い合わせを共用）
+    # プール・予備プリンタがあるときは、全プリンタ（遮断中のものは除く）のキューが空で「空」
+    def make_on_snapshot(printer):
+        def on_snapshot(snap):
+            if len(watched) == 1:
+                q.put(("spool", snap.empty))
+                return
+            if pool is not None and printer in printers:
+                q.put(("lane_spool", printer, snap.depth))
+            q.put(("spool", all(monitors[p].snapshot().empty or (health is not None and not health.available(p))
+                                for p in watched)))
+        return on_snapshot
+
+    callbacks = {p: make_on_snapshot(p) for p in watched}
+    for p in watched:
+        monitors[p].subscribe(callbacks[p])
+
     t = threading.Thread(target=worker, daemon=True)
     t.start()
 
+    ended = threading.Event()
+
+    def purge():
+        """
+        中止: 子プロセスを止め、準備段の先読みを捨て、この実行のジョブをスプーラから消す。
+        消すのは投入方法が返したジョブIDか、名前と所有者が一致したジョブだけ（それ以外は記録して残す）。
+        投入・準備・子プロセスが止まり、消せるジョブが残っていなくなるまでの時間を測る。
+        """
+        while not cancel_event.wait(0.2):
+            if ended.is_set():
+                return
+        t0 = gui.cancel_at or time.perf_counter()
+        purged = set()
+        killed = 0
+        last = None
+        try:
+            killed = child_process.kill_all()
+            if ex is not None:
+                ex.shutdown(wait=False, cancel_futures=True)
+            for mon in monitors.values():
+                mon.poke()   # キューの空き待ちを起こして中止に気づかせる
+            while True:
+                jobs_left = 0
+                if cancel_job_func is not None:
+                    for printer, tracker in trackers.items():
+                        by_job = {}
+                        for idx, job_id, verified in tracker.pending_jobs():
+                            if job_id is None:
+                                jobs_left += 1   # スプーラ上で見つかるのを待つ
+                                continue
+                            if not verified:
+                                # 名前だけで結び付けたジョブは他人のものかもしれないので消さない
+                                q.put(("log", f"ジョブ {job_id} はこの実行のものと確かめられないため消しません"))
+                                tracker.discard(idx)
+                                continue
+                            by_job.setdefault(job_id, []).append(idx)
+                        for job_id, idxs in by_job.items():
+                            # 消したジョブを印刷完了として数えない（消している間に抜けたのを完了と見ないよう先に外す）
+                            for idx in idxs:
+                                tracker.discard(idx)
+                            if (printer, job_id) not in purged:
+                                try:
+                                    cancel_job_func(printer, job_id)
+                                except Exception as e:
+                                    q.put(("log", f"ジョブ {job_id} を消せませんでした: {e}"))
+                                purged.add((printer, job_id))
+                with prep_lock:
+                    busy = t.is_alive() or bool(preparing)
+                busy = busy or child_process.running() > 0
+                state = (len(purged), jobs_left, busy)
+                if state != last:
+                    q.put(("cancelling",) + state)
+                    last = state
+                if not busy and not jobs_left:
+                    break
+                if child_process.running():
+                    killed += child_process.kill_all()   # 中止とすれ違って起動したもの
+                time.sleep(0.05)
+        finally:
+            q.put(("cancelled", time.perf_counter() - t0, len(purged), killed))
+
+    threading.Thread(target=purge, daemon=True, name="cancel-purge").start()
+
     gui.mainloop()
+    ended.set()
+    if isinstance(q, _RecordingQueue):
+        q.close()
+    if journal is not None:
+        # 投入できなかった項目が残ったら終了の印を書かない（次の起動で、その分だけ再開を提案する）
+        if cancel_event.is_set():
+            journal.finish("cancelled")
+        elif not journal.pending():
+            journal.finish("done")
+    for p in watched:
+        monitors[p].unsubscribe(callbacks[p])
+    for tracker in trackers.values():
+        tracker.close()
+    if health is not None:
+        health.unsubscribe(on_health)
+
+    if diagnostics:
+        print(f"GUI最大停止: {gui.max_stall_ms:.0f} ms")
+        if gui.cancel_feedback_ms is not None:
+            print(f"中止ボタンの反応: {gui.cancel_feedback_ms:.0f} ms")
+        if gui.cancel_idle_sec is not None:
+            print(f"中止から停止まで: {gui.cancel_idle_sec:.1f} 秒")
+    if child_process.timeouts() > timeouts_before:
+        print(f"応答が無いため終了させた処理: {child_process.timeouts() - timeouts_before} 件")
+    if health is not None and (health.lost_sec or health.rerouted or any(m.trips for m in health.monitors.values())):
+        detect = sum(m.detect_sec for m in health.monitors.values())
+        print(f"プリンタ停止による損失: 投入停止 {health.lost_sec:.0f} 秒 / 故障検知まで {detect:.0f} 秒 / "
+              f"予備に回した投入 {health.rerouted} 件")
 
     if cancel_event.is_set():
         return False
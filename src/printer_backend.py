@@ -0,0 +1,347 @@
+# printer_backend.py
+# 印刷の投入先（プリンタバックエンド）
+#
+# 以前は PDF は PDFtoPrinter.exe、Word は soffice --pt に直結していて、
+# Windows 以外では印刷部分を動かすことも負荷試験することもできなかった。
+# ここでは投入・キュー問い合わせ・ジョブ削除・対応機能を共通の形にまとめ、
+# config.json の "printer_backend" で選ぶ。
+#
+#   windows   : PDFtoPrinter.exe / soffice --pt（従来どおり）。キューは spooler の win32 / powershell
+#   cups      : lp / lpstat / cancel（Linux のビルド機など）
+#   directory : 指定フォルダに連番つきでコピーするだけ（実際には印刷しない）
+#   fake      : 投入・印刷にかかる時間を指定できる模擬プリンタ（負荷試験用）
+#
+# 使い方:
+#   backend = printer_backend.make_backend("fake", submit_ms=50, page_ms=20)
+#   spooler.set_default_inspector(backend.inspector)
+#   job_id = backend.submit(printer_name, path, "pdf")   # ジョブIDが分からなければ None
+#   backend.cancel(printer_name, job_id)
+
+import os
+import re
+import time
+import shutil
+import threading
+import itertools
+import subprocess
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import module1 as m
+import spooler
+import child_process
+from child_process import TimeoutPolicy
+from spooler import FakeInspector, JobInfo, NotSubmitted, QueueInspector, SpoolerError
+from soffice_worker import SofficeWorker
+from pdf_info import count_pages
+
+
+class Capabilities(NamedTuple):
+    pdf: bool = True
+    word: bool = False      # Word を直接印刷できるか（できなければ PDF に変換してから投入）
+    job_ids: bool = False   # submit がジョブIDを返すか
+    cancel: bool = False    # 投入済みジョブを削除できるか
+    queue: bool = True      # 投入後にキューに並ぶか（False ならキュー上限待ちは不要）
+    batch: bool = False     # 複数の PDF を1回の投入（1ジョブ）にまとめられるか
+
+
+class PrinterBackend:
+    """
+    共通インターフェース。
+    submit は投入できなければ例外（呼び出し側で error_item にする）。
+    外部コマンドには timeouts（child_process.TimeoutPolicy）の時間制限を付ける。
+    """
+
+    name = "base"
+
+    def __init__(self, inspector: QueueInspector):
+        self.inspector = inspector
+        self.timeouts = TimeoutPolicy()
+
+    def capabilities(self) -> Capabilities:
+        return Capabilities()
+
+    def submit(self, printer_name: str, path: Path, kind: str = "pdf") -> Optional[int]:
+        raise NotImplementedError
+
+    def submit_batch(self, printer_name: str, paths: List[Path]) -> List[Optional[int]]:
+        """
+        複数の PDF をまとめて投入し、ファイルごとのジョブIDを返す（1ジョブなら全部同じID）。
+        capabilities().batch が True のバックエンドだけが実装する（1件ずつ投入するのは呼び出し側）。
+        スプーラに渡す前に失敗したら NotSubmitted（呼び出し側が1件ずつ投入し直す）。
+        """
+        raise NotImplementedError
+
+    def jobs(self, printer_name: str) -> List[JobInfo]:
+        return self.inspector.jobs(printer_name)
+
+    def cancel(self, printer_name: str, job_id: int):
+        self.inspector.cancel(printer_name, job_id)
+
+    def close(self):
+        self.inspector.close()
+
+
+class _SofficeWordMixin:
+    """Word は soffice --pt（常駐ワーカーがあればそちら）で印刷する"""
+
+    soffice_path: Optional[Path] = None
+    word_worker: Optional[SofficeWorker] = None
+
+    def _print_word(self, printer_name: str, path: Path):
+        timeout = self.timeouts.for_item("word", path)
+        if self.word_worker is not None:
+            self.word_worker.print_document(printer_name, path, timeout=timeout)
+        elif self.soffice_path is not None:
+            m.print_word_with_soffice(self.soffice_path, printer_name, path, timeout=timeout)
+        else:
+            raise SpoolerError(f"{self.name} では Word を直接印刷できません: {path}")
+
+
+# ===== Windows: PDFtoPrinter.exe / soffice =====
+class WindowsBackend(_SofficeWordMixin, PrinterBackend):
+    name = "windows"
+
+    def __init__(self, pdftoprinter_path: Path, soffice_path: Optional[Path] = None,
+                 word_worker: Optional[SofficeWorker] = None, inspector: Optional[QueueInspector] = None):
+        super().__init__(inspector or spooler.make_inspector("auto"))
+        self.pdftoprinter_path = Path(pdftoprinter_path)
+        self.soffice_path = soffice_path
+        self.word_worker = word_worker
+
+    def capabilities(self) -> Capabilities:
+        can_cancel = isinstance(self.inspector, (spooler.Win32Inspector, spooler.PowerShellInspector))
+        return Capabilities(pdf=True, word=True, job_ids=False, cancel=can_cancel)
+
+    def submit(self, printer_name: str, path: Path, kind: str = "pdf") -> Optional[int]:
+        if kind == "pdf":
+            m.print_pdf_with_pdftoprinter(self.pdftoprinter_path, printer_name, path,
+                                          timeout=self.timeouts.for_item("pdf", path))
+        else:
+            self._print_word(printer_name, path)
+        return None
+
+
+# ===== CUPS: lp / lpstat / cancel =====
+class CupsBackend(_SofficeWordMixin, PrinterBackend):
+    name = "cups"
+
+    _REQUEST_ID = re.compile(r"request id is \S+-(\d+)")
+
+    def __init__(self, soffice_path: Optional[Path] = None, word_worker: Optional[SofficeWorker] = None):
+        super().__init__(spooler.CupsInspector())
+        self.soffice_path = soffice_path
+        self.word_worker = word_worker
+
+    def capabilities(self) -> Capabilities:
+        return Capabilities(pdf=True, word=self.soffice_path is not None or self.word_worker is not None,
+                            job_ids=True, cancel=True, batch=True)
+
+    def _lp(self, printer_name: str, paths: List[Path]) -> Optional[int]:
+        # lp -d "Printer" -t "a.pdf" a.pdf b.pdf  →  "request id is Printer-123 (2 file(s))"
+        out = child_process.run(
+            ["lp", "-d", printer_name, "-t", Path(paths[0]).name] + [str(p) for p in paths],
+            check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            timeout=self.timeouts.for_item("lp", paths),
+        ).stdout
+        mt = self._REQUEST_ID.search(out)
+        return int(mt.group(1)) if mt else None
+
+    def submit(self, printer_name: str, path: Path, kind: str = "pdf") -> Optional[int]:
+        if kind != "pdf":
+            self._print_word(printer_name, path)
+            return None
+        return self._lp(printer_name, [path])
+
+    def submit_batch(self, printer_name: str, paths: List[Path]) -> List[Optional[int]]:
+        # 1回の lp で1ジョブ（複数文書）になる。lp に渡した後の失敗はまとめた全部の失敗
+        for p in paths:
+            if not Path(p).exists():
+                raise NotSubmitted(f"ファイルが見つかりません: {p}")
+        job_id = self._lp(printer_name, paths)
+        return [job_id] * len(paths)
+
+
+# ===== 指定フォルダへの書き出し =====
+class _NullInspector(QueueInspector):
+    """キューを持たない投入先用。常に空"""
+
+    name = "none"
+
+    def jobs(self, printer_name: str) -> List[JobInfo]:
+        return []
+
+
+class DirectoryBackend(PrinterBackend):
+    """
+    spool_dir/プリンタ名/00001_a.pdf のようにコピーする。
+    コピーし終わった時点で「印刷済み」扱いなので、キューは常に空。
+    """
+
+    name = "directory"
+
+    def __init__(self, spool_dir: Path):
+        super().__init__(_NullInspector())
+        self.spool_dir = Path(spool_dir)
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def capabilities(self) -> Capabilities:
+        return Capabilities(pdf=True, word=True, job_ids=True, cancel=False, queue=False)
+
+    def submit(self, printer_name: str, path: Path, kind: str = "pdf") -> Optional[int]:
+        path = Path(path)
+        folder = self.spool_dir / re.sub(r'[\\/:*?"<>|]', "_", printer_name)
+        folder.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            job_id = next(self._seq)
+        dest = folder / f"{job_id:05d}_{path.name}"
+        tmp = dest.with_name(dest.name + ".tmp")
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, dest)   # 途中で落ちても書きかけを残さない
+        return job_id
+
+
+# ===== 模擬プリンタ =====
+class FakePrinter(threading.Thread):
+    """
+    FakeInspector のキュー先頭ジョブを1件ずつ印刷する模擬プリンタ。
+    1件あたり service_sec + ページ数 × page_sec かかる。
+    FakeInspector.set_status でオフライン等にされている間は印刷しない（ジョブは溜まる）。
+    """
+
+    def __init__(self, fake: FakeInspector, printer_name: str, service_sec: float,
+                 page_sec: float = 0.0):
+        super().__init__(daemon=True, name=f"fake-printer:{printer_name}")
+        self.fake = fake
+        self.printer_name = printer_name
+        self.service_sec = service_sec
+        self.page_sec = page_sec
+        self.busy_sec = 0.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                healthy = self.fake.printer_status(self.printer_name).healthy
+                jobs = self.fake.jobs(self.printer_name) if healthy else []
+            except SpoolerError:
+                jobs = []
+            if jobs:
+                sec = self.service_sec + jobs[0].pages * self.page_sec
+                time.sleep(sec)
+                self.busy_sec += sec
+                try:
+                    self.fake.cancel(self.printer_name, jobs[0].job_id)
+                except SpoolerError:
+                    pass   # 印刷中に削除された
+            else:
+                with self.fake.changed:
+                    self.fake.changed.wait(0.05)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class FakeBackend(PrinterBackend):
+    """
+    投入に submit_sec、印刷に 1件 service_sec + 1ページ page_sec かかる模擬プリンタ。
+    ジョブは FakeInspector に載るので、キュー監視・変化通知・ジョブ追跡がそのまま動く。
+    speeds: {プリンタ名: 速さの倍率}。2.0 なら印刷時間が半分（プリンタプールの検証用）
+    """
+
+    name = "fake"
+
+    def __init__(self, submit_sec: float = 0.05, service_sec: float = 0.5, page_sec: float = 0.1,
+                 speeds: Optional[Dict[str, float]] = None):
+        super().__init__(FakeInspector())
+        self.submit_sec = submit_sec
+        self.service_sec = service_sec
+        self.page_sec = page_sec
+        self.speeds = dict(speeds or {})
+        self._printers = {}
+        self._lock = threading.Lock()
+
+    def capabilities(self) -> Capabilities:
+        return Capabilities(pdf=True, word=True, job_ids=True, cancel=True, batch=True)
+
+    def _printer(self, printer_name: str) -> FakePrinter:
+        with self._lock:
+            p = self._printers.get(printer_name)
+            if p is None:
+                speed = self.speeds.get(printer_name, 1.0)
+                p = FakePrinter(self.inspector, printer_name, self.service_sec / speed, self.page_sec / speed)
+                self._printers[printer_name] = p
+                p.start()
+            return p
+
+    def submit(self, printer_name: str, path: Path, kind: str = "pdf") -> Optional[int]:
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"ファイルが見つかりません: {path}")
+        self._printer(printer_name)
+        time.sleep(self.submit_sec)
+        pages = (count_pages(path) if kind == "pdf" else None) or 1
+        return self.inspector.add_job(printer_name, path.name, pages=pages, size=path.stat().st_size)
+
+    def submit_batch(self, printer_name: str, paths: List[Path]) -> List[Optional[int]]:
+        # 投入1回分の時間で、ページ数を合計した1ジョブにする
+        paths = [Path(p) for p in paths]
+        for p in paths:
+            if not p.exists():
+                raise NotSubmitted(f"ファイルが見つかりません: {p}")
+        self._printer(printer_name)
+        time.sleep(self.submit_sec)
+        pages = sum(count_pages(p) or 1 for p in paths)
+        size = sum(p.stat().st_size for p in paths)
+        job_id = self.inspector.add_job(printer_name, paths[0].name, pages=pages, size=size)
+        return [job_id] * len(paths)
+
+    def busy_sec(self, printer_name: str) -> float:
+        p = self._printers.get(printer_name)
+        return p.busy_sec if p is not None else 0.0
+
+    def close(self):
+        with self._lock:
+            printers = list(self._printers.values())
+            self._printers.clear()
+        for p in printers:
+            p.stop()
+        super().close()
+
+
+# ===== 選択 =====
+def make_backend(kind: str = "auto", *, pdftoprinter_path: Optional[Path] = None,
+                 soffice_path: Optional[Path] = None, word_worker: Optional[SofficeWorker] = None,
+                 queue_backend: str = "auto", spool_dir: Optional[Path] = None,
+                 submit_ms: float = 50, service_ms: float = 500, page_ms: float = 100,
+                 fake_speeds: Optional[Dict[str, float]] = None) -> PrinterBackend:
+    """
+    kind: "auto" / "windows" / "cups" / "directory" / "fake"
+    auto は Windows なら windows、lp があれば cups。どちらも無ければ SpoolerError
+    （模擬プリンタに黙って送って「印刷完了」にしないため。fake は明示したときだけ使う）。
+    queue_backend: windows のときのキュー問い合わせ方式（spooler.make_inspector の kind）
+    fake_speeds: fake のときのプリンタごとの速さの倍率
+    外部コマンドの時間制限は backend.timeouts（既定は TimeoutPolicy()）を差し替えて変える。
+    """
+    if kind == "auto":
+        if os.name == "nt":
+            kind = "windows"
+        elif shutil.which("lp"):
+            kind = "cups"
+        else:
+            raise SpoolerError("使えるプリンタバックエンドがありません（Windows でも lp のある環境でもありません）")
+
+    if kind == "windows":
+        if pdftoprinter_path is None:
+            raise ValueError("windows バックエンドには pdftoprinter_path が必要です")
+        return WindowsBackend(pdftoprinter_path, soffice_path, word_worker, spooler.make_inspector(queue_backend))
+    if kind == "cups":
+        return CupsBackend(soffice_path, word_worker)
+    if kind == "directory":
+        if spool_dir is None:
+            raise ValueError("directory バックエンドには spool_dir が必要です")
+        return DirectoryBackend(spool_dir)
+    if kind == "fake":
+        return FakeBackend(submit_ms / 1000, service_ms / 1000, page_ms / 1000, speeds=fake_speeds)
+    raise ValueError(f"不明なプリンタバックエンドです: {kind}")
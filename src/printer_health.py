@@ -0,0 +1,255 @@
+# printer_health.py
+# プリンタの故障検知（遮断）と予備プリンタへの切り替え
+#
+# 以前はプリンタがオフラインでもキューの問い合わせが失敗して 9999 件扱いになり、
+# wait_if_queue_full が何も言わずに待ち続けていた。
+# ここではプリンタごとに HealthMonitor が定期的に状態を見て、故障が続いたら遮断（failed）する。
+#   見るもの: プリンタの状態（オフライン・エラー・用紙切れなど / spooler.printer_status）、
+#             キューの問い合わせ失敗、ジョブのエラー状態、ジョブが stall_sec 以上進まないこと
+#   ok → (故障を failures 回続けて観測) → failed → (reset_sec 後に再確認) → probing → 正常なら ok
+# Failover は投入先を決める。遮断中のプリンタには送らず、設定した予備プリンタに回す。
+# 予備も使えなければ、どれかが戻るまで待つ（stalled）。止まっていた時間は lost_sec に足す。
+#
+# 状態の変化は subscribe した関数にイベントで渡す（進捗GUIの event_queue にそのまま入れられる）:
+#   ("printer_state", printer, state, detail)   # state: "ok" / "degraded" / "failed"
+#   ("stalled", printer, reason)                 # 使えるプリンタが無く投入が止まった
+#   ("resumed", printer, target, lost_sec)       # 投入を再開した（target に送る）
+#
+# 使い方:
+#   fo = Failover({"A": HealthMonitor("A"), "B": HealthMonitor("B")}, backups={"A": "B"})
+#   fo.start()
+#   target = fo.route("A", stop=cancel_event)    # A が遮断中なら B
+#   ...
+#   fo.stop()
+
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+
+import queue_monitor
+import spooler
+from queue_monitor import QueueSnapshot
+from spooler import SpoolerError
+
+# ジョブ状態にこれが含まれていたら故障とみなす（job_tracker と同じ考え方）
+JOB_FAULT_WORDS = ("error", "offline", "paperout", "paper_out", "blocked", "userintervention")
+
+OK = "ok"
+DEGRADED = "degraded"
+FAILED = "failed"
+PROBING = "probing"
+
+
+class HealthMonitor:
+    def __init__(self, printer_name: str, inspector: Optional[spooler.QueueInspector] = None,
+                 interval: float = 2.0, failures: int = 3, reset_sec: float = 30.0,
+                 stall_sec: float = 120.0):
+        """
+        interval: 状態を見る間隔（秒）
+        failures: 何回続けて故障を見たら遮断するか
+        reset_sec: 遮断してから再確認するまでの秒数
+        stall_sec: 印刷中でない先頭ジョブがこの秒数変わらなければ「進まない」故障とみなす（0 で見ない）
+        """
+        self.printer_name = printer_name
+        self._inspector = inspector
+        self.interval = interval
+        self.failures = max(int(failures), 1)
+        self.reset_sec = reset_sec
+        self.stall_sec = stall_sec
+
+        self.state = OK
+        self.detail = ""
+        self.consecutive = 0
+        self.first_fault_at: Optional[float] = None
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self.detect_sec = 0.0   # 最初の故障から遮断するまでにかかった時間の合計
+
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[["HealthMonitor"], None]] = []
+        self._head = None          # (job_id, status)
+        self._head_since = 0.0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def inspector(self) -> spooler.QueueInspector:
+        return self._inspector or spooler.default_inspector()
+
+    @property
+    def available(self) -> bool:
+        return self.state in (OK, DEGRADED)
+
+    def add_listener(self, callback: Callable[["HealthMonitor"], None]):
+        self._listeners.append(callback)
+
+    # ===== 起動・停止 =====
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name=f"health:{self.printer_name}")
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.probe()
+            self._stop_event.wait(self.interval)
+
+    # ===== 判定 =====
+    def check(self, now: Optional[float] = None) -> str:
+        """故障の理由（正常なら空文字）。プリンタの状態とキュー監視の最新結果から決める"""
+        now = time.monotonic() if now is None else now
+        try:
+            status = self.inspector.printer_status(self.printer_name)
+        except SpoolerError as e:
+            return f"プリンタに問い合わせできません: {e}"
+        if status.faults:
+            return ",".join(status.faults)
+
+        snap: QueueSnapshot = queue_monitor.get_monitor(self.printer_name).snapshot()
+        if not snap.ok:
+            return "キューを取得できません"
+        if snap.jobs:
+            head = snap.jobs[0]
+            if any(w in head.status.lower().replace(" ", "") for w in JOB_FAULT_WORDS):
+                return f"ジョブがエラー状態です: {head.status}"
+            # 印刷中と出ている間は大きなジョブかもしれないので数えない。遮断中も数え直す
+            key = (head.job_id, head.status)
+            if key != self._head or "printing" in head.status.lower() or not self.available:
+                self._head, self._head_since = key, now
+            elif self.stall_sec and now - self._head_since >= self.stall_sec:
+                return f"先頭のジョブが {now - self._head_since:.0f} 秒進みません"
+        else:
+            self._head = None
+        return ""
+
+    def probe(self, now: Optional[float] = None) -> str:
+        """1回確認して状態を進め、新しい状態を返す"""
+        now = time.monotonic() if now is None else now
+        fault = self.check(now)
+        with self._lock:
+            prev = self.state
+            if self.state == FAILED and now - self.opened_at >= self.reset_sec:
+                self.state = PROBING
+            if not fault:
+                self.consecutive = 0
+                self.first_fault_at = None
+                if self.state != OK:
+                    self.state, self.detail = OK, ""
+            else:
+                self.detail = fault
+                self.consecutive += 1
+                if self.first_fault_at is None:
+                    self.first_fault_at = now
+                if self.state == PROBING:
+                    # 再確認でもだめ → もう一度遮断して reset_sec 待つ
+                    self.state, self.opened_at = FAILED, now
+                elif self.state != FAILED:
+                    if self.consecutive >= self.failures:
+                        self.state, self.opened_at = FAILED, now
+                        self.trips += 1
+                        self.detect_sec += now - self.first_fault_at
+                    else:
+                        self.state = DEGRADED
+            changed = self.state != prev
+        if changed:
+            if self.state == FAILED:
+                # 空き待ちしている投入側を起こして、遮断に気づかせる
+                queue_monitor.get_monitor(self.printer_name).poke()
+            for cb in list(self._listeners):
+                try:
+                    cb(self)
+                except Exception:
+                    pass
+        return self.state
+
+
+class Failover:
+    def __init__(self, monitors: Dict[str, HealthMonitor], backups: Optional[Dict[str, str]] = None):
+        """
+        monitors: {プリンタ名: HealthMonitor}（予備プリンタの分も入れる）
+        backups: {プリンタ名: 予備のプリンタ名}。予備の予備もたどる
+        """
+        self.monitors = monitors
+        self.backups = dict(backups or {})
+        self.lost_sec = 0.0      # 使えるプリンタが無くて投入が止まっていた時間
+        self.rerouted = 0        # 予備に回した投入の数
+        self._cond = threading.Condition()
+        self._subscribers: List[Callable[[tuple], None]] = []
+        for mon in monitors.values():
+            mon.add_listener(self._on_change)
+
+    def start(self):
+        for mon in self.monitors.values():
+            mon.start()
+
+    def stop(self):
+        for mon in self.monitors.values():
+            mon.stop()
+
+    def subscribe(self, callback: Callable[[tuple], None]):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[tuple], None]):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _emit(self, ev: tuple):
+        for cb in list(self._subscribers):
+            cb(ev)
+
+    def _on_change(self, mon: HealthMonitor):
+        self._emit(("printer_state", mon.printer_name, mon.state, mon.detail))
+        with self._cond:
+            self._cond.notify_all()
+
+    # ===== 投入先 =====
+    def available(self, printer: str) -> bool:
+        mon = self.monitors.get(printer)
+        return mon is None or mon.available
+
+    def chain(self, printer: str) -> List[str]:
+        """printer とその予備（予備の予備…）"""
+        names = [printer]
+        while self.backups.get(names[-1]) and self.backups[names[-1]] not in names:
+            names.append(self.backups[names[-1]])
+        return names
+
+    def pick(self, printer: str) -> Optional[str]:
+        """待たずに決める。使えるものが無ければ None"""
+        for name in self.chain(printer):
+            if self.available(name):
+                return name
+        return None
+
+    def route(self, printer: str, stop: Optional[threading.Event] = None) -> Optional[str]:
+        """
+        printer に送る分の実際の投入先。遮断中なら予備。
+        全部遮断中なら戻るまで待つ（stalled）。stop が立ったら None。
+        """
+        target = self.pick(printer)
+        if target is not None:
+            if target != printer:
+                self.rerouted += 1
+            return target
+
+        mon = self.monitors.get(printer)
+        self._emit(("stalled", printer, mon.detail if mon is not None else ""))
+        t0 = time.monotonic()
+        with self._cond:
+            while target is None:
+                if stop is not None and stop.is_set():
+                    break
+                self._cond.wait(0.5)
+                target = self.pick(printer)
+        lost = time.monotonic() - t0
+        self.lost_sec += lost
+        self._emit(("resumed", printer, target, lost))
+        if target is not None and target != printer:
+            self.rerouted += 1
+        return target
@@ -0,0 +1,133 @@
+# printer_pool.py
+# 複数プリンタへの振り分け（プリンタプール）
+#
+# config.json の "printer_pool" に複数のプリンタを並べると、利用者フォルダ単位で
+# 「いちばん早く印刷し終わりそうなプリンタ」に振り分けて並列に投入する。
+# フォルダの中身は1台にまとめて元の順番どおりに出すので、紙の束は崩れない。
+#
+# 終わりそうな時刻の見積もり:
+#   (そのプリンタに振り分け済みで未投入のページ数 + スプールに並んでいるページ数 + このフォルダのページ数)
+#   ÷ 印刷速度（ページ/秒）
+# 印刷速度は autotune（QueueTuner）が実測した値を優先し、
+# まだ測れていなければ前回保存した値、それも無ければ default_rate × weight（設定の速さの比）を使う。
+#
+# 振り分けは1フォルダずつ行い、どれかのプリンタの未投入フォルダが max_pending 未満になるまで待つ。
+# 振り分け先は未投入フォルダが max_pending 未満のプリンタから選ぶ（見積もりが同じなら並べた順）。
+# 先に全部を決めてしまわないので、実測した速度が途中で変わっても後半の振り分けに効く。
+# スプールの状態（queue_monitor）と実測の速度はロックを取る前に読む（監視や autotune の処理を待たない）。
+#
+# 使い方:
+#   pool = PrinterPool([PoolPrinter("A", weight=1), PoolPrinter("B", weight=2)])
+#   printer = pool.choose(pages)      # 空きを待って振り分け先を決める（未投入として数える）
+#   ... printer.name に投入 ...
+#   pool.finished(printer, pages)     # 投入し終わった
+
+import threading
+from typing import List, Optional
+
+import queue_monitor
+from autotune import QueueTuner
+
+
+class PoolPrinter:
+    def __init__(self, name: str, weight: float = 1.0, rate: float = 0.0,
+                 tuner: Optional[QueueTuner] = None):
+        """
+        weight: 他のプリンタと比べた速さ（実測が無い間の見積もりに使う）
+        rate: 前回までに学習した印刷速度（ページ/秒）。0 なら未学習
+        tuner: このプリンタの QueueTuner（実測した速度を読む）
+        """
+        self.name = name
+        self.weight = float(weight)
+        self.saved_rate = float(rate)
+        self.tuner = tuner
+        self.pending_folders = 0
+        self.pending_pages = 0
+        self.assigned_folders = 0
+        self.assigned_pages = 0
+
+
+class PrinterPool:
+    def __init__(self, printers: List[PoolPrinter], default_rate: float = 0.2, max_pending: int = 2):
+        """
+        default_rate: 速度を1度も測っていないプリンタの見積もり（weight=1 のときのページ/秒）
+        max_pending: 1台に先回りして振り分けておくフォルダ数
+        """
+        if not printers:
+            raise ValueError("プリンタが1台もありません")
+        self.printers = list(printers)
+        self.default_rate = default_rate
+        self.max_pending = max(int(max_pending), 1)
+        self._cond = threading.Condition(threading.RLock())
+
+    @property
+    def names(self) -> List[str]:
+        return [p.name for p in self.printers]
+
+    def get(self, name: str) -> PoolPrinter:
+        for p in self.printers:
+            if p.name == name:
+                return p
+        raise KeyError(name)
+
+    # ===== 見積もり =====
+    def rate(self, p: PoolPrinter) -> float:
+        """印刷速度（ページ/秒）。実測 → 保存値 → weight の順"""
+        if p.tuner is not None and p.tuner.rate > 0:
+            return p.tuner.rate
+        if p.saved_rate > 0:
+            return p.saved_rate
+        return self.default_rate * max(p.weight, 0.01)
+
+    def queued_pages(self, p: PoolPrinter) -> int:
+        """スプールに並んでいるページ数（他の人のジョブも含む）"""
+        snap = queue_monitor.get_monitor(p.name).snapshot()
+        if not snap.ok:
+            return 0
+        return sum(j.pages or 1 for j in snap.jobs)
+
+    def estimate(self, p: PoolPrinter, pages: int) -> float:
+        """pages を追加したら何秒後に印刷し終わるか"""
+        return (p.pending_pages + self.queued_pages(p) + pages) / self.rate(p)
+
+    def _observe(self):
+        """プリンタごとの (スプールのページ数, 印刷速度)。ロックの外で読む"""
+        return {p.name: (self.queued_pages(p), self.rate(p)) for p in self.printers}
+
+    # ===== 振り分け =====
+    def choose(self, pages: int, stop: Optional[threading.Event] = None) -> Optional[PoolPrinter]:
+        """
+        どれかのプリンタの未投入フォルダが max_pending 未満になるまで待ち、
+        いちばん早く終わるプリンタに振り分ける。stop が立ったら None。
+        """
+        pages = max(int(pages), 1)
+        while True:
+            seen = self._observe()
+            with self._cond:
+                free = [p for p in self.printers if p.pending_folders < self.max_pending]
+                if free:
+                    def eta(p: PoolPrinter) -> float:
+                        queued, rate = seen[p.name]
+                        return (p.pending_pages + queued + pages) / rate
+                    return self.assign(min(free, key=eta), pages)
+                if stop is not None and stop.is_set():
+                    return None
+                self._cond.wait(0.2)
+
+    def assign(self, p: PoolPrinter, pages: int) -> PoolPrinter:
+        """p に振り分けたことにする（見積もりを使わず振り分け先を決めた場合も）"""
+        pages = max(int(pages), 1)
+        with self._cond:
+            p.pending_folders += 1
+            p.pending_pages += pages
+            p.assigned_folders += 1
+            p.assigned_pages += pages
+        return p
+
+    def finished(self, p: PoolPrinter, pages: int):
+        """振り分けたフォルダを投入し終わった（スプール側のページ数に移る）"""
+        pages = max(int(pages), 1)
+        with self._cond:
+            p.pending_folders -= 1
+            p.pending_pages -= pages
+            self._cond.notify_all()
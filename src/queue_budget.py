@@ -0,0 +1,172 @@
+# queue_budget.py
+# ページ数・バイト数で印刷キューの投入量を制限する
+#
+# 従来の wait_if_queue_full は「ジョブ数 < queue_limit」だけで判定していたので、
+# 80ページのPDFも1ページの表紙も同じ1件として数えていた。
+#   - queue_limit を小さくする → 1〜2ページの報告書が続くと投入待ちの間にプリンタが遊ぶ
+#   - queue_limit を大きくする → 大きなスキャンPDFでスプールが膨れ、中止しても止まらない
+# ここでは「印刷中の先頭ジョブの後ろに並んでいる総ページ数（と総バイト数）」を予算として持ち、
+# 予算内に収まる間は続けて投入する。後ろに何も並んでいなければ予算を超える1件でも投入する。
+#
+# ページ数はスプーラが返す値（JobInfo.pages / size）を優先し、
+# スプール中で 0 のうちは投入時に pdf_info で数えた値を使う。
+# 投入直後でまだキューに現れていないジョブも、unseen_grace_sec の間は数に入れる。
+#
+# 使い方:
+#   budget = QueueBudget(max_pages=20)
+#   budget.acquire(monitor, "a.pdf", pages=12, size=80_000)   # 空きを待って予約
+#   print_func(path)
+
+import time
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from queue_monitor import QueueMonitor, QueueSnapshot
+from spooler import PrinterUnavailable, document_matches
+
+
+class _Pending:
+    def __init__(self, document: str, pages: int, size: int, reserved_at: float):
+        self.document = document
+        self.pages = pages
+        self.size = size
+        self.reserved_at = reserved_at
+        self.job_id: Optional[int] = None
+
+
+class QueueBudget:
+    def __init__(self, max_jobs: int = 0, max_pages: int = 0, max_bytes: int = 0,
+                 default_pages: int = 1, unseen_grace_sec: float = 3.0):
+        """
+        max_jobs / max_pages / max_bytes: キュー内の上限（0 はその項目を見ない）
+            max_jobs は wait_if_queue_full の queue_limit と同じ意味で、
+            「印刷中の1件しか無ければ予算を超えても流す」より先に判定する（1 ならキューが空になるまで待つ）
+        default_pages: ページ数が分からないジョブ（他の人のジョブ等）を何ページとみなすか
+        """
+        self.max_jobs = max_jobs
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.default_pages = default_pages
+        self.unseen_grace_sec = unseen_grace_sec
+
+        self.blocked = 0                 # 予算オーバーで待たされた acquire の回数（1回の待ちで1）
+        self.held_at = float("-inf")     # 最後に投入を待たせた問い合わせの時刻（autotune が見る）
+
+        self._lock = threading.Lock()
+        self._pending: List[_Pending] = []
+
+    def _alive(self, p: _Pending, current: set, now: float) -> bool:
+        if p.job_id is not None:
+            return p.job_id in current
+        return now - p.reserved_at < self.unseen_grace_sec
+
+    def _cost(self, info, mine: Optional[_Pending] = None) -> Tuple[int, int]:
+        """キュー内のジョブ1件の (ページ数, バイト数)。スプーラの値が 0 の間は投入時の値で補う"""
+        if mine is None:
+            mine = next((p for p in self._pending if p.job_id == info.job_id), None)
+        if mine is not None:
+            return info.pages or mine.pages, max(info.size, mine.size)
+        return info.pages or self.default_pages, info.size
+
+    def in_flight(self, snap: QueueSnapshot) -> Tuple[int, int, int]:
+        """キュー内（と投入直後）の (ジョブ数, ページ数, バイト数)"""
+        with self._lock:
+            current = {j.job_id for j in snap.jobs}
+            # キューから消えたもの・現れないまま猶予を過ぎたものは外す
+            self._pending = [p for p in self._pending if self._alive(p, current, snap.timestamp)]
+            bound = {p.job_id: p for p in self._pending if p.job_id is not None}
+
+            jobs = pages = size = 0
+            for info in snap.jobs:
+                mine = bound.get(info.job_id)
+                if mine is None:
+                    for p in self._pending:
+                        if p.job_id is None and p.reserved_at <= snap.timestamp \
+                                and document_matches(p.document, info.document):
+                            p.job_id = info.job_id
+                            bound[info.job_id] = mine = p
+                            break
+                jobs += 1
+                p_pages, p_size = self._cost(info, mine)
+                pages += p_pages
+                size += p_size
+
+            for p in self._pending:
+                if p.job_id is None:
+                    jobs += 1
+                    pages += p.pages
+                    size += p.size
+            return jobs, pages, size
+
+    def admits(self, snap: QueueSnapshot, pages: int, size: int) -> bool:
+        if not snap.ok:
+            return False
+        jobs, queued_pages, queued_size = self.in_flight(snap)
+        if self.max_jobs and jobs and jobs + 1 > self.max_jobs:
+            # ジョブ数の上限は従来の queue_limit と同じ意味（1 ならキューが空になるまで待つ）
+            return False
+        if jobs <= 1:
+            # 印刷中の1件の後ろに何も無ければ、予算より大きくても流す
+            # （でないと大きなPDFは永久に待ち、印刷中の1件が終わるたびにプリンタが遊ぶ）
+            return True
+        if snap.jobs:
+            # 予算は印刷中の先頭ジョブの「後ろに並んでいる分」で数える
+            with self._lock:
+                head_pages, head_size = self._cost(snap.jobs[0])
+            queued_pages -= head_pages
+            queued_size -= head_size
+        if (self.max_pages and queued_pages + pages > self.max_pages) \
+                or (self.max_bytes and queued_size + size > self.max_bytes):
+            return False
+        return True
+
+    def hold(self, snap: QueueSnapshot):
+        """snap の時点で投入を待たせた（admits が False だった）ことを記録する"""
+        with self._lock:
+            self.held_at = max(self.held_at, snap.timestamp)
+
+    def job_pages(self, info) -> int:
+        """キュー内のジョブ1件のページ数（スプーラの値が 0 の間は投入時に数えた値）"""
+        with self._lock:
+            return self._cost(info)[0]
+
+    def reserve(self, document: str, pages: int, size: int = 0, now: Optional[float] = None):
+        """これから投入する分を予約する（acquire を使わず自分で判定した場合）"""
+        with self._lock:
+            self._pending.append(_Pending(document, pages, size, time.monotonic() if now is None else now))
+
+    def acquire(self, monitor: QueueMonitor, document: str,
+                pages: Optional[int] = None, size: int = 0, timeout: Optional[float] = None,
+                abort: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        予算に空きができるまで待ってから、これから投入する分を予約する。
+        呼び出し後に取れた新しい状態で判定する（直前に投入したジョブを見落とさないため）。
+        timeout 内に空かなければ予約せず False。
+        abort() が True になったら（プリンタが遮断された等）待つのをやめて PrinterUnavailable。
+        """
+        pages = pages or self.default_pages
+        since = time.monotonic()
+        held = False
+
+        def ready(s: QueueSnapshot) -> bool:
+            nonlocal held
+            if abort is not None and abort():
+                return True
+            if s.timestamp < since:
+                return False
+            if self.admits(s, pages, size):
+                return True
+            self.hold(s)
+            if not held:
+                held = True
+                with self._lock:
+                    self.blocked += 1
+            return False
+
+        snap = monitor.wait_until(ready, timeout=timeout)
+        if abort is not None and abort():
+            raise PrinterUnavailable(f"プリンタが使えません: {monitor.printer_name}")
+        if snap is None or snap.timestamp < since or not self.admits(snap, pages, size):
+            return False
+        self.reserve(document, pages, size)
+        return True
@@ -0,0 +1,231 @@
+# queue_monitor.py
+# プリンタごとに1つだけ動く印刷キュー監視サービス
+#
+# 以前は投入側（module1.wait_if_queue_full）と進捗GUIがそれぞれ別々に
+# 同じプリンタのキューを問い合わせていた。ここでは監視スレッドをプリンタごとに1本にし、
+# 最新のジョブ数・ジョブ一覧を時刻つきで保持して、両方がそれを読む／購読する。
+#
+# 問い合わせ間隔は状態に応じて変える:
+#   - キューが変化した / 空き待ちをしている人がいる → min_interval（autotune が印刷速度に合わせて変える）
+#   - 変化なし → 1.5倍ずつ伸ばして max_interval まで
+# スプーラの変化通知（spooler.ChangeNotifier）が使える場合は、通知を受けた瞬間に問い合わせ直す。
+# その場合、待っている人がいない間の一定間隔の問い合わせは取りこぼし対策の保険になる
+# （通知は合わせて1回になったり、プリンタの状態の変化では来なかったりするので、保険は backstop_interval まで）。
+#
+# 使い方:
+#   mon = queue_monitor.get_monitor(printer_name)
+#   snap = mon.snapshot()                   # 最新の状態
+#   mon.wait_until(lambda s: s.depth < 3)   # 条件を満たすまで待つ
+#   mon.subscribe(callback)                 # 問い合わせごとに callback(snapshot)
+
+import time
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import spooler
+from spooler import ChangeNotifier, JobInfo, QueueInspector
+
+# 問い合わせ失敗時のジョブ数（安全側に倒して「多い」扱い）
+UNKNOWN_DEPTH = 9999
+
+
+class QueueSnapshot(NamedTuple):
+    depth: int
+    jobs: List[JobInfo]
+    timestamp: float   # time.monotonic()
+    ok: bool           # 問い合わせに成功したか
+
+    @property
+    def empty(self) -> bool:
+        return self.ok and self.depth == 0
+
+
+class QueueMonitor:
+    def __init__(self, printer_name: str, inspector: Optional[QueueInspector] = None,
+                 min_interval: float = 0.3, max_interval: float = 5.0,
+                 notifier: Optional[ChangeNotifier] = None, backstop_interval: float = 2.0):
+        """backstop_interval: 変化通知があるときの、保険の問い合わせ間隔の上限"""
+        self.printer_name = printer_name
+        self._inspector = inspector
+        self.notifier = notifier
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backstop_interval = backstop_interval
+        self.interval = min_interval
+
+        self._cond = threading.Condition()
+        self._snapshot: Optional[QueueSnapshot] = None
+        self._subscribers: List[Callable[[QueueSnapshot], None]] = []
+        self._waiters = 0
+        self._poke = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._notify_thread: Optional[threading.Thread] = None
+        self.polls = 0
+        self.notifications = 0
+
+    @property
+    def inspector(self) -> QueueInspector:
+        return self._inspector or spooler.default_inspector()
+
+    # ===== 起動・停止 =====
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"queue-monitor:{self.printer_name}")
+        self._thread.start()
+        if self.notifier is not None:
+            self._notify_thread = threading.Thread(
+                target=self._run_notifier, daemon=True, name=f"queue-notify:{self.printer_name}"
+            )
+            self._notify_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._poke.set()
+        for t in (self._thread, self._notify_thread):
+            if t is not None:
+                t.join(timeout=5)
+        self._thread = None
+        self._notify_thread = None
+        if self.notifier is not None:
+            self.notifier.close()
+
+    # ===== 監視ループ =====
+    def poll(self) -> QueueSnapshot:
+        """1回問い合わせて結果を反映する（監視スレッド以外から呼んでも良い）"""
+        try:
+            jobs = self.inspector.jobs(self.printer_name)
+            snap = QueueSnapshot(len(jobs), jobs, time.monotonic(), True)
+        except Exception:
+            snap = QueueSnapshot(UNKNOWN_DEPTH, [], time.monotonic(), False)
+
+        with self._cond:
+            prev = self._snapshot
+            self._snapshot = snap
+            self.polls += 1
+            changed = prev is None or prev.ok != snap.ok or \
+                [j.job_id for j in prev.jobs] != [j.job_id for j in snap.jobs]
+            if changed or self._waiters:
+                # 空き待ちの間は min_interval（autotune が調整した間隔）で問い合わせる
+                # （通知はジョブの増減でしか来ないことがあり、印刷の進み具合は問い合わせないと分からない）
+                self.interval = self.min_interval
+            elif self._notify_thread is not None and self._notify_thread.is_alive():
+                # 通知で起きられるので、定期問い合わせは保険。取りこぼしが長引かないよう短めで止める
+                self.interval = min(self.interval * 1.5, self.max_interval, self.backstop_interval)
+            else:
+                self.interval = min(self.interval * 1.5, self.max_interval)
+            subscribers = list(self._subscribers)
+            self._cond.notify_all()
+
+        for cb in subscribers:
+            try:
+                cb(snap)
+            except Exception:
+                pass
+        return snap
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.poll()
+            self._poke.wait(self.interval)
+            self._poke.clear()
+
+    def _run_notifier(self):
+        # 通知待ちは短めのタイムアウトで区切り、停止要求に反応できるようにする
+        while not self._stop_event.is_set():
+            try:
+                if self.notifier.wait(1.0):
+                    self.notifications += 1
+                    self._poke.set()
+            except Exception:
+                # 通知が使えなくなったら問い合わせだけで続ける
+                return
+
+    def poke(self):
+        """すぐに問い合わせ直させる（投入直後など）"""
+        with self._cond:
+            self.interval = self.min_interval
+        self._poke.set()
+
+    # ===== 利用側 =====
+    def snapshot(self) -> QueueSnapshot:
+        """最新の状態。まだ一度も問い合わせていなければその場で問い合わせる"""
+        with self._cond:
+            snap = self._snapshot
+        return snap if snap is not None else self.poll()
+
+    def subscribe(self, callback: Callable[[QueueSnapshot], None]):
+        with self._cond:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[QueueSnapshot], None]):
+        with self._cond:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def wait_until(self, predicate: Callable[[QueueSnapshot], bool],
+                   timeout: Optional[float] = None) -> QueueSnapshot:
+        """
+        predicate(snapshot) が True になるまで待つ。新しい問い合わせ結果ごとに判定する。
+        timeout を過ぎたらその時点の状態を返す。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.start()
+        with self._cond:
+            self._waiters += 1
+            try:
+                if self._waiters == 1:
+                    # 待ち始めたら間隔を詰める
+                    self.interval = self.min_interval
+                    self._poke.set()
+                while True:
+                    snap = self._snapshot
+                    if snap is not None and predicate(snap):
+                        return snap
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return snap
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+
+# ===== プリンタごとの共有インスタンス =====
+_monitors: Dict[str, QueueMonitor] = {}
+_monitors_lock = threading.Lock()
+_settings = {"min_interval": 0.3, "max_interval": 5.0, "notify": True}
+
+
+def configure(min_interval: float, max_interval: float, notify: bool = True):
+    """これから作る監視の問い合わせ間隔と、変化通知を使うかを設定する"""
+    _settings["min_interval"] = min_interval
+    _settings["max_interval"] = max(max_interval, min_interval)
+    _settings["notify"] = notify
+
+
+def get_monitor(printer_name: str) -> QueueMonitor:
+    """プリンタの監視サービスを返す（無ければ作って開始する）"""
+    with _monitors_lock:
+        mon = _monitors.get(printer_name)
+        if mon is None:
+            notifier = None
+            if _settings["notify"]:
+                notifier = spooler.make_notifier(spooler.default_inspector(), printer_name)
+            mon = QueueMonitor(
+                printer_name,
+                min_interval=_settings["min_interval"],
+                max_interval=_settings["max_interval"],
+                notifier=notifier,
+            )
+            _monitors[printer_name] = mon
+            mon.start()
+        return mon
+
+
+def stop_all():
+    with _monitors_lock:
+        monitors = list(_monitors.values())
+        _monitors.clear()
+    for mon in monitors:
+        mon.stop()
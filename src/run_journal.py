@@ -0,0 +1,177 @@
+# run_journal.py
+# 印刷実行の記録（クラッシュしても残る追記式ジャーナル）と、途中からの再開
+#
+# 400件の一括印刷の150件目で PC がスリープしたり exe が落ちたりすると、
+# 以前はもう一度 main() を走らせて全部印刷し直すか、選択GUIで印刷済みを手で外すしかなかった。
+# ここでは1回の実行を JSON Lines のファイル1つに追記していく。1行ごとに fsync するので、
+# 電源が落ちても書き終わった行までは残る（書きかけの最後の1行は読むときに捨てる）。
+#
+#   {"ev": "run", "id": ..., "started": ..., "items": [[kind, path, fname], ...], "meta": {...}}
+#   {"ev": "item", "i": 番号, "s": "prepared" / "submitted" / "completed" / "failed", "t": 時刻}
+#   {"ev": "end", "status": "done" / "cancelled", "t": 時刻}
+#
+# 項目の状態は queued（記録なし）→ prepared → submitted → completed（失敗は failed）。
+# "end" の無いファイルは途中で終わった実行なので、次の起動で再開を提案する。
+# 失敗した項目が残った実行にも "end"（done）は書かない（次の起動で失敗した分の再開を提案する）。
+# 再開するのは submitted に届かなかった項目だけ（スプーラに渡した分はもう一度印刷しない）。
+# submitted の記録は投入が返ってから書くので、その間に落ちた1件は再開でもう一度印刷されうる。
+#
+# 使い方:
+#   unfinished = run_journal.load_unfinished(path)       # 途中で終わった実行（無ければ None）
+#   if unfinished and ...: selected = unfinished.remaining
+#   journal = RunJournal.create(path, selected, meta={...})
+#   journal.mark(idx, "submitted")
+#   journal.finish("done")
+
+import os
+import json
+import time
+import uuid
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+QUEUED = "queued"
+PREPARED = "prepared"
+SUBMITTED = "submitted"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# 状態は進む方向にだけ変える（後から来た「準備済み」などで戻さない）
+_RANK = {QUEUED: 0, PREPARED: 1, FAILED: 2, SUBMITTED: 3, COMPLETED: 4}
+
+
+def _advances(prev: str, state: str) -> bool:
+    # 失敗は印刷完了以外を上書きする（予備プリンタへの投入し直しに失敗した分は submitted から戻る）
+    if state == FAILED:
+        return prev != COMPLETED
+    return _RANK[state] > _RANK[prev]
+
+
+class RunJournal:
+    def __init__(self, path: Path, run_id: str, items: List[Tuple[str, Path, str]]):
+        self.path = Path(path)
+        self.run_id = run_id
+        self.items = items
+        self.states: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    @classmethod
+    def create(cls, path: Path, items: List[Tuple[str, Path, str]], meta: Optional[dict] = None) -> "RunJournal":
+        """新しい実行を始める（前の実行の記録は置き換える）"""
+        path = Path(path)
+        run_id = uuid.uuid4().hex
+        header = {
+            "ev": "run", "id": run_id, "started": time.time(),
+            "items": [[kind, str(p), fname] for kind, p, fname in items],
+            "meta": meta or {},
+        }
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)   # 書きかけのヘッダで前の記録を壊さない
+        return cls(path, run_id, list(items))
+
+    def _write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._f.closed:
+                return
+            self._f.write(line)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def mark(self, idx: int, state: str):
+        """idx 番目の項目が state になった（後戻りする記録は書かない。失敗は何度でも書く）"""
+        with self._lock:
+            if not _advances(self.states.get(idx, QUEUED), state):
+                return
+            self.states[idx] = state
+        self._write({"ev": "item", "i": idx, "s": state, "t": time.time()})
+
+    def pending(self) -> List[int]:
+        """スプーラに渡せなかった項目の番号（準備まで・失敗・中止で残ったもの）"""
+        return [i for i in range(len(self.items)) if self.states.get(i, QUEUED) not in (SUBMITTED, COMPLETED)]
+
+    def finish(self, status: str):
+        """実行が終わった（"done" / "cancelled"）。これがあれば再開の対象にしない"""
+        self._write({"ev": "end", "status": status, "t": time.time()})
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if not self._f.closed:
+                self._f.close()
+
+
+class UnfinishedRun:
+    def __init__(self, run_id: str, started: float, items: List[Tuple[str, Path, str]],
+                 states: Dict[int, str], meta: dict):
+        self.run_id = run_id
+        self.started = started
+        self.items = items
+        self.states = states
+        self.meta = meta
+
+    def state(self, idx: int) -> str:
+        return self.states.get(idx, QUEUED)
+
+    @property
+    def remaining(self) -> List[Tuple[str, Path, str]]:
+        """submitted に届かなかった項目（再開で投入し直す分）。元の順番のまま"""
+        return [it for i, it in enumerate(self.items) if self.state(i) in (QUEUED, PREPARED, FAILED)]
+
+    @property
+    def in_spool(self) -> List[Tuple[str, Path, str]]:
+        """投入したが印刷完了を確認できていない項目（スプーラに残っているか、もう印刷済み）"""
+        return [it for i, it in enumerate(self.items) if self.state(i) == SUBMITTED]
+
+    def counts(self) -> Dict[str, int]:
+        out = {s: 0 for s in _RANK}
+        for i in range(len(self.items)):
+            out[self.state(i)] += 1
+        return out
+
+
+def load_unfinished(path: Path) -> Optional[UnfinishedRun]:
+    """途中で終わった（"end" が無い）実行を読む。無い・終わっている・壊れている場合は None"""
+    path = Path(path)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+
+    header = None
+    states: Dict[int, str] = {}
+    for n, line in enumerate(lines):
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue   # 落ちたときの書きかけの行
+        if n == 0:
+            if rec.get("ev") != "run":
+                return None
+            header = rec
+        elif rec.get("ev") == "item" and rec.get("s") in _RANK:
+            i, s = int(rec["i"]), rec["s"]
+            if _advances(states.get(i, QUEUED), s):
+                states[i] = s
+        elif rec.get("ev") == "end":
+            return None
+    if header is None:
+        return None
+    items = [(kind, Path(p), fname) for kind, p, fname in header.get("items", [])]
+    return UnfinishedRun(header.get("id", ""), float(header.get("started", 0)), items, states,
+                         header.get("meta", {}))
+
+
+def discard(path: Path):
+    """再開しないことにした記録を消す"""
+    try:
+        Path(path).unlink()
+    except OSError:
+        pass
@@ -0,0 +1,246 @@
+# scan_index.py
+# 走査結果の永続インデックス（SQLite / WAL）
+#
+# parent_folder 配下の数千フォルダのうち、日々変わるのは数十フォルダ程度。
+# 各サブフォルダのディレクトリ更新時刻と、中の PDF / Word の
+# パス・サイズ・更新時刻・種別を config.json の隣の DB に記録しておき、
+# 起動時はディレクトリ更新時刻が変わったサブフォルダだけ再列挙する。
+# 日付での絞り込みは DB への問い合わせで答える（更新時刻の索引 idx_files_kind_mtime を範囲で引く）。
+# 「前回の印刷以降すべて」（scanner.TimeRange.since）も同じ範囲の問い合わせなので、
+# 共有全体の大きさではなく、その間に変わった分に比例した時間で答えが出る。
+#
+# 注意: ディレクトリの更新時刻はファイルの追加・削除・リネームで変わるが、
+# 既存ファイルを「その場で上書き」しただけでは変わらないことがある。
+# 上書き保存しかしない運用のフォルダがある場合は refresh(full=True) で全走査する。
+# full_every_sec を渡すと、前回の全走査からその秒数が経っていれば refresh が自動で全走査にする
+# （config.json の scan_index_full_hours。上書きを取りこぼすのは最長でもその間だけになる）。
+# 「前回の印刷以降」では、その間に前回の印刷の時刻が上書きより後に進むと、次の全走査でも対象にならない。
+# 上書き運用のフォルダがあるなら scan_index_full_since で差分モードを毎回全走査にできる
+# （その場合は共有全体の大きさに比例した時間がかかる）。
+
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple, Union
+
+import scanner
+from scanner import TimeRange, as_range
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS folders (
+    name     TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    folder TEXT NOT NULL,
+    name   TEXT NOT NULL,
+    kind   TEXT NOT NULL,      -- "pdf" / "word"
+    size   INTEGER NOT NULL,
+    mtime  REAL NOT NULL,
+    PRIMARY KEY (folder, name)
+);
+CREATE INDEX IF NOT EXISTS idx_files_kind_mtime ON files (kind, mtime);
+"""
+
+
+def _normcase_collation(a: str, b: str) -> int:
+    # scanner と同じ並び順（Path 比較と同じ）にする
+    a, b = os.path.normcase(a), os.path.normcase(b)
+    return (a > b) - (a < b)
+
+
+class ScanIndex:
+    """
+    サブフォルダ走査結果のキャッシュ。
+
+    使い方:
+        index = ScanIndex(base_dir() / "scan_index.sqlite3")
+        index.refresh(parent_folder)
+        targets, no_word_folder = index.collect_targets(parent_folder, target_date)
+
+        # 逐次版（再列挙しながらフォルダ1つ分ずつ返す。初回の全走査でも届いた分から使える）
+        for name, folder_targets, no_word in index.iter_targets(parent_folder, target_date):
+            ...
+    """
+
+    def __init__(self, db_path: Path, full_every_sec: float = 0.0):
+        """full_every_sec: 前回の全走査からこの秒数が経っていたら refresh を全走査にする（0 はしない）"""
+        self.db_path = Path(db_path)
+        self.full_every_sec = full_every_sec
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.create_collation("normcase", _normcase_collation)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # ===== 更新 =====
+    def _check_parent(self, parent_folder: Path):
+        # 親フォルダが変わったら中身は使えないので作り直す
+        parent = str(Path(parent_folder).resolve())
+        row = self.conn.execute("SELECT value FROM meta WHERE key='parent_folder'").fetchone()
+        if row and row[0] == parent:
+            return
+        with self.conn:
+            self.conn.execute("DELETE FROM files")
+            self.conn.execute("DELETE FROM folders")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('parent_folder', ?)", (parent,)
+            )
+
+    def _store_folder(self, mtime_ns: int, scan: scanner.FolderScan):
+        self.conn.execute("DELETE FROM files WHERE folder=?", (scan.name,))
+        rows = [(scan.name, f.name, "pdf", f.size, f.mtime) for f in scan.pdfs]
+        rows += [(scan.name, f.name, "word", f.size, f.mtime) for f in scan.words]
+        self.conn.executemany(
+            "INSERT INTO files (folder, name, kind, size, mtime) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO folders (name, mtime_ns) VALUES (?, ?)", (scan.name, mtime_ns)
+        )
+
+    def _plan(self, parent_folder: Path, full: bool):
+        """
+        サブフォルダを列挙して、再列挙するものを決める（消えたサブフォルダはここで削除する）。
+        戻り値: (全サブフォルダ, {再列挙するフォルダ名: ディレクトリ更新時刻}, 全走査か, 今の時刻)
+        """
+        self._check_parent(parent_folder)
+        known = dict(self.conn.execute("SELECT name, mtime_ns FROM folders"))
+        now = time.time()
+        if not full and self.full_every_sec > 0:
+            row = self.conn.execute("SELECT value FROM meta WHERE key='full_refreshed_at'").fetchone()
+            full = row is None or now - float(row[0]) >= self.full_every_sec
+
+        subs = scanner.list_subfolders(parent_folder)
+        changed = {}
+        for sub in subs:
+            mtime_ns = sub.stat().st_mtime_ns
+            if full or known.get(sub.name) != mtime_ns:
+                changed[sub.name] = mtime_ns
+
+        with self.conn:
+            for name in set(known) - {sub.name for sub in subs}:
+                self.conn.execute("DELETE FROM files WHERE folder=?", (name,))
+                self.conn.execute("DELETE FROM folders WHERE name=?", (name,))
+        return subs, changed, full, now
+
+    def _mark_full(self, now: float):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('full_refreshed_at', ?)", (str(now),)
+            )
+
+    def refresh(self, parent_folder: Path, full: bool = False, workers: int = 1) -> int:
+        """
+        ディレクトリ更新時刻が変わったサブフォルダだけ再列挙する。
+        消えたサブフォルダは削除する。戻り値は再列挙したフォルダ数。
+        full=True か、前回の全走査から full_every_sec 経っていれば全サブフォルダを再列挙する。
+        workers > 1 なら再列挙をスレッドプールで並列に行う。
+        """
+        parent_folder = Path(parent_folder)
+        with self._lock:
+            subs, changed, full, now = self._plan(parent_folder, full)
+            paths = [Path(sub.path) for sub in subs if sub.name in changed]
+            with self.conn:
+                for scan in scanner.scan_folders(paths, workers, stat_words=True):
+                    self._store_folder(changed[scan.name], scan)
+            if full:
+                self._mark_full(now)
+            return len(changed)
+
+    # ===== 問い合わせ =====
+    def collect_targets(self, parent_folder: Path,
+                        target_date: Union[datetime, TimeRange]) -> Tuple[List[Tuple[str, Path, str]], List[str]]:
+        """
+        module1.collect_targets と同じ仕様・戻り値を DB から答える。
+        target_date は日付か TimeRange（前回の印刷以降など）。
+        """
+        parent_folder = Path(parent_folder)
+        with self._lock:
+            folders = self._query(as_range(target_date))
+
+        targets: List[Tuple[str, Path, str]] = []
+        no_word_folder: List[str] = []
+        for folder, (pdfs, words) in folders.items():
+            folder_targets, no_word = self._folder_targets(parent_folder, folder, pdfs, words)
+            targets += folder_targets
+            if no_word:
+                no_word_folder.append(folder)
+
+        return targets, no_word_folder
+
+    def iter_targets(self, parent_folder: Path, target_date: Union[datetime, TimeRange],
+                     full: bool = False,
+                     workers: int = 1) -> Iterator[Tuple[str, List[Tuple[str, Path, str]], bool]]:
+        """
+        refresh + collect_targets の逐次版（scanner.iter_targets と同じ形・同じ並びで全フォルダを返す）。
+        変わっていないフォルダは DB から、変わったフォルダは再列挙しながら、フォルダ1つ分ずつ返す。
+        インデックスが空（初回）や全走査でも、走査し終わったフォルダから返せる。
+        途中でやめたら、そこまで再列挙したフォルダだけ DB に残る（全走査の時刻は進めない）。
+        """
+        parent_folder = Path(parent_folder)
+        period = as_range(target_date)
+        with self._lock:
+            subs, changed, full, now = self._plan(parent_folder, full)
+            # 変わっていないフォルダの答えは、再列挙で DB を書き換える前に引いておく
+            folders = self._query(period)
+
+        scans = scanner.scan_folders([Path(sub.path) for sub in subs if sub.name in changed],
+                                     workers, stat_words=True)
+        try:
+            for sub in subs:
+                if sub.name in changed:
+                    scan = next(scans)
+                    with self._lock, self.conn:
+                        self._store_folder(changed[sub.name], scan)
+                    yield (sub.name, *scanner.select_from_scan(scan, period))
+                else:
+                    pdfs, words = folders.get(sub.name, ([], []))
+                    yield (sub.name, *self._folder_targets(parent_folder, sub.name, pdfs, words))
+        finally:
+            scans.close()
+        if full:
+            with self._lock:
+                self._mark_full(now)
+
+    def _query(self, period: TimeRange) -> Dict[str, Tuple[List[str], List[str]]]:
+        """対象PDFのあるフォルダごとの ([対象PDF名], [Word名])（並びは DB 側でソート済み）"""
+        start, end = period.start, period.end
+        rows = self.conn.execute(
+            "SELECT folder, name, kind, mtime FROM files"
+            " WHERE folder IN ("
+            "   SELECT folder FROM files WHERE kind='pdf' AND mtime >= ? AND mtime < ?)"
+            " ORDER BY folder COLLATE normcase, name COLLATE normcase",
+            (start, end),
+        ).fetchall()
+
+        folders: Dict[str, Tuple[List[str], List[str]]] = {}
+        for folder, name, kind, mtime in rows:
+            pdfs, words = folders.setdefault(folder, ([], []))
+            if kind == "pdf":
+                if start <= mtime < end:
+                    pdfs.append(name)
+            else:
+                words.append(name)
+        return folders
+
+    @staticmethod
+    def _folder_targets(parent_folder: Path, folder: str, pdfs: List[str],
+                        words: List[str]) -> Tuple[List[Tuple[str, Path, str]], bool]:
+        # scanner.select_from_scan と同じ形（対象PDFが無ければ空、Word が無ければ wordなし）
+        if not pdfs:
+            return [], False
+        sub = parent_folder / folder
+        targets = [("pdf", sub / name, name) for name in pdfs]
+        targets += [("word", sub / name, name) for name in words]
+        return targets, not words
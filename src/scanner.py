@@ -0,0 +1,194 @@
+# scanner.py
+# サブフォルダ走査エンジン（os.scandir 1パス版）
+#
+# 旧実装は サブフォルダごとに
+#   iterdir → is_dir → glob("*.pdf") → glob("*.doc*") → PDFごとに stat
+# と何度もファイルシステムへ問い合わせていた。
+# SMB共有ではその1回1回がネットワーク往復になるため、
+# ここでは os.scandir で1フォルダ1回だけ列挙し、DirEntry にキャッシュされた
+# 種別・stat 情報を使って PDF / Word をその場で振り分ける。
+# （Windows では DirEntry.stat() は列挙時の情報を使うので追加の往復が発生しない）
+#
+# workers > 1 の場合はサブフォルダごとの列挙をスレッドプールに振り分ける。
+# 処理時間の大半はネットワーク往復待ち（GIL を離している）なので、スレッドで十分効く。
+# 先に投入するのは読み手より LOOKAHEAD_PER_WORKER × workers 件先までで、途中でやめたら残りは走査しない。
+#
+# 対象にする更新時刻は、日付（datetime / その日の0時〜翌0時）か TimeRange（任意の [start, end)）で渡す。
+# 「前回の印刷以降すべて」は TimeRange.since(前回の印刷を始めた時刻) で表す。
+
+import os
+import time
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from datetime import datetime, time as dtime, timedelta
+from typing import Iterator, List, Optional, Tuple, NamedTuple, Union
+
+PDF_EXT = ".pdf"
+DOC_EXTS = {".doc", ".docx", ".docm"}
+LOOKAHEAD_PER_WORKER = 2   # 並列走査で読み手より先に投入しておく件数（ワーカー1本あたり）
+
+
+class TimeRange(NamedTuple):
+    """対象にする更新時刻の範囲 [start, end)（タイムスタンプ）"""
+    start: float
+    end: float
+    label: str
+
+    @classmethod
+    def day(cls, target_date: datetime) -> "TimeRange":
+        """target_date の日（ローカル時刻）"""
+        start = datetime.combine(target_date.date(), dtime())
+        return cls(start.timestamp(), (start + timedelta(days=1)).timestamp(), start.strftime("%Y/%m/%d"))
+
+    @classmethod
+    def since(cls, start: float, end: Optional[float] = None) -> "TimeRange":
+        """start から end（省略時は今）まで"""
+        label = datetime.fromtimestamp(start).strftime("%Y/%m/%d %H:%M") + " 以降"
+        return cls(start, time.time() if end is None else end, label)
+
+    def contains(self, mtime: float) -> bool:
+        return self.start <= mtime < self.end
+
+
+def as_range(target: Union[datetime, TimeRange]) -> TimeRange:
+    """日付なら TimeRange.day にする"""
+    return target if isinstance(target, TimeRange) else TimeRange.day(target)
+
+
+class FileEntry(NamedTuple):
+    path: Path
+    name: str
+    size: int
+    mtime: float
+
+
+class FolderScan(NamedTuple):
+    """1サブフォルダ分の走査結果（名前順ソート済み）"""
+    name: str
+    path: Path
+    pdfs: List[FileEntry]
+    words: List[FileEntry]
+
+
+def _sort_key(name: str) -> str:
+    # Path 同士の比較と同じ順序にする（Windows は大文字小文字を区別しない）
+    return os.path.normcase(name)
+
+
+def list_subfolders(parent_folder: Path) -> List[os.DirEntry]:
+    """
+    parent 直下のサブフォルダを名前順で返す。
+    """
+    with os.scandir(parent_folder) as it:
+        subs = [e for e in it if e.is_dir()]
+    subs.sort(key=lambda e: _sort_key(e.name))
+    return subs
+
+
+def scan_folder(sub_path: Path, stat_words: bool = False) -> FolderScan:
+    """
+    サブフォルダを1回だけ列挙し、PDF と Word ファイルに振り分ける。
+    Word の一時ファイル（~$ で始まるもの）は除外する。
+    Word は日付判定に使わないので、stat_words=False なら size/mtime を 0 のままにする。
+    """
+    sub_path = Path(sub_path)
+    pdfs: List[FileEntry] = []
+    words: List[FileEntry] = []
+
+    with os.scandir(sub_path) as it:
+        for e in it:
+            name = e.name
+            ext = os.path.splitext(name)[1].lower()
+            if ext == PDF_EXT:
+                bucket, need_stat = pdfs, True
+            elif ext in DOC_EXTS and not name.startswith("~$"):
+                bucket, need_stat = words, stat_words
+            else:
+                continue
+            if not e.is_file():
+                continue
+            if need_stat:
+                st = e.stat()
+                bucket.append(FileEntry(sub_path / name, name, st.st_size, st.st_mtime))
+            else:
+                bucket.append(FileEntry(sub_path / name, name, 0, 0.0))
+
+    pdfs.sort(key=lambda f: _sort_key(f.name))
+    words.sort(key=lambda f: _sort_key(f.name))
+    return FolderScan(sub_path.name, sub_path, pdfs, words)
+
+
+def scan_folders(paths: List[Path], workers: int = 1, stat_words: bool = False) -> Iterator[FolderScan]:
+    """
+    複数のサブフォルダを走査し、渡した順番のまま結果を返す。
+    workers > 1 なら最大 workers 本のスレッドで並列に列挙する。
+    """
+    if workers <= 1 or len(paths) <= 1:
+        for p in paths:
+            yield scan_folder(p, stat_words)
+        return
+
+    ex = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan")
+    rest = iter(paths)
+    # 投入順に結果を取り出すので、並びは直列版と同じになる
+    pending = deque(ex.submit(scan_folder, p, stat_words)
+                    for p in itertools.islice(rest, workers * LOOKAHEAD_PER_WORKER))
+    try:
+        while pending:
+            scan = pending.popleft().result()
+            for p in itertools.islice(rest, 1):
+                pending.append(ex.submit(scan_folder, p, stat_words))
+            yield scan
+    finally:
+        # 途中でやめた（選択画面で印刷を押した等）ときは、走査中の分を待たずに未着手の分を取り消す
+        ex.shutdown(wait=False, cancel_futures=True)
+
+
+def select_from_scan(scan: FolderScan,
+                     target_date: Union[datetime, TimeRange]) -> Tuple[List[Tuple[str, Path, str]], bool]:
+    """
+    1フォルダ分の走査結果から印刷対象を選ぶ。
+    戻り値: (targets, no_word)
+      - target_date（日付か TimeRange）に更新されたPDFが無ければ targets は空
+      - 対象PDFがあるのに Word が無ければ no_word=True
+    """
+    period = as_range(target_date)
+    recent_pdfs = [f for f in scan.pdfs if period.contains(f.mtime)]
+    if not recent_pdfs:
+        return [], False
+
+    targets: List[Tuple[str, Path, str]] = [("pdf", f.path, f.name) for f in recent_pdfs]
+    targets += [("word", w.path, w.name) for w in scan.words]
+    return targets, not scan.words
+
+
+def iter_targets(parent_folder: Path, target_date: Union[datetime, TimeRange],
+                 workers: int = 1) -> Iterator[Tuple[str, List[Tuple[str, Path, str]], bool]]:
+    """
+    サブフォルダを1つ走査するたびに (フォルダ名, そのフォルダの対象, wordなしか) を返す。
+    対象の無いフォルダも返すので、呼び出し側で走査済みフォルダ数を数えられる。
+    並びは collect_targets と同じ。
+    """
+    period = as_range(target_date)
+    paths = [Path(sub.path) for sub in list_subfolders(parent_folder)]
+    for scan in scan_folders(paths, workers):
+        folder_targets, no_word = select_from_scan(scan, period)
+        yield scan.name, folder_targets, no_word
+
+
+def collect_targets(parent_folder: Path, target_date: Union[datetime, TimeRange],
+                    workers: int = 1) -> Tuple[List[Tuple[str, Path, str]], List[str]]:
+    """
+    module1.collect_targets と同じ仕様・戻り値で、scandir 1パスで走査する。
+    """
+    targets: List[Tuple[str, Path, str]] = []
+    no_word_folder: List[str] = []
+
+    for name, folder_targets, no_word in iter_targets(parent_folder, target_date, workers):
+        targets += folder_targets
+        if no_word:
+            no_word_folder.append(name)
+
+    return targets, no_word_folder
@@ -0,0 +1,260 @@
+# soffice_worker.py
+# 常駐 LibreOffice ワーカー
+#
+# 旧実装は Word 1件ごとに `soffice --headless --pt` を新規起動しており、
+# LibreOffice のコールドスタート（3〜8秒）が毎回かかっていた。
+# ここでは soffice を --accept 付きで1回だけ起動して常駐させ、文書をそこへ投げる。
+#
+#   - Python から uno モジュールが使える場合（LibreOffice 同梱の Python 等）:
+#       UNO ソケット経由で文書を開き、プリンタを指定して印刷する
+#   - uno が使えない場合（通常の exe 配布）:
+#       同じユーザープロファイルを指定して `soffice --pt` を呼ぶ。
+#       LibreOffice は同一プロファイルの常駐インスタンスがあると
+#       内部パイプで要求を引き渡してすぐ終わるので、起動コストはほぼ無くなる。
+#
+# 常駐プロセスが落ちていたら次の投入前に起動し直し、接続が切れたときは1回だけやり直す。
+# 呼び出しが時間制限（call_timeout か文書ごとの timeout）を超えたらハングとみなして常駐プロセスを殺し、
+# その文書は ProcessTimeout で失敗にする（同じ文書をやり直すとまた止まって、後ろの文書を倍の時間待たせるため）。
+# 次の文書は起動し直したインスタンスで印刷する。
+# 印刷中は常駐プロセスも child_process の対象にするので、中止ボタンで止まる（中止後は起動し直さない）。
+# Windows / Linux 共通で動く（Linux では LibreOffice が入っていれば良い）。
+
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import time
+from pathlib import Path
+from typing import Optional
+
+import child_process
+
+try:
+    import uno  # type: ignore
+    from com.sun.star.beans import PropertyValue  # type: ignore
+except ImportError:
+    uno = None
+    PropertyValue = None
+
+
+class SofficeWorkerError(RuntimeError):
+    pass
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _props(**kwargs):
+    out = []
+    for k, v in kwargs.items():
+        p = PropertyValue()
+        p.Name = k
+        p.Value = v
+        out.append(p)
+    return tuple(out)
+
+
+class SofficeWorker:
+    """
+    常駐 soffice 1プロセスを管理する。スレッドセーフ（投入は1件ずつ直列）。
+
+    使い方:
+        worker = SofficeWorker(soffice_path)
+        worker.print_document(printer_name, word_path)
+        ...
+        worker.stop()
+    """
+
+    def __init__(self, soffice_path: Path, profile_dir: Optional[Path] = None,
+                 start_timeout: float = 60.0, call_timeout: float = 300.0,
+                 use_uno: Optional[bool] = None):
+        self.soffice_path = Path(soffice_path)
+        self.start_timeout = start_timeout
+        self.call_timeout = call_timeout
+        self.use_uno = (uno is not None) if use_uno is None else use_uno
+
+        # profile_dir 未指定なら一時プロファイル（stop で消す）
+        self._own_profile = profile_dir is None
+        self.profile_dir = Path(profile_dir) if profile_dir else Path(tempfile.mkdtemp(prefix="soffice_worker_"))
+
+        self.port = 0
+        self.proc: Optional[subprocess.Popen] = None
+        self._desktop = None
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    # ===== 起動・停止 =====
+    @property
+    def profile_url(self) -> str:
+        return self.profile_dir.resolve().as_uri()
+
+    def _base_args(self):
+        return [
+            str(self.soffice_path),
+            f"-env:UserInstallation={self.profile_url}",
+            "--headless", "--invisible", "--norestore", "--nologo", "--nodefault",
+        ]
+
+    def is_alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        if not self.soffice_path.exists():
+            raise FileNotFoundError(f"soffice が見つかりません: {self.soffice_path}")
+
+        self.port = _free_port()
+        accept = f"--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"
+        self.proc = subprocess.Popen(
+            self._base_args() + [accept],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            **child_process.popen_options(),
+        )
+
+        # ソケットが開いたら受付可能
+        deadline = time.monotonic() + self.start_timeout
+        while time.monotonic() < deadline:
+            if not self.is_alive():
+                raise SofficeWorkerError(f"soffice が起動直後に終了しました (code={self.proc.returncode})")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.5):
+                    break
+            except OSError:
+                time.sleep(0.2)
+        else:
+            self._kill()
+            raise SofficeWorkerError("soffice の起動待ちがタイムアウトしました")
+
+        if self.use_uno:
+            self._desktop = self._connect_desktop()
+
+    def _connect_desktop(self):
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        ctx = resolver.resolve(
+            f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"
+        )
+        return ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+
+    def _kill(self):
+        if self.proc is not None and self.proc.poll() is None:
+            child_process.kill_tree(self.proc)
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                pass
+        self.proc = None
+        self._desktop = None
+
+    def restart(self):
+        self._kill()
+        self.restarts += 1
+        self.start()
+
+    def stop(self):
+        with self._lock:
+            if self._desktop is not None:
+                try:
+                    self._desktop.terminate()
+                except Exception:
+                    pass
+            if self.proc is not None:
+                try:
+                    self.proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    pass
+            self._kill()
+            if self._own_profile:
+                shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def _ensure_running(self):
+        if not self.is_alive():
+            if self.proc is not None:
+                self.restarts += 1
+            self._kill()
+            self.start()
+
+    # ===== 印刷 =====
+    def _print_uno(self, printer_name: str, path: Path, timeout: float):
+        url = uno.systemPathToFileUrl(str(Path(path).resolve()))
+        doc = self._desktop.loadComponentFromURL(
+            url, "_blank", 0, _props(Hidden=True, ReadOnly=True)
+        )
+        if doc is None:
+            raise SofficeWorkerError(f"文書を開けませんでした: {path}")
+        try:
+            doc.setPrinter(_props(Name=printer_name))
+            doc.print(_props(Wait=True))
+        finally:
+            doc.close(True)
+
+    def _print_ipc(self, printer_name: str, path: Path, timeout: float):
+        # 同じプロファイルの常駐インスタンスへ引き渡される
+        child_process.run(
+            self._base_args() + ["--pt", printer_name, str(path)],
+            check=True,
+            timeout=timeout,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def _call_with_timeout(self, timeout: float, func, *args):
+        """func をタイムアウト付きで実行。超えたらワーカーを殺して child_process.ProcessTimeout"""
+        result = {}
+
+        def run():
+            try:
+                func(*args)
+            except BaseException as e:
+                result["error"] = e
+
+        t = threading.Thread(target=run, daemon=True)
+        t.start()
+        t.join(timeout)
+        if t.is_alive():
+            self._kill()  # UNO 呼び出しはプロセスを殺すと例外で抜ける
+            raise child_process.ProcessTimeout([str(self.soffice_path)], timeout)
+        if "error" in result:
+            raise result["error"]
+
+    def print_document(self, printer_name: str, path: Path, timeout: Optional[float] = None):
+        """
+        常駐インスタンスで1文書を印刷する。
+        落ちていれば起動し直し、接続断なら1回だけ再起動してやり直す。
+        時間制限を超えたら常駐インスタンスを殺して ProcessTimeout（やり直さない）。
+        timeout: この文書の時間制限（None なら call_timeout）
+        """
+        func = self._print_uno if self.use_uno else self._print_ipc
+        timeout = timeout or self.call_timeout
+        with self._lock:
+            for attempt in range(2):
+                if child_process.cancelled():
+                    raise child_process.ProcessCancelled(f"中止したため印刷しません: {Path(path).name}")
+                self._ensure_running()
+                try:
+                    with child_process.track(self.proc):
+                        self._call_with_timeout(timeout, func, printer_name, Path(path), timeout)
+                    return
+                except child_process.ProcessCancelled:
+                    self.proc = None   # 中止で終了させられた（起動し直さない）
+                    self._desktop = None
+                    raise
+                except subprocess.TimeoutExpired:
+                    # ハングした文書はやり直さない（次の文書の前に _ensure_running が起動し直す）
+                    self._kill()
+                    self.restarts += 1
+                    raise
+                except (SofficeWorkerError, OSError):
+                    if attempt == 1:
+                        raise
+                    self.restart()
+                except Exception:
+                    # UNO の接続断（DisposedException 等）は死活を見て判断
+                    if attempt == 1 or self.is_alive():
+                        raise
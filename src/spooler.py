@@ -0,0 +1,644 @@
+# spooler.py
+# 印刷キュー（スプーラ）の問い合わせバックエンド
+#
+# 旧実装は問い合わせのたびに powershell -NoProfile を新規起動して Get-PrintJob を
+# 実行しており、1回あたり数百ミリ秒の CPU を使っていた。ここでは差し替え可能な
+# バックエンドを用意し、module1 と print_progress_gui の両方から使う。
+#
+#   win32      : pywin32 の EnumJobs（プロセス内。exe にも同梱済み）
+#   powershell : 常駐させた PowerShell 1プロセスに Get-PrintJob を流す（win32print が無い時）
+#   cups       : Linux の lpq / lpstat
+#   fake       : テスト・ベンチマーク用（メモリ上のジョブ一覧）
+# 投入済みジョブの削除（cancel）も同じバックエンドで行う（win32 の SetJob、Remove-PrintJob、cancel コマンド）。
+# プリンタ自体の状態（オフライン・エラー・用紙切れなど）も printer_status で取れる（printer_health が使う）。
+#
+# キューの変化通知（ChangeNotifier）も用意する。通知が使えれば監視側は
+# ジョブが抜けた瞬間に起きられ、使えなければ従来どおり一定間隔の問い合わせになる。
+#   Win32ChangeNotifier : FindFirstPrinterChangeNotification（ジョブの追加・削除・状態変化）
+#   SimulatedNotifier   : FakeInspector の出し入れで起きる（Linux でのテスト用）
+#
+# 使い方:
+#   spooler.set_default_inspector(spooler.make_inspector("auto"))
+#   jobs = spooler.default_inspector().jobs(printer_name)
+
+import os
+import re
+import time
+import queue
+import getpass
+import shutil
+import threading
+import subprocess
+import uuid
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import win32print  # type: ignore
+except ImportError:
+    win32print = None
+
+# 変化通知だけに使う（無くてもキューの問い合わせは win32print でできる）
+try:
+    import win32event  # type: ignore
+except ImportError:
+    win32event = None
+
+PRINTER_CHANGE_JOB = 0x0000FF00
+
+# JOB_INFO の Status ビット（pStatus が空のときに使う）
+_WIN32_JOB_STATUS = (
+    (0x0002, "Error"),
+    (0x0020, "Offline"),
+    (0x0040, "PaperOut"),
+    (0x0200, "Blocked"),
+    (0x0004, "Deleting"),
+    (0x0008, "Spooling"),
+    (0x0010, "Printing"),
+    (0x0100, "Deleted"),
+    (0x0001, "Paused"),
+    (0x0080, "Printed"),
+    (0x0400, "UserIntervention"),
+    (0x0800, "Restart"),
+    (0x1000, "Complete"),
+)
+
+
+# PRINTER_INFO_2 の Status ビット
+_WIN32_PRINTER_STATUS = (
+    (0x00000001, "paused"),
+    (0x00000002, "error"),
+    (0x00000008, "paper_jam"),
+    (0x00000010, "paper_out"),
+    (0x00000040, "paper_problem"),
+    (0x00000080, "offline"),
+    (0x00000200, "busy"),
+    (0x00000400, "printing"),
+    (0x00001000, "not_available"),
+    (0x00040000, "no_toner"),
+    (0x00100000, "user_intervention"),
+    (0x00200000, "out_of_memory"),
+    (0x00400000, "door_open"),
+)
+PRINTER_ATTRIBUTE_WORK_OFFLINE = 0x00000400
+
+# これが1つでも立っていたら印刷できない状態とみなす
+FAULT_FLAGS = frozenset({
+    "offline", "error", "paper_jam", "paper_out", "paper_problem", "not_available",
+    "no_toner", "user_intervention", "out_of_memory", "door_open", "paused",
+})
+
+
+def _win32_status(job: dict) -> str:
+    if job.get("pStatus"):
+        return str(job["pStatus"])
+    bits = int(job.get("Status") or 0)
+    return ",".join(name for bit, name in _WIN32_JOB_STATUS if bits & bit)
+
+# Windows 以外には CREATE_NO_WINDOW が無い
+NO_WINDOW = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+
+class SpoolerError(RuntimeError):
+    pass
+
+
+class PrinterUnavailable(SpoolerError):
+    """プリンタが故障扱い（printer_health の遮断中）で投入できない"""
+    pass
+
+
+class NotSubmitted(SpoolerError):
+    """スプーラに渡す前に失敗した（何も印刷されない）。まとめた投入なら1件ずつやり直してよい"""
+    pass
+
+
+class JobInfo(NamedTuple):
+    job_id: int
+    document: str
+    status: str = ""
+    pages: int = 0      # 総ページ数（不明なら0）
+    size: int = 0       # バイト数（不明なら0）
+    owner: str = ""     # 投入したユーザー名（取れない方式では空）
+
+
+class PrinterStatus(NamedTuple):
+    flags: Tuple[str, ...] = ()   # "offline" / "error" / "paper_out" など
+    detail: str = ""
+    known: bool = True            # False ならこの方式では状態が分からない
+
+    @property
+    def faults(self) -> Tuple[str, ...]:
+        return tuple(f for f in self.flags if f in FAULT_FLAGS)
+
+    @property
+    def healthy(self) -> bool:
+        return not self.faults
+
+
+def document_matches(expected: str, document: str) -> bool:
+    """
+    スプーラ上の文書名 document が、投入したファイル名 expected のものか。
+    投入方法によって "C:\\...\\a.pdf" や "a" になるので、フォルダを除いた名前が
+    ファイル名か拡張子抜きの名前と完全に一致するものだけにする（"a1.pdf" と "a10.pdf" を取り違えない）。
+    """
+    expected = os.path.basename(expected).lower()
+    stem = os.path.splitext(expected)[0]
+    document = document.replace("\\", "/").rsplit("/", 1)[-1].strip().lower()
+    return bool(document) and (document == expected or document == stem)
+
+
+def current_user() -> str:
+    """このプロセスのユーザー名（スプーラ上のジョブの所有者と比べる）。取れなければ空"""
+    try:
+        return getpass.getuser()
+    except Exception:
+        return ""
+
+
+def owner_matches(expected: str, owner: str) -> bool:
+    """ジョブの所有者 owner が expected か。"DOMAIN\\user" の形でも比べる"""
+    def norm(name):
+        return name.replace("/", "\\").rsplit("\\", 1)[-1].strip().lower()
+    return bool(expected) and bool(owner) and norm(expected) == norm(owner)
+
+
+class QueueInspector:
+    """バックエンドの共通インターフェース。取得できなければ SpoolerError を投げる"""
+
+    name = "base"
+
+    def jobs(self, printer_name: str) -> List[JobInfo]:
+        raise NotImplementedError
+
+    def queue_size(self, printer_name: str) -> int:
+        return len(self.jobs(printer_name))
+
+    def cancel(self, printer_name: str, job_id: int):
+        """ジョブを削除する。できなければ SpoolerError"""
+        raise SpoolerError(f"{self.name} ではジョブを削除できません")
+
+    def printer_status(self, printer_name: str) -> PrinterStatus:
+        """プリンタ自体の状態。問い合わせに失敗したら SpoolerError"""
+        return PrinterStatus(known=False)
+
+    def close(self):
+        pass
+
+
+# ===== win32print.EnumJobs =====
+class Win32Inspector(QueueInspector):
+    name = "win32"
+
+    def __init__(self):
+        if win32print is None:
+            raise SpoolerError("win32print が使えません")
+        self._handles: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _handle(self, printer_name: str):
+        h = self._handles.get(printer_name)
+        if h is None:
+            h = win32print.OpenPrinter(printer_name)
+            self._handles[printer_name] = h
+        return h
+
+    def jobs(self, printer_name: str) -> List[JobInfo]:
+        with self._lock:
+            try:
+                raw = win32print.EnumJobs(self._handle(printer_name), 0, -1, 2)
+            except Exception as e:
+                # ハンドルが無効になっていることがあるので開き直させる
+                h = self._handles.pop(printer_name, None)
+                if h is not None:
+                    try:
+                        win32print.ClosePrinter(h)
+                    except Exception:
+                        pass
+                raise SpoolerError(str(e)) from e
+        return [
+            JobInfo(
+                job_id=int(j["JobId"]),
+                document=j.get("pDocument") or "",
+                status=_win32_status(j),
+                pages=int(j.get("TotalPages") or 0),
+                size=int(j.get("Size") or 0),
+                owner=j.get("pUserName") or "",
+            )
+            for j in raw
+        ]
+
+    def cancel(self, printer_name: str, job_id: int):
+        with self._lock:
+            try:
+                win32print.SetJob(self._handle(printer_name), job_id, 0, None, win32print.JOB_CONTROL_DELETE)
+            except Exception as e:
+                raise SpoolerError(str(e)) from e
+
+    def printer_status(self, printer_name: str) -> PrinterStatus:
+        with self._lock:
+            try:
+                info = win32print.GetPrinter(self._handle(printer_name), 2)
+            except Exception as e:
+                self._handles.pop(printer_name, None)
+                raise SpoolerError(str(e)) from e
+        bits = int(info.get("Status") or 0)
+        flags = [name for bit, name in _WIN32_PRINTER_STATUS if bits & bit]
+        if int(info.get("Attributes") or 0) & PRINTER_ATTRIBUTE_WORK_OFFLINE and "offline" not in flags:
+            flags.append("offline")
+        return PrinterStatus(tuple(flags), ",".join(flags))
+
+    def close(self):
+        with self._lock:
+            for h in self._handles.values():
+                try:
+                    win32print.ClosePrinter(h)
+                except Exception:
+                    pass
+            self._handles.clear()
+
+
+# ===== 常駐 PowerShell =====
+class PowerShellInspector(QueueInspector):
+    """
+    PowerShell を1回だけ起動して標準入力からコマンドを流し込む。
+    各コマンドの出力の最後に一意な終端行を出させ、そこまで読む。
+    出力は読み取りスレッドが行ごとに渡す。timeout 秒以内に終端行が来なければ
+    PowerShell を終了させて SpoolerError（次の問い合わせで起動し直す）。
+    """
+
+    name = "powershell"
+
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._proc: Optional[subprocess.Popen] = None
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+
+    def _start(self):
+        self._proc = subprocess.Popen(
+            ["powershell", "-NoProfile", "-NoLogo", "-NonInteractive", "-Command", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+            creationflags=NO_WINDOW,
+        )
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read, args=(self._proc, self._lines),
+                         daemon=True, name="powershell-reader").start()
+        self._send("[Console]::OutputEncoding = [System.Text.Encoding]::UTF8")
+
+    @staticmethod
+    def _read(proc: subprocess.Popen, lines: "queue.Queue[Optional[str]]"):
+        try:
+            for line in proc.stdout:
+                lines.put(line.rstrip("\r\n"))
+        except (OSError, ValueError):
+            pass
+        lines.put(None)   # 終了した
+
+    def _kill(self):
+        proc, self._proc = self._proc, None
+        if proc is not None and proc.poll() is None:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+    def _send(self, command: str) -> List[str]:
+        marker = f"__END_{uuid.uuid4().hex}__"
+        self._proc.stdin.write(f"{command}\nWrite-Output '{marker}'\n")
+        self._proc.stdin.flush()
+        deadline = time.monotonic() + self.timeout
+        lines = []
+        while True:
+            try:
+                line = self._lines.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                self._kill()
+                raise SpoolerError(f"PowerShell が {self.timeout:.0f} 秒応答しません")
+            if line is None:
+                self._proc = None
+                raise SpoolerError("PowerShell が終了しました")
+            if line == marker:
+                return lines
+            lines.append(line)
+
+    def jobs(self, printer_name: str) -> List[JobInfo]:
+        safe_name = printer_name.replace("'", "''")
+        command = (
+            f"Get-PrintJob -PrinterName '{safe_name}' -ErrorAction Stop | "
+            "ForEach-Object { \"$($_.Id)`t$($_.JobStatus)`t$($_.TotalPages)`t$($_.Size)`t$($_.UserName)`t$($_.DocumentName)\" }"
+        )
+        with self._lock:
+            try:
+                if self._proc is None or self._proc.poll() is not None:
+                    self._start()
+                lines = self._send(command)
+            except (OSError, ValueError) as e:
+                self._proc = None
+                raise SpoolerError(str(e)) from e
+
+        jobs = []
+        for line in lines:
+            parts = line.split("\t", 5)
+            if len(parts) != 6 or not parts[0].isdigit():
+                # 取得失敗時はエラーメッセージが出る
+                raise SpoolerError(line)
+            job_id, status, pages, size, owner, doc = parts
+            jobs.append(JobInfo(int(job_id), doc, status, int(pages or 0), int(size or 0), owner))
+        return jobs
+
+    def cancel(self, printer_name: str, job_id: int):
+        safe_name = printer_name.replace("'", "''")
+        command = f"Remove-PrintJob -PrinterName '{safe_name}' -ID {int(job_id)} -ErrorAction Stop"
+        with self._lock:
+            try:
+                if self._proc is None or self._proc.poll() is not None:
+                    self._start()
+                lines = self._send(command)
+            except (OSError, ValueError) as e:
+                self._proc = None
+                raise SpoolerError(str(e)) from e
+        if any(line.strip() for line in lines):
+            raise SpoolerError("\n".join(lines))
+
+    # Get-Printer の PrinterStatus（列挙名）→ フラグ
+    _PS_STATUS = {
+        "paused": "paused", "error": "error", "paperjam": "paper_jam", "paperout": "paper_out",
+        "paperproblem": "paper_problem", "offline": "offline", "busy": "busy", "printing": "printing",
+        "notavailable": "not_available", "notoner": "no_toner", "userintervention": "user_intervention",
+        "outofmemory": "out_of_memory", "dooropen": "door_open",
+    }
+
+    def printer_status(self, printer_name: str) -> PrinterStatus:
+        safe_name = printer_name.replace("'", "''")
+        command = f"(Get-Printer -Name '{safe_name}' -ErrorAction Stop).PrinterStatus"
+        with self._lock:
+            try:
+                if self._proc is None or self._proc.poll() is not None:
+                    self._start()
+                lines = [line.strip() for line in self._send(command) if line.strip()]
+            except (OSError, ValueError) as e:
+                self._proc = None
+                raise SpoolerError(str(e)) from e
+        if len(lines) != 1 or " " in lines[0]:
+            raise SpoolerError("\n".join(lines))
+        flags = tuple(f for key, f in self._PS_STATUS.items() if key in lines[0].lower().split(","))
+        return PrinterStatus(flags, lines[0])
+
+    def close(self):
+        with self._lock:
+            if self._proc is not None and self._proc.poll() is None:
+                try:
+                    self._proc.stdin.write("exit\n")
+                    self._proc.stdin.flush()
+                    self._proc.wait(timeout=3)
+                except Exception:
+                    self._proc.kill()
+            self._proc = None
+
+
+# ===== CUPS lpq / lpstat =====
+class CupsInspector(QueueInspector):
+    """
+    ジョブ一覧は lpq -l で取る（lpstat -o には文書名が出ず、名前での結び付けやページ予算が効かないため）。
+    lpq の文書名は 39 文字で切られるので、それより長い名前は一致しない（見つからないジョブとして扱われる）。
+    メッセージが翻訳されないように LC_ALL=C で動かす。
+    """
+
+    name = "cups"
+
+    # 例:
+    #   alice: active                            [job 123 localhost]
+    #           report1.pdf                             10240 bytes
+    _HEAD = re.compile(r"^(\S+): (\S+)\s+\[job (\d+) ")
+    _FILE = re.compile(r"^\s+(.*?)\s+(\d+) bytes\s*$")
+
+    def _run(self, args: List[str]) -> str:
+        try:
+            return subprocess.check_output(args, stderr=subprocess.STDOUT, text=True,
+                                           env=dict(os.environ, LC_ALL="C"))
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise SpoolerError(str(e)) from e
+
+    def jobs(self, printer_name: str) -> List[JobInfo]:
+        out = self._run(["lpq", "-l", "-P", printer_name])
+        jobs = []
+        head = None
+        for line in out.splitlines():
+            mt = self._HEAD.match(line)
+            if mt:
+                head = mt
+                continue
+            mt = self._FILE.match(line)
+            if head is not None and mt:
+                owner, rank, job_id = head.groups()
+                jobs.append(JobInfo(int(job_id), mt.group(1), "printing" if rank == "active" else "",
+                                    0, int(mt.group(2)), owner))
+                head = None
+        return jobs
+
+    def cancel(self, printer_name: str, job_id: int):
+        try:
+            subprocess.run(["cancel", f"{printer_name}-{int(job_id)}"], check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise SpoolerError(str(e)) from e
+
+    def printer_status(self, printer_name: str) -> PrinterStatus:
+        # 例: "printer Brother is idle.  enabled since ..." / "printer Brother disabled since ..."
+        out = self._run(["lpstat", "-p", printer_name])
+        first = out.strip().splitlines()[0] if out.strip() else ""
+        flags = []
+        if "disabled" in first:
+            flags.append("offline")
+        if "printing" in first:
+            flags.append("printing")
+        return PrinterStatus(tuple(flags), first)
+
+
+# ===== テスト用 =====
+class FakeInspector(QueueInspector):
+    """メモリ上のジョブ一覧。add_job / finish_job で外から出し入れする"""
+
+    name = "fake"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.changed = threading.Condition(self._lock)   # 出し入れのたびに notify_all
+        self.version = 0
+        self._jobs: Dict[str, List[JobInfo]] = {}
+        self._next_id = 1
+        self.fail = False   # True にすると問い合わせ失敗を再現
+        self.calls = 0
+        self._status: Dict[str, Tuple[str, ...]] = {}
+
+    def add_job(self, printer_name: str, document: str, pages: int = 1, size: int = 0,
+                owner: Optional[str] = None) -> int:
+        """owner 未指定ならこのプロセスのユーザーのジョブにする"""
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            job = JobInfo(job_id, document, "", pages, size, current_user() if owner is None else owner)
+            self._jobs.setdefault(printer_name, []).append(job)
+            self._notify()
+            return job_id
+
+    def finish_job(self, printer_name: str, job_id: Optional[int] = None):
+        """job_id 未指定なら先頭のジョブを完了させる"""
+        with self._lock:
+            jobs = self._jobs.get(printer_name, [])
+            if job_id is None:
+                if jobs:
+                    jobs.pop(0)
+            else:
+                self._jobs[printer_name] = [j for j in jobs if j.job_id != job_id]
+            self._notify()
+
+    def cancel(self, printer_name: str, job_id: int):
+        with self._lock:
+            jobs = self._jobs.get(printer_name, [])
+            if all(j.job_id != job_id for j in jobs):
+                raise SpoolerError(f"ジョブがありません: {job_id}")
+            self._jobs[printer_name] = [j for j in jobs if j.job_id != job_id]
+            self._notify()
+
+    def set_status(self, printer_name: str, *flags: str):
+        """プリンタの状態を変える（set_status("A", "offline") / set_status("A") で正常）"""
+        with self._lock:
+            self._status[printer_name] = tuple(flags)
+            self._notify()
+
+    def printer_status(self, printer_name: str) -> PrinterStatus:
+        with self._lock:
+            if self.fail:
+                raise SpoolerError("fake failure")
+            flags = self._status.get(printer_name, ())
+        return PrinterStatus(flags, ",".join(flags))
+
+    def _notify(self):
+        self.version += 1
+        self.changed.notify_all()
+
+    def jobs(self, printer_name: str) -> List[JobInfo]:
+        with self._lock:
+            self.calls += 1
+            if self.fail:
+                raise SpoolerError("fake failure")
+            return list(self._jobs.get(printer_name, []))
+
+
+# ===== 変化通知 =====
+class ChangeNotifier:
+    """wait(timeout) はキューに変化があれば True、タイムアウトなら False を返す"""
+
+    def wait(self, timeout: float) -> bool:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Win32ChangeNotifier(ChangeNotifier):
+    def __init__(self, printer_name: str):
+        if win32print is None or win32event is None:
+            raise SpoolerError("win32print / win32event が使えません")
+        self._printer = win32print.OpenPrinter(printer_name)
+        try:
+            self._change = win32print.FindFirstPrinterChangeNotification(
+                self._printer, PRINTER_CHANGE_JOB, 0, None
+            )
+        except Exception as e:
+            win32print.ClosePrinter(self._printer)
+            raise SpoolerError(str(e)) from e
+
+    def wait(self, timeout: float) -> bool:
+        rc = win32event.WaitForSingleObject(self._change, int(timeout * 1000))
+        if rc != win32event.WAIT_OBJECT_0:
+            return False
+        # 次の通知を受けるためにリセット
+        win32print.FindNextPrinterChangeNotification(self._change, 0)
+        return True
+
+    def close(self):
+        try:
+            win32print.FindClosePrinterChangeNotification(self._change)
+        finally:
+            win32print.ClosePrinter(self._printer)
+
+
+class SimulatedNotifier(ChangeNotifier):
+    def __init__(self, fake: "FakeInspector"):
+        self._fake = fake
+        self._seen = fake.version
+
+    def wait(self, timeout: float) -> bool:
+        with self._fake.changed:
+            if self._fake.version == self._seen:
+                self._fake.changed.wait(timeout)
+            changed = self._fake.version != self._seen
+            self._seen = self._fake.version
+            return changed
+
+
+def make_notifier(inspector: QueueInspector, printer_name: str) -> Optional[ChangeNotifier]:
+    """使える通知方式を返す。無ければ None（問い合わせのみで監視）"""
+    try:
+        if isinstance(inspector, FakeInspector):
+            return SimulatedNotifier(inspector)
+        if isinstance(inspector, Win32Inspector):
+            return Win32ChangeNotifier(printer_name)
+    except SpoolerError:
+        pass
+    return None
+
+
+# ===== 選択 =====
+def make_inspector(kind: str = "auto") -> QueueInspector:
+    """
+    kind: "auto" / "win32" / "powershell" / "cups" / "fake"
+    auto は win32print があれば win32、Windows なら powershell、lpq があれば cups。
+    どれも無ければ SpoolerError（模擬のキューを本物として見ないため。fake は明示したときだけ）。
+    """
+    if kind == "auto":
+        if win32print is not None:
+            kind = "win32"
+        elif os.name == "nt":
+            kind = "powershell"
+        elif shutil.which("lpq"):
+            kind = "cups"
+        else:
+            raise SpoolerError("印刷キューを問い合わせる方法がありません（win32print・PowerShell・lpq のどれも無い）")
+
+    if kind == "win32":
+        return Win32Inspector()
+    if kind == "powershell":
+        return PowerShellInspector()
+    if kind == "cups":
+        return CupsInspector()
+    if kind == "fake":
+        return FakeInspector()
+    raise ValueError(f"不明なキュー問い合わせ方式です: {kind}")
+
+
+_default: Optional[QueueInspector] = None
+_default_lock = threading.Lock()
+
+
+def set_default_inspector(inspector: QueueInspector):
+    global _default
+    with _default_lock:
+        if _default is not None and _default is not inspector:
+            _default.close()
+        _default = inspector
+
+
+def default_inspector() -> QueueInspector:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = make_inspector("auto")
+        return _default
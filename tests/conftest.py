@@ -0,0 +1,5 @@
+# テストは src/ のモジュールを exe 化前と同じくフラットに import する
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
@@ -0,0 +1,68 @@
+import pytest
+
+import print_progress_gui as ppg
+import printer_backend
+import queue_monitor
+import spooler
+from pdf_merge import merge_pdfs
+from spooler import NotSubmitted
+
+
+@pytest.fixture
+def run(tmp_path):
+    backend = printer_backend.make_backend("fake", submit_ms=5, service_ms=5, page_ms=0)
+    spooler.set_default_inspector(backend.inspector)
+    queue_monitor.configure(0.05, 0.5)
+    selected = []
+    for n in range(3):
+        p = tmp_path / "a" / f"r{n}.pdf"
+        p.parent.mkdir(exist_ok=True)
+        p.write_bytes(b"%PDF-1.4\n1 0 obj << /Type /Pages /Count 1 >> endobj\n")
+        selected.append(("pdf", p, p.name))
+    submitted = []
+
+    def print_pdf(path):
+        submitted.append(path.name)
+        return backend.submit("P", path, "pdf")
+
+    def go(print_batch):
+        ok = ppg.run_print_with_gui(selected, print_pdf, print_pdf, "P", headless=True,
+                                    print_batch_func=print_batch, batch_max_files=3)
+        return ok, submitted
+
+    yield go
+    queue_monitor.stop_all()
+    backend.close()
+
+
+def test_failure_before_spooling_falls_back_to_single_files(run):
+    def print_batch(paths):
+        raise NotSubmitted("連結できません")
+
+    ok, submitted = run(print_batch)
+    assert ok is True
+    assert submitted == ["r0.pdf", "r1.pdf", "r2.pdf"]
+
+
+def test_failure_after_spooling_fails_the_whole_group(run):
+    def print_batch(paths):
+        raise OSError("lp が途中で終了しました")
+
+    ok, submitted = run(print_batch)
+    assert ok is False
+    assert submitted == []      # 一部が印刷されているかもしれないので投入し直さない
+
+
+def test_auto_merge_does_not_use_builtin_stream(tmp_path):
+    pypdf = pytest.importorskip("pypdf")
+    paths = []
+    for n in range(2):
+        w = pypdf.PdfWriter()
+        w.add_blank_page(100, 100)
+        p = tmp_path / f"{n}.pdf"
+        with open(p, "wb") as f:
+            w.write(f)
+        paths.append(p)
+    used = merge_pdfs(paths, tmp_path / "out.pdf")
+    assert used != "stream"
+    assert len(pypdf.PdfReader(str(tmp_path / "out.pdf")).pages) == 2
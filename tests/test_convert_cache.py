@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import zipfile
+
+import pytest
+
+import child_process
+from convert_cache import ConvertCache, has_volatile_fields
+from convert_pool import ConvertPool
+
+
+def make_docx(path, body, header=""):
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("[Content_Types].xml", "<Types/>")
+        z.writestr("word/document.xml", f"<w:document><w:body>{body}</w:body></w:document>")
+        if header:
+            z.writestr("word/header1.xml", f"<w:hdr>{header}</w:hdr>")
+    return path
+
+
+def field(code):
+    return f'<w:r><w:instrText xml:space="preserve"> {code} </w:instrText></w:r>'
+
+
+def test_volatile_fields_are_detected(tmp_path):
+    assert not has_volatile_fields(make_docx(tmp_path / "plain.docx", "<w:t>DATE</w:t>"))
+    assert not has_volatile_fields(make_docx(tmp_path / "saved.docx", field("SAVEDATE")))
+    assert has_volatile_fields(make_docx(tmp_path / "date.docx", field('DATE \\@ "yyyy/MM/dd"')))
+    assert has_volatile_fields(make_docx(tmp_path / "hdr.docx", "", '<w:fldSimple w:instr=" TIME "/>'))
+
+    doc = tmp_path / "old.doc"
+    doc.write_bytes(b"\xd0\xcf\x11\xe0" + "本日 \x13 PRINTDATE \x14".encode("utf-16-le"))
+    assert has_volatile_fields(doc)
+    doc.write_bytes(b"\xd0\xcf\x11\xe0" + "本日 \x13 CREATEDATE \x14".encode("utf-16-le"))
+    assert not has_volatile_fields(doc)
+
+
+def test_documents_with_date_fields_are_not_cached(tmp_path):
+    cache = ConvertCache(tmp_path / "cache", max_bytes=1024 * 1024)
+    try:
+        assert cache.key(make_docx(tmp_path / "date.docx", field("DATE"))) is None
+        plain = cache.key(make_docx(tmp_path / "plain.docx", "<w:t>x</w:t>"))
+        assert plain is not None
+        assert cache.stats()["volatile"] == 1
+    finally:
+        cache.close()
+
+
+def pdf_of(tmp_path, name, size=100):
+    p = tmp_path / f"{name}.pdf"
+    p.write_bytes(b"%" + b"x" * (size - 1))
+    return p
+
+
+def fill(tmp_path, names):
+    # 別の実行で入れておいた分（この実行では印刷前の保護がかかっていない）
+    cache = ConvertCache(tmp_path / "cache", max_bytes=10 ** 6)
+    try:
+        for name in names:
+            cache.put(name * 32, pdf_of(tmp_path, name))
+            time.sleep(0.01)
+    finally:
+        cache.close()
+
+
+def cached(tmp_path):
+    cache = ConvertCache(tmp_path / "cache", max_bytes=10 ** 6)
+    try:
+        return sorted(k[:2] for k, in cache.conn.execute("SELECT key FROM entries"))
+    finally:
+        cache.close()
+
+
+def test_eviction_drops_least_recently_used_first(tmp_path):
+    fill(tmp_path, ["aa", "bb", "cc"])
+    other = ConvertCache(tmp_path / "cache", max_bytes=10 ** 6)
+    other.get("aa" * 32)                       # 別の実行で使われた → いちばん新しい
+    other.close()
+
+    cache = ConvertCache(tmp_path / "cache", max_bytes=250)
+    try:
+        cache.put("dd" * 32, pdf_of(tmp_path, "dd"))
+        assert cache.stats()["evictions"] == 2
+        assert not cache._path("bb" * 32).exists()
+    finally:
+        cache.close()
+    assert cached(tmp_path) == ["aa", "dd"]
+
+
+def test_pinned_entries_survive_eviction(tmp_path):
+    fill(tmp_path, ["aa", "bb", "cc"])
+    cache = ConvertCache(tmp_path / "cache", max_bytes=150)
+    try:
+        assert cache.get("aa" * 32) is not None    # この実行で返した（まだ印刷していない）
+        cache.put("dd" * 32, pdf_of(tmp_path, "dd"))
+        st = cache.stats()
+        assert st["bytes"] == 200 > cache.max_bytes  # 上限を超えても印刷前のものは消さない
+    finally:
+        cache.close()
+    assert cached(tmp_path) == ["aa", "dd"]
+
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = ConvertCache(tmp_path / "cache", max_bytes=10 ** 6)
+    try:
+        assert cache.get("aa" * 32) is None
+        cache.put("aa" * 32, pdf_of(tmp_path, "aa"))
+        assert cache.get("aa" * 32) is not None
+        assert cache.get("aa" * 32) is not None
+        st = cache.stats()
+        assert (st["hits"], st["misses"], st["entries"], st["bytes"]) == (2, 1, 1, 100)
+    finally:
+        cache.close()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="偽の soffice は #! で起動するスクリプト")
+def test_deleted_cache_file_is_a_miss_and_converted_again(tmp_path, monkeypatch):
+    exe = tmp_path / "soffice"
+    exe.write_text(f"""#!{sys.executable}
+import os, sys
+args = sys.argv[1:]
+with open(os.environ["FAKE_SOFFICE_LOG"], "a") as f:
+    f.write(args[-1] + "\\n")
+out = args[args.index("--outdir") + 1]
+stem = os.path.splitext(os.path.basename(args[-1]))[0]
+with open(os.path.join(out, stem + ".pdf"), "wb") as f:
+    f.write(b"%PDF-1.4")
+""")
+    exe.chmod(0o755)
+    log = tmp_path / "calls.log"
+    log.write_text("")
+    monkeypatch.setenv("FAKE_SOFFICE_LOG", str(log))
+    child_process.reset()
+    doc = make_docx(tmp_path / "a.docx", "<w:t>x</w:t>")
+
+    cache = ConvertCache(tmp_path / "cache", max_bytes=10 ** 6)
+    try:
+        for _ in range(2):
+            pool = ConvertPool(exe, workers=1, cache=cache)
+            try:
+                pdf = pool.convert(doc)
+            finally:
+                pool.close()
+        assert len(log.read_text().splitlines()) == 1      # 2回目はキャッシュから
+        pdf.unlink()                                         # 手で消された
+
+        pool = ConvertPool(exe, workers=1, cache=cache)
+        try:
+            assert pool.convert(doc).read_bytes() == b"%PDF-1.4"
+        finally:
+            pool.close()
+        assert len(log.read_text().splitlines()) == 2
+        st = cache.stats()
+        assert (st["hits"], st["misses"], st["entries"]) == (1, 2, 1)
+    finally:
+        cache.close()
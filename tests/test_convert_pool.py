@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import child_process
+from convert_pool import ConvertError, ConvertPool
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="偽の soffice は #! で起動するスクリプト")
+
+# --convert-to pdf の真似。文書名に slow があれば変換が終わらない
+FAKE_SOFFICE = """#!{python}
+import os, sys, time
+args = sys.argv[1:]
+out = args[args.index("--outdir") + 1]
+if "slow" in os.path.basename(args[-1]):
+    time.sleep(600)
+stem = os.path.splitext(os.path.basename(args[-1]))[0]
+with open(os.path.join(out, stem + ".pdf"), "wb") as f:
+    f.write(b"%PDF-1.4")
+"""
+
+
+@pytest.fixture
+def fake_soffice(tmp_path):
+    exe = tmp_path / "soffice"
+    exe.write_text(FAKE_SOFFICE.format(python=sys.executable))
+    exe.chmod(0o755)
+    child_process.reset()
+    return exe
+
+
+def test_convert_and_close(tmp_path, fake_soffice):
+    doc = tmp_path / "a.docx"
+    doc.write_bytes(b"PK")
+    pool = ConvertPool(fake_soffice, workers=2, work_dir=tmp_path / "work")
+    try:
+        assert pool.convert(doc).read_bytes() == b"%PDF-1.4"
+    finally:
+        pool.close()
+
+
+def test_close_stops_running_soffice(tmp_path, fake_soffice):
+    doc = tmp_path / "slow.docx"
+    doc.write_bytes(b"PK")
+    pool = ConvertPool(fake_soffice, workers=1, timeout=600)
+    pool.prefetch([doc])
+    deadline = time.monotonic() + 5
+    while child_process.running() == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert child_process.running() == 1
+
+    t0 = time.monotonic()
+    pool.close()
+    assert time.monotonic() - t0 < 5              # 変換が終わるのを待たない
+    assert child_process.running() == 0
+    with pytest.raises(ConvertError):
+        pool.convert(doc)
+
+
+def test_waiting_and_new_conversions_fail_with_convert_error_after_close(tmp_path, fake_soffice):
+    slow, queued, late = tmp_path / "slow.docx", tmp_path / "b.docx", tmp_path / "c.docx"
+    for p in (slow, queued, late):
+        p.write_bytes(b"PK")
+    pool = ConvertPool(fake_soffice, workers=1, timeout=600)
+    pool.prefetch([slow, queued])
+    errors = []
+
+    def wait_queued():
+        try:
+            pool.convert(queued)
+        except Exception as e:
+            errors.append(e)
+    th = threading.Thread(target=wait_queued)
+    th.start()
+    time.sleep(0.2)
+    pool.close()
+    th.join(5)
+    assert len(errors) == 1 and isinstance(errors[0], ConvertError)   # 取り消された（CancelledError ではない）
+    with pytest.raises(ConvertError):
+        pool.submit(late)                                             # RuntimeError ではない
@@ -0,0 +1,94 @@
+import time
+
+from job_tracker import JobTracker
+from queue_monitor import QueueMonitor
+from spooler import FakeInspector, document_matches
+
+
+def wait_for(cond, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def make_tracker(fake, events, grace=0.2):
+    mon = QueueMonitor("P", inspector=fake, min_interval=0.02, max_interval=0.05)
+    mon.start()
+    return mon, JobTracker(mon, on_event=events.append, unseen_grace_sec=grace, owner="alice")
+
+
+def test_document_matches_is_exact():
+    assert document_matches("report1.pdf", "report1.pdf")
+    assert document_matches("report1.pdf", "C:\\work\\Report1.PDF")
+    assert document_matches("report1.pdf", "/tmp/report1.pdf")
+    assert document_matches("report1.pdf", "report1")
+    assert not document_matches("report1.pdf", "report10.pdf")
+    assert not document_matches("1.pdf", "report1.pdf")
+    assert not document_matches("1.pdf", "")
+
+
+def test_binds_only_own_job_with_exact_name(tmp_path):
+    fake = FakeInspector()
+    events = []
+    mon, tracker = make_tracker(fake, events)
+    try:
+        tracker.expect(0, "report1.pdf", tmp_path / "report1.pdf")
+        tracker.submitted(0)
+        fake.add_job("P", "report10.pdf", owner="alice")
+        fake.add_job("P", "report1.pdf", owner="bob")
+        mine = fake.add_job("P", "report1.pdf", owner="alice")
+        assert wait_for(lambda: any(e[0] == "job_bound" for e in events))
+        assert ("job_bound", 0, "report1.pdf", mine) in events
+        fake.finish_job("P", mine)
+        assert wait_for(lambda: tracker.all_done())
+        assert [e[0] for e in events].count("job_done") == 1
+    finally:
+        tracker.close()
+        mon.stop()
+
+
+def test_unseen_job_is_unknown_not_done(tmp_path):
+    fake = FakeInspector()
+    events = []
+    mon, tracker = make_tracker(fake, events)
+    try:
+        tracker.expect(0, "a.pdf", tmp_path / "a.pdf")
+        tracker.submitted(0)
+        assert wait_for(lambda: any(e[0] == "job_unknown" for e in events))
+        assert not any(e[0] == "job_done" for e in events)
+        assert tracker.pending() == 1 and tracker.unknown() == 1
+        assert tracker.pending_jobs() == []
+
+        # 後から現れたら結び付けて追いかける
+        job_id = fake.add_job("P", "a.pdf", owner="alice")
+        assert wait_for(lambda: tracker.pending_jobs() == [(0, job_id, True)])
+        assert tracker.unknown() == 0
+        fake.finish_job("P", job_id)
+        assert wait_for(lambda: tracker.all_done())
+    finally:
+        tracker.close()
+        mon.stop()
+
+
+def test_only_verified_jobs_are_cancellable(tmp_path):
+    fake = FakeInspector()
+    events = []
+    mon, tracker = make_tracker(fake, events)
+    try:
+        tracker.expect(0, "a.pdf", tmp_path / "a.pdf")
+        tracker.submitted(0)
+        tracker.expect(1, "b.pdf", tmp_path / "b.pdf")
+        tracker.submitted(1)
+        tracker.expect(2, "c.pdf", tmp_path / "c.pdf")
+        c = fake.add_job("P", "c.pdf", owner="")
+        tracker.submitted(2, job_id=c)
+        a = fake.add_job("P", "a.pdf", owner="alice")
+        b = fake.add_job("P", "b.pdf", owner="")   # 所有者が分からない方式
+        assert wait_for(lambda: len([j for j in tracker.pending_jobs() if j[1] is not None]) == 3)
+        assert sorted(tracker.pending_jobs()) == [(0, a, True), (1, b, False), (2, c, True)]
+    finally:
+        tracker.close()
+        mon.stop()
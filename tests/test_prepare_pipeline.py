@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+import print_progress_gui as ppg
+import queue_monitor
+import spooler
+
+
+class RecordingProgress(ppg.ConsoleProgress):
+    events = []
+
+    def _handle_event(self, ev):
+        RecordingProgress.events.append(ev)
+        super()._handle_event(ev)
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    RecordingProgress.events = []
+    monkeypatch.setattr(ppg, "ConsoleProgress", RecordingProgress)
+    spooler.set_default_inspector(spooler.FakeInspector())
+    queue_monitor.configure(0.05, 0.5)
+    selected = []
+    for i in range(8):
+        p = tmp_path / f"{i}.pdf"
+        p.write_bytes(b"%PDF-1.4")
+        selected.append(("pdf", p, p.name))
+    yield selected
+    queue_monitor.stop_all()
+
+
+def test_prepare_runs_ahead_but_submits_in_order(pipeline):
+    selected = pipeline
+    lookahead = 2
+    lock = threading.Lock()
+    submitted = []
+    ahead = []      # 準備を始めた時点で、投入済みの件数より何件先か
+    finished = []   # 準備が終わった順
+
+    def prepare(kind, path):
+        i = int(path.stem)
+        with lock:
+            ahead.append(i - len(submitted))
+        time.sleep(0.02 * (3 - i % 3))   # 後の項目ほど先に終わることがある
+        if path.stem == "5":
+            raise OSError("変換できません")
+        with lock:
+            finished.append(i)
+        return kind, path, 1
+
+    def print_pdf(path):
+        with lock:
+            submitted.append(path.name)
+
+    ok = ppg.run_print_with_gui(selected, print_pdf, print_pdf, "P", headless=True,
+                                prepare_func=prepare, lookahead=lookahead)
+
+    assert ok is False
+    assert finished != sorted(finished)                      # 準備は順不同で終わった
+    assert submitted == [f"{i}.pdf" for i in range(8) if i != 5]
+    assert max(ahead) <= lookahead
+    errors = [ev for ev in RecordingProgress.events if ev[0] == "error_item"]
+    assert [(ev[1], ev[2]) for ev in errors] == [(5, "5.pdf")]
+    assert "変換できません" in errors[0][3]
+    done = [ev[1] for ev in RecordingProgress.events if ev[0] == "done_item"]
+    assert done == [0, 1, 2, 3, 4, 6, 7]
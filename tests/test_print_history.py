@@ -0,0 +1,65 @@
+import threading
+
+import print_progress_gui as ppg
+from print_history import PrintHistory
+
+
+def make_folder(tmp_path):
+    folder = tmp_path / "a"
+    folder.mkdir()
+    pdf = folder / "x.pdf"
+    doc = folder / "y.docx"
+    pdf.write_bytes(b"%PDF-1.4 x")
+    doc.write_bytes(b"PK word")
+    return [("pdf", pdf, pdf.name), ("word", doc, pdf.name)]
+
+
+def test_word_is_judged_by_its_own_content(tmp_path):
+    targets = make_folder(tmp_path)
+    history = PrintHistory(tmp_path / "h.sqlite3", workers=1)
+    try:
+        history.record(targets[0][1], "P")
+        _, notes = history.filter_targets(targets, "flag")
+        assert set(notes) == {targets[0][1]}        # PDF だけ印刷済みなら Word は未印刷のまま
+
+        history.record(targets[1][1], "P")
+        _, notes = history.filter_targets(targets, "flag")
+        assert set(notes) == {targets[0][1], targets[1][1]}
+
+        targets[1][1].write_bytes(b"PK word, edited")
+        _, notes = history.filter_targets(targets, "flag")
+        assert set(notes) == {targets[0][1]}        # 中身が変わった Word は印刷済みにしない
+    finally:
+        history.close()
+
+
+class SpyHistory(PrintHistory):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threads = set()
+
+    def hash_files(self, paths):
+        self.threads.add(threading.current_thread().name)
+        return super().hash_files(paths)
+
+
+def test_recording_uses_submit_time_hash_off_the_monitor_thread(tmp_path):
+    targets = make_folder(tmp_path)
+    selected = list(targets)
+    history = SpyHistory(tmp_path / "h.sqlite3", workers=1)
+    try:
+        q = ppg._RecordingQueue(history=history, selected=selected, track_jobs=True)
+        q.put(("done_item", 0, "x.pdf", "P"))
+        q.put(("job_done", 0, "x.pdf"))
+        q.close()
+        assert history.threads == {"print-history"}
+        _, notes = history.filter_targets(targets[:1], "flag")
+        assert set(notes) == {targets[0][1]}
+
+        q = ppg._RecordingQueue(history=history, selected=selected, track_jobs=True)
+        q.put(("done_item", 1, "y.docx", "P"))
+        q.close()
+        _, notes = history.filter_targets(targets, "flag")
+        assert targets[1][1] not in notes          # 印刷完了（job_done）を見るまで記録しない
+    finally:
+        history.close()
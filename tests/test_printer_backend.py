@@ -0,0 +1,33 @@
+import pytest
+
+import printer_backend
+from spooler import SpoolerError
+
+
+def test_auto_backend_refuses_to_fall_back_to_fake(monkeypatch):
+    monkeypatch.setattr(printer_backend.os, "name", "posix")
+    monkeypatch.setattr(printer_backend.shutil, "which", lambda name: None)
+    with pytest.raises(SpoolerError):
+        printer_backend.make_backend("auto")
+
+
+def test_fake_backend_only_when_asked():
+    backend = printer_backend.make_backend("fake")
+    try:
+        assert isinstance(backend, printer_backend.FakeBackend)
+    finally:
+        backend.close()
+
+
+def test_only_batch_backends_take_batches(tmp_path):
+    # まとめられないバックエンドが1件ずつ投入して「まとめて投入できる」ふりをしない
+    backend = printer_backend.DirectoryBackend(tmp_path / "spool")
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    try:
+        assert not backend.capabilities().batch
+        with pytest.raises(NotImplementedError):
+            backend.submit_batch("P", [pdf, pdf])
+        assert not (tmp_path / "spool").exists() or not any((tmp_path / "spool").rglob("*.pdf"))
+    finally:
+        backend.close()
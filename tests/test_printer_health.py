@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+import print_progress_gui
+import printer_backend
+import queue_monitor
+import spooler
+from printer_health import DEGRADED, FAILED, OK, PROBING, Failover, HealthMonitor
+
+
+@pytest.fixture
+def backend():
+    be = printer_backend.make_backend("fake", submit_ms=5, service_ms=20, page_ms=5)
+    spooler.set_default_inspector(be.inspector)
+    queue_monitor.configure(0.02, 0.1)
+    yield be
+    queue_monitor.stop_all()
+    be.close()
+
+
+def test_circuit_breaker_trips_and_recovers(backend):
+    fake = backend.inspector
+    mon = HealthMonitor("A", fake, failures=3, reset_sec=10.0)
+    assert mon.probe(now=0.0) == OK
+
+    fake.set_status("A", "offline")
+    assert mon.probe(now=1.0) == DEGRADED
+    assert mon.probe(now=2.0) == DEGRADED
+    assert mon.probe(now=3.0) == FAILED
+    assert mon.trips == 1 and mon.detect_sec == pytest.approx(2.0)
+
+    # 遮断中は reset_sec まで再確認しない。再確認でもだめならもう一度遮断
+    assert mon.probe(now=5.0) == FAILED
+    assert mon.probe(now=13.0) == FAILED
+    assert mon.opened_at == 13.0
+
+    # 正常な状態が見えたらすぐ戻す
+    fake.set_status("A")
+    assert mon.probe(now=14.0) == OK
+    assert mon.consecutive == 0 and mon.trips == 1
+
+
+def test_failover_routes_to_backup(backend):
+    fake = backend.inspector
+    fo = Failover({n: HealthMonitor(n, fake, failures=1) for n in "AB"}, backups={"A": "B"})
+    events = []
+    fo.subscribe(events.append)
+    assert fo.route("A") == "A"
+
+    fake.set_status("A", "paper_out")
+    fo.monitors["A"].probe()
+    assert ("printer_state", "A", FAILED, "paper_out") in events
+    assert fo.route("A") == "B"
+    assert fo.rerouted == 1
+    assert fo.chain("A") == ["A", "B"]
+
+
+def test_stalled_until_printer_returns(backend):
+    fake = backend.inspector
+    fo = Failover({"A": HealthMonitor("A", fake, failures=1, reset_sec=0.0)})
+    events = []
+    fo.subscribe(events.append)
+    fake.set_status("A", "offline")
+    fo.monitors["A"].probe()
+
+    result = []
+    t = threading.Thread(target=lambda: result.append(fo.route("A")))
+    t.start()
+    time.sleep(0.3)
+    assert t.is_alive()
+    assert ("stalled", "A", "offline") in events
+
+    fake.set_status("A")
+    assert fo.monitors["A"].probe() == OK
+    t.join(timeout=3)
+    assert result == ["A"]
+    resumed = [e for e in events if e[0] == "resumed"]
+    assert resumed and resumed[0][2] == "A" and resumed[0][3] >= 0.3
+    assert fo.lost_sec >= 0.3
+
+    # 中止の合図があれば None を返す
+    fake.set_status("A", "offline")
+    fo.monitors["A"].probe()
+    stop = threading.Event()
+    stop.set()
+    assert fo.route("A", stop=stop) is None
+    assert PROBING not in [e[2] for e in events if e[0] == "printer_state"]
+
+
+def test_run_moves_jobs_off_failed_printer(backend, tmp_path):
+    fake = backend.inspector
+    selected = []
+    for f in range(3):
+        for k in range(3):
+            p = tmp_path / f"c{f}" / f"r{k}.pdf"
+            p.parent.mkdir(exist_ok=True)
+            p.write_bytes(b"%PDF-1.4\n1 0 obj << /Type /Pages /Count 1 >> endobj\n")
+            selected.append(("pdf", p, p.name))
+    # 他の人のジョブ（同じ名前）は遮断しても消さない
+    foreign = fake.add_job("A", "r0.pdf", owner="someone-else")
+    fake.set_status("A", "offline")
+
+    fo = Failover({n: HealthMonitor(n, fake, interval=0.05, failures=2, reset_sec=60) for n in "AB"},
+                  backups={"A": "B"})
+    fo.start()
+    try:
+        def pp(path, printer=None):
+            return backend.submit(printer, path, "pdf")
+
+        ok = print_progress_gui.run_print_with_gui(
+            selected, pp, pp, "A", track_jobs=True, health=fo, cancel_job_func=backend.cancel, headless=True)
+    finally:
+        fo.stop()
+    assert ok
+    assert [j.job_id for j in fake.jobs("A")] == [foreign]
+    assert fake.jobs("B") == []
@@ -0,0 +1,95 @@
+import collections
+import threading
+import time
+
+import pytest
+
+import print_progress_gui as ppg
+import printer_backend
+import queue_monitor
+import spooler
+from printer_pool import PoolPrinter, PrinterPool
+
+
+@pytest.fixture
+def inspector():
+    fake = spooler.FakeInspector()
+    spooler.set_default_inspector(fake)
+    queue_monitor.configure(0.05, 0.5)
+    yield fake
+    queue_monitor.stop_all()
+
+
+def test_choose_orders_by_estimated_finish(inspector):
+    pool = PrinterPool([PoolPrinter("A"), PoolPrinter("B"), PoolPrinter("C", weight=2)],
+                       default_rate=1.0, max_pending=2)
+    assert pool.choose(4).name == "C"            # 速いプリンタ
+    assert pool.choose(4).name == "A"            # C: (4+4)/2 = 4 秒, A: 4 秒 → 並べた順
+    assert pool.choose(4).name == "B"
+    assert pool.choose(4).name == "C"            # C: 12/2 = 6 秒 < A,B: 8 秒
+    assert pool.choose(1).name == "A"            # C は未投入が max_pending に達している
+
+
+def test_spooled_pages_and_measured_rate_count(inspector):
+    inspector.add_job("A", "other.pdf", pages=30)
+    pool = PrinterPool([PoolPrinter("A"), PoolPrinter("B", rate=0.5)], default_rate=1.0)
+    queue_monitor.get_monitor("A").poll()
+    # A: (30+2)/1 = 32 秒, B: 2/0.5 = 4 秒
+    assert pool.choose(2).name == "B"
+
+
+def test_choose_waits_for_a_free_printer(inspector):
+    pool = PrinterPool([PoolPrinter("A")], default_rate=1.0, max_pending=1)
+    a = pool.choose(1)
+    stop = threading.Event()
+    stop.set()
+    assert pool.choose(1, stop=stop) is None
+
+    got = []
+    t = threading.Thread(target=lambda: got.append(pool.choose(1)))
+    t.start()
+    time.sleep(0.3)
+    assert not got
+    pool.finished(a, 1)
+    t.join(2)
+    assert got == [a]
+
+
+def test_lanes_keep_folders_whole_and_in_order(tmp_path, inspector):
+    backend = printer_backend.make_backend("fake", submit_ms=5, service_ms=10, page_ms=10,
+                                           fake_speeds={"C": 2.0})
+    spooler.set_default_inspector(backend.inspector)
+    selected = []
+    for f in range(8):
+        for k in range(3):
+            p = tmp_path / f"c{f}" / f"r{k}.pdf"
+            p.parent.mkdir(exist_ok=True)
+            p.write_bytes(b"%PDF-1.4\n1 0 obj << /Type /Pages /Count 2 >> endobj\n")
+            selected.append(("pdf", p, p.name))
+    log = []
+    lock = threading.Lock()
+
+    def print_pdf(path, printer=None):
+        with lock:
+            log.append((printer, path))
+        return backend.submit(printer, path, "pdf")
+
+    pool = PrinterPool([PoolPrinter("A"), PoolPrinter("B"), PoolPrinter("C", weight=2)], default_rate=50)
+    try:
+        ok = ppg.run_print_with_gui(selected, print_pdf, print_pdf, "A", pool=pool, headless=True)
+    finally:
+        backend.close()
+    assert ok is True
+    assert len(log) == len(selected)
+
+    by_folder = collections.defaultdict(list)
+    by_printer = collections.defaultdict(list)
+    for printer, path in log:
+        by_folder[path.parent].append((printer, path.name))
+        by_printer[printer].append(selected.index(("pdf", path, path.name)))
+    for items in by_folder.values():
+        assert len({printer for printer, _ in items}) == 1           # フォルダは1台にまとめる
+        assert [n for _, n in items] == ["r0.pdf", "r1.pdf", "r2.pdf"]
+    for order in by_printer.values():
+        assert order == sorted(order)                                 # レーンの中は元の順番
+    assert len(by_printer) > 1
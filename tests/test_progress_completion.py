@@ -0,0 +1,59 @@
+import queue
+import threading
+
+import print_progress_gui as ppg
+
+
+class Label:
+    def __init__(self):
+        self.text = ""
+
+    def configure(self, text=""):
+        self.text = text
+
+
+def window(track_jobs=True):
+    """Tk を起動せずに PrintProgressWindow の判定だけを動かす"""
+    win = ppg.PrintProgressWindow.__new__(ppg.PrintProgressWindow)
+    ppg.ConsoleProgress.__init__(win, queue.Queue(), threading.Event(), "P", track_jobs=track_jobs)
+    win.prepared = 0
+    win.job_times = {}
+    win.lbl_spool = Label()
+    win.lbl_counts = Label()
+    win.progress = {}
+
+    def done():
+        win.finished = True
+    win._on_all_done = done
+    return win
+
+
+def test_spool_label_updates_while_tracking_jobs():
+    win = window()
+    win._handle_event(("init", 1))
+    win._handle_event(("done_item", 0, "a.pdf", "P"))
+    win._handle_event(("spool", False))
+    assert "残りあり" in win.lbl_spool.text
+    assert "印刷完了 0/1" in win.lbl_spool.text
+
+
+def test_completion_matches_items_not_counts():
+    for cls in (window, lambda: ppg.ConsoleProgress(queue.Queue(), threading.Event(), "P", track_jobs=True)):
+        win = cls()
+        for ev in (("init", 2), ("done_item", 0, "a.pdf", "P"), ("done_item", 1, "b.pdf", "P"),
+                   ("sent_all",), ("job_done", 0, "a.pdf", 1.0), ("job_done", 0, "a.pdf", 1.0)):
+            win._handle_event(ev)
+        assert not win.finished                  # 同じ項目の完了が2回来ても b はまだ
+        win._handle_event(("job_done", 1, "b.pdf", 1.0))
+        assert win.finished
+
+
+def test_unknown_jobs_fall_back_to_empty_queue():
+    win = window()
+    for ev in (("init", 2), ("done_item", 0, "a.pdf", "P"), ("done_item", 1, "b.pdf", "P"),
+               ("sent_all",), ("job_done", 0, "a.pdf", 1.0), ("job_unknown", 1, "b.pdf", 3.0)):
+        win._handle_event(ev)
+    for _ in range(win.EMPTY_STREAK_REQUIRED):
+        assert not win.finished
+        win._handle_event(("spool", True))
+    assert win.finished
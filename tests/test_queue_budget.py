@@ -0,0 +1,60 @@
+import threading
+import time
+
+from queue_budget import QueueBudget
+from queue_monitor import QueueMonitor, QueueSnapshot
+from spooler import FakeInspector, JobInfo, SimulatedNotifier
+
+
+def snap(*pages, t=1.0):
+    jobs = [JobInfo(n + 1, f"d{n}.pdf", "", p) for n, p in enumerate(pages)]
+    return QueueSnapshot(len(jobs), jobs, t, True)
+
+
+def test_max_jobs_counts_the_printing_job_like_queue_limit():
+    budget = QueueBudget(max_jobs=1)
+    assert budget.admits(snap(), 5, 0)
+    assert not budget.admits(snap(3), 5, 0)     # queue_limit=1 と同じく空になるまで待つ
+
+
+def test_page_budget_lets_one_big_job_through_behind_the_printing_job():
+    budget = QueueBudget(max_pages=10)
+    assert budget.admits(snap(3), 50, 0)        # 後ろに何も無ければ予算より大きくても流す
+    assert not budget.admits(snap(3, 8), 5, 0)
+    assert budget.admits(snap(3, 4), 5, 0)
+
+
+def test_blocked_counts_each_waiting_acquire_once():
+    inspector = FakeInspector()
+    monitor = QueueMonitor("P", inspector=inspector, min_interval=0.02, max_interval=0.5)
+    budget = QueueBudget(max_pages=5)
+    for n in range(2):
+        inspector.add_job("P", f"d{n}.pdf", pages=4)
+    try:
+        t = threading.Thread(target=budget.acquire, args=(monitor, "x.pdf"), kwargs={"pages": 4})
+        t.start()
+        time.sleep(0.3)                          # この間に何回も問い合わせて判定する
+        inspector.finish_job("P")
+        t.join(5)
+        assert not t.is_alive()
+        assert monitor.polls > 5
+        assert budget.blocked == 1
+        assert budget.held_at > 0
+    finally:
+        monitor.stop()
+
+
+def test_waiting_polls_at_min_interval_even_with_a_notifier():
+    inspector = FakeInspector()
+    monitor = QueueMonitor("P", inspector=inspector, min_interval=0.05, max_interval=30,
+                           notifier=SimulatedNotifier(inspector))
+    inspector.add_job("P", "d0.pdf", pages=4)
+    inspector.add_job("P", "d1.pdf", pages=4)
+    try:
+        monitor.start()
+        # ジョブの出し入れが無くても、待っている間は調整した間隔で問い合わせる
+        snap = monitor.wait_until(lambda s: False, timeout=0.5)
+        assert snap is not None
+        assert monitor.polls >= 5
+    finally:
+        monitor.stop()
@@ -0,0 +1,54 @@
+import time
+
+from queue_monitor import QueueMonitor
+from spooler import ChangeNotifier, FakeInspector, SimulatedNotifier
+
+
+class SilentNotifier(ChangeNotifier):
+    """通知を1回も出さない（取りこぼしたときと同じ）"""
+
+    def wait(self, timeout: float) -> bool:
+        time.sleep(timeout)
+        return False
+
+
+def test_simulated_notifier_reports_each_change_once():
+    inspector = FakeInspector()
+    notifier = SimulatedNotifier(inspector)
+    assert notifier.wait(0.05) is False
+    inspector.add_job("P", "a.pdf")
+    inspector.add_job("P", "b.pdf")
+    assert notifier.wait(0.05) is True       # 待つ前の変化もまとめて1回
+    assert notifier.wait(0.05) is False
+    inspector.finish_job("P")
+    assert notifier.wait(0.05) is True
+
+
+def test_notification_wakes_the_monitor_before_the_poll_interval():
+    inspector = FakeInspector()
+    monitor = QueueMonitor("P", inspector=inspector, min_interval=5, max_interval=30,
+                           notifier=SimulatedNotifier(inspector))
+    try:
+        monitor.start()
+        time.sleep(0.2)
+        inspector.add_job("P", "a.pdf")
+        time.sleep(0.5)                      # 問い合わせ間隔（5 秒）より前に通知で問い合わせ直す
+        assert monitor.snapshot().depth == 1
+        assert monitor.notifications >= 1
+    finally:
+        monitor.stop()
+
+
+def test_backstop_poll_stays_short_while_notifier_is_alive():
+    inspector = FakeInspector()
+    monitor = QueueMonitor("P", inspector=inspector, min_interval=0.05, max_interval=30,
+                           notifier=SilentNotifier(), backstop_interval=0.2)
+    try:
+        monitor.start()
+        time.sleep(1.0)
+        assert monitor.interval <= 0.2
+        inspector.add_job("P", "a.pdf")      # 通知が来なくても保険の問い合わせで見つかる
+        time.sleep(0.5)
+        assert monitor.snapshot().depth == 1
+    finally:
+        monitor.stop()
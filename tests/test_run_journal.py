@@ -0,0 +1,56 @@
+import print_progress_gui as ppg
+import queue_monitor
+import run_journal
+import spooler
+
+
+def run(tmp_path, fail):
+    selected = []
+    for name in ("a.pdf", "b.pdf"):
+        p = tmp_path / name
+        p.write_bytes(b"%PDF-1.4")
+        selected.append(("pdf", p, name))
+    path = tmp_path / "run_journal.jsonl"
+    journal = run_journal.RunJournal.create(path, selected)
+
+    def print_pdf(p):
+        if p.name in fail:
+            raise OSError("印刷できません")
+
+    spooler.set_default_inspector(spooler.FakeInspector())
+    queue_monitor.configure(0.05, 0.5)
+    try:
+        ok = ppg.run_print_with_gui(selected, print_pdf, print_pdf, "P", headless=True, journal=journal)
+    finally:
+        queue_monitor.stop_all()
+    journal.close()
+    return ok, run_journal.load_unfinished(path)
+
+
+def test_run_with_failures_stays_resumable(tmp_path):
+    ok, unfinished = run(tmp_path, {"b.pdf"})
+    assert ok is False
+    assert unfinished is not None
+    assert [fname for _, _, fname in unfinished.remaining] == ["b.pdf"]
+
+
+def test_clean_run_is_finished(tmp_path):
+    ok, unfinished = run(tmp_path, set())
+    assert ok is True
+    assert unfinished is None
+
+
+def test_headless_config_error_is_printed_without_tk(monkeypatch, capsys):
+    import hokokusyo_print as h
+    import module1 as m
+
+    def broken():
+        raise FileNotFoundError("config.json が見つかりません")
+
+    def no_tk(*args, **kwargs):
+        raise AssertionError("headless で Tk を開いた")
+    monkeypatch.setattr(m, "load_config", broken)
+    monkeypatch.setattr(h.tk, "Tk", no_tk)
+    h.main(["--headless"])
+    out = capsys.readouterr().out
+    assert "設定ファイルエラー" in out and "config.json が見つかりません" in out
@@ -0,0 +1,76 @@
+import os
+import time
+
+import scanner
+from scan_index import ScanIndex
+from scanner import TimeRange
+
+
+def overwrite_in_place(path):
+    folder = path.parent
+    st = folder.stat()
+    with open(path, "r+b") as f:
+        f.write(b"%PDF-1.7")
+    os.utime(folder, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def test_periodic_full_refresh_sees_in_place_overwrite(tmp_path):
+    parent = tmp_path / "parent"
+    (parent / "a").mkdir(parents=True)
+    pdf = parent / "a" / "x.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    old = time.time() - 3600
+    os.utime(pdf, (old, old))
+
+    lazy = ScanIndex(tmp_path / "lazy.sqlite3")
+    periodic = ScanIndex(tmp_path / "periodic.sqlite3", full_every_sec=3600)
+    try:
+        assert lazy.refresh(parent) == 1
+        assert periodic.refresh(parent) == 1     # 初回は全走査
+        assert periodic.refresh(parent) == 0     # 期限内は変わったフォルダだけ
+
+        overwrite_in_place(pdf)
+        recent = TimeRange.since(time.time() - 60)
+        assert lazy.refresh(parent) == 0
+        assert lazy.collect_targets(parent, recent)[0] == []
+
+        periodic.full_every_sec = 0.001
+        time.sleep(0.01)
+        assert periodic.refresh(parent) == 1
+        assert [p.name for _, p, _ in periodic.collect_targets(parent, recent)[0]] == ["x.pdf"]
+        assert lazy.refresh(parent, full=True) == 1
+    finally:
+        lazy.close()
+        periodic.close()
+
+
+def test_iter_targets_streams_a_cold_index(tmp_path, monkeypatch):
+    parent = tmp_path / "parent"
+    for name, words in (("a", ["w.docx"]), ("b", []), ("c", ["v.docx"]), ("d", ["u.docx"])):
+        (parent / name).mkdir(parents=True)
+        (parent / name / "x.pdf").write_bytes(b"%PDF-1.4")
+        for w in words:
+            (parent / name / w).write_bytes(b"PK")
+    old = time.time() - 3600
+    os.utime(parent / "d" / "x.pdf", (old, old))
+    today = TimeRange.since(time.time() - 60)
+    expected = list(scanner.iter_targets(parent, today))
+
+    scanned = []
+    real_scan_folder = scanner.scan_folder
+    monkeypatch.setattr(scanner, "scan_folder", lambda p, stat_words=False: (
+        scanned.append(p.name), real_scan_folder(p, stat_words))[1])
+
+    index = ScanIndex(tmp_path / "index.sqlite3")
+    try:
+        it = index.iter_targets(parent, today)
+        assert next(it) == expected[0]
+        assert scanned == ["a"]                  # 初回でも全走査を待たずに返す
+        assert [expected[0]] + list(it) == expected
+
+        scanned.clear()
+        assert list(index.iter_targets(parent, today)) == expected
+        assert scanned == []                     # 2回目は DB から
+        assert index.collect_targets(parent, today) == scanner.collect_targets(parent, today)
+    finally:
+        index.close()
@@ -0,0 +1,87 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import scanner
+from benchmark import collect_targets_glob
+
+
+def make_folders(tmp_path, n):
+    paths = []
+    for i in range(n):
+        p = tmp_path / f"f{i:02d}"
+        p.mkdir()
+        (p / "x.pdf").write_bytes(b"%PDF-1.4")
+        paths.append(p)
+    return paths
+
+
+def test_closing_parallel_scan_early_skips_the_rest(tmp_path, monkeypatch):
+    paths = make_folders(tmp_path, 20)
+    scanned = []
+    lock = threading.Lock()
+    real_scan_folder = scanner.scan_folder
+
+    def slow_scan_folder(p, stat_words=False):
+        with lock:
+            scanned.append(p.name)
+        time.sleep(0.05)
+        return real_scan_folder(p, stat_words)
+    monkeypatch.setattr(scanner, "scan_folder", slow_scan_folder)
+
+    it = scanner.scan_folders(paths, workers=2)
+    assert next(it).name == "f00"
+    t0 = time.monotonic()
+    it.close()
+    assert time.monotonic() - t0 < 0.5              # 走査中の分を待たない
+    time.sleep(0.3)
+    assert len(scanned) <= 1 + 2 * scanner.LOOKAHEAD_PER_WORKER + 1
+
+
+def test_collect_targets_matches_the_original_glob_version(tmp_path):
+    parent = tmp_path / "parent"
+    today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    old = (today - timedelta(days=3)).timestamp()
+    files = {
+        "Alpha": ["Report.pdf", "a.pdf", "Word_B.docx", "word_a.docm", "~$Word_B.docx", "note.txt"],
+        "beta": ["B.pdf", "c.pdf", "template.dotx", "x.doc.bak"],        # Word なし
+        "Gamma": ["old.pdf", "g.docx"],                                     # 対象PDFなし
+        "delta": ["Z.pdf", "y.pdf", "~$tmp.doc", "Plan.doc"],
+    }
+    if os.name == "nt":
+        # 大文字の拡張子は glob も拾う（POSIX の glob は大文字小文字を区別するので比べない）
+        files["Alpha"] += ["UPPER.PDF", "Upper.DOCX"]
+    for folder, names in files.items():
+        for name in names:
+            p = parent / folder / name
+            p.parent.mkdir(parents=True, exist_ok=True)
+            p.write_bytes(b"%PDF-1.4" if name.lower().endswith(".pdf") else b"PK")
+            t = old if name == "old.pdf" or folder == "delta" and name == "y.pdf" else today.timestamp()
+            os.utime(p, (t, t))
+    (parent / "loose.pdf").write_bytes(b"%PDF-1.4")                        # 親直下のファイルは対象外
+
+    expected = collect_targets_glob(parent, today)
+    assert scanner.collect_targets(parent, today) == expected
+    assert scanner.collect_targets(parent, today, workers=4) == expected
+    assert expected[1] == ["beta"]
+    assert "~$Word_B.docx" not in {name for _, _, name in expected[0]}
+
+
+def test_parallel_scan_keeps_the_serial_order(tmp_path, monkeypatch):
+    paths = make_folders(tmp_path, 30)
+    (paths[3] / "w.docx").write_bytes(b"PK")
+    serial = list(scanner.scan_folders(paths, workers=1, stat_words=True))
+
+    rng = random.Random(1)
+    delays = {p.name: rng.uniform(0, 0.03) for p in paths}
+    real_scan_folder = scanner.scan_folder
+
+    def jittery_scan_folder(p, stat_words=False):
+        time.sleep(delays[p.name])     # 後のフォルダが先に終わることがある
+        return real_scan_folder(p, stat_words)
+    monkeypatch.setattr(scanner, "scan_folder", jittery_scan_folder)
+
+    for workers in (2, 8):
+        assert list(scanner.scan_folders(paths, workers=workers, stat_words=True)) == serial
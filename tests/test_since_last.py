@@ -0,0 +1,149 @@
+import os
+import queue
+import threading
+import time
+from argparse import Namespace
+from pathlib import Path
+
+import pytest
+
+import gui_input as gi
+import gui_select as gs
+import hokokusyo_print as h
+import module1 as m
+import scanner
+import no_word_folder as nw
+from scanner import TimeRange
+
+
+def write(path: Path, mtime: float):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"%PDF-1.4\n" if path.suffix == ".pdf" else b"docx")
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    parent = tmp_path / "parent"
+    hour_ago = time.time() - 3600
+    write(parent / "a" / "x.pdf", hour_ago)
+    write(parent / "a" / "w.docx", hour_ago)
+    write(parent / "b" / "y.pdf", hour_ago + 60)
+    base = tmp_path / "base"
+    base.mkdir()
+    monkeypatch.setattr(m, "base_dir", lambda: base)
+    monkeypatch.setattr(gi, "input_date_gui", lambda since=None: TimeRange.since(since))
+    monkeypatch.setattr(nw, "no_word", lambda folders: True)
+    return parent, hour_ago
+
+
+def collect(parent, since, overlap=0.0, use_index=True, stream=False, since_full=False):
+    args = Namespace(headless=False, since_last=False, date="")
+    return h._collect_and_select(args, parent, stream, use_index, 1, since=since, overlap_sec=overlap,
+                                 since_full=since_full)
+
+
+def test_deselected_folder_holds_back_the_mark(tree, monkeypatch):
+    parent, hour_ago = tree
+    monkeypatch.setattr(gs, "select_targets_gui",
+                        lambda targets, notes=None: [t for t in targets if t[1].parent.name == "a"])
+    period, selected = collect(parent, hour_ago - 10)
+    assert [p.name for _, p, _ in selected] == ["x.pdf", "w.docx"]
+    assert period.end == pytest.approx((parent / "b" / "y.pdf").stat().st_mtime)
+
+
+def test_overlap_keeps_recent_updates_for_next_time(tree, monkeypatch):
+    parent, hour_ago = tree
+    monkeypatch.setattr(gs, "select_targets_gui", lambda targets, notes=None: targets)
+    t0 = time.time()
+    period, selected = collect(parent, hour_ago - 10, overlap=300)
+    assert len(selected) == 3
+    assert t0 - 301 <= period.end <= time.time() - 300
+
+
+def test_since_mode_rescans_only_when_configured(tree, monkeypatch):
+    parent, hour_ago = tree
+    monkeypatch.setattr(gs, "select_targets_gui", lambda targets, notes=None: targets)
+    since = time.time() - 5
+    period, selected = collect(parent, since)
+    assert selected == []
+
+    # その場で上書き（フォルダの更新時刻は変わらない）
+    folder = parent / "a"
+    st = folder.stat()
+    with open(folder / "x.pdf", "r+b") as f:
+        f.write(b"%PDF-1.7")
+    os.utime(folder, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    # 既定では変わったフォルダだけ読み直す（共有全体は読まない）
+    scanned = []
+    real_scan_folder = scanner.scan_folder
+    monkeypatch.setattr(scanner, "scan_folder", lambda p, stat_words=False: (
+        scanned.append(p.name), real_scan_folder(p, stat_words))[1])
+    period, selected = collect(parent, since)
+    assert selected == [] and scanned == []
+
+    period, selected = collect(parent, since, since_full=True)
+    assert [p.name for _, p, _ in selected] == ["x.pdf", "w.docx"]
+    assert scanned == ["a", "b"]
+
+
+def press_print_after(n_folders):
+    """n_folders 個のフォルダが届いたところで「選択したものを印刷」を押す選択画面の代わり"""
+    def select(stream, notes=None):
+        q, stop = queue.Queue(), threading.Event()
+        reader = threading.Thread(target=gs._read_stream, args=(stream, q, stop))
+        reader.start()
+        shown, complete = [], False
+        while True:
+            ev = q.get(timeout=5)
+            if ev[0] == "folder":
+                shown.append(ev[1])
+                if len(shown) == n_folders:
+                    stop.set()
+                    break
+            elif ev[0] == "end":
+                complete = ev[1]
+                break
+        reader.join(5)
+        return [t for _, targets, _ in shown for t in targets], complete
+    return select
+
+
+@pytest.mark.parametrize("use_index", [False, True])
+def test_stream_stopped_partway_keeps_the_mark(tree, monkeypatch, use_index):
+    parent, hour_ago = tree
+    since = hour_ago - 10
+    monkeypatch.setattr(gs, "select_targets_streaming_gui", press_print_after(1))
+    period, selected = collect(parent, since, use_index=use_index, stream=True)
+    assert [p.name for _, p, _ in selected] == ["x.pdf", "w.docx"]
+    assert period.end == period.start == since       # b はまだ見ていないので次も集める
+
+    monkeypatch.setattr(gs, "select_targets_streaming_gui", press_print_after(99))
+    period, selected = collect(parent, since, use_index=use_index, stream=True)
+    assert len(selected) == 3
+    assert period.end > since
+
+
+def test_read_stream_reports_whether_it_finished():
+    def run(stream, stop_after=None):
+        q, stop = queue.Queue(), threading.Event()
+
+        def items():
+            for i, item in enumerate(stream):
+                if i == stop_after:
+                    stop.set()   # 読んでいる途中で押された
+                yield item
+        gs._read_stream(items(), q, stop)
+        events = []
+        while not q.empty():
+            events.append(q.get())
+        return events
+
+    assert run(iter([1, 2]))[-1] == ("end", True)
+    assert run(iter([1, 2, 3]), stop_after=1) == [("folder", 1), ("end", False)]
+
+    def broken():
+        yield 1
+        raise OSError("network")
+    assert run(broken())[-2:] == [("error", "network"), ("end", False)]
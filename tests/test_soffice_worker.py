@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+import child_process
+import print_progress_gui as ppg
+import printer_backend
+import queue_monitor
+import spooler
+from soffice_worker import SofficeWorker
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="偽の soffice は #! で起動するスクリプト")
+
+# 常駐（--accept）はポートを開けて待つ。--pt は文書名に hang があれば子プロセスごと止まる
+FAKE_SOFFICE = """#!{python}
+import os, socket, subprocess, sys, time
+args = sys.argv[1:]
+log = os.environ["FAKE_SOFFICE_LOG"]
+with open(log, "a") as f:
+    f.write(f"{{os.getpid()}} {{args[-1]}}\\n")
+accept = [a for a in args if a.startswith("--accept=")]
+if accept:
+    port = int(accept[0].split("port=")[1].split(";")[0])
+    s = socket.socket()
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind(("127.0.0.1", port))
+    s.listen()
+    while True:
+        s.accept()[0].close()
+if "hang" in os.path.basename(args[-1]):
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(600)"])
+    with open(log, "a") as f:
+        f.write(f"{{child.pid}} child\\n")
+    time.sleep(600)
+"""
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+@pytest.fixture
+def fake_soffice(tmp_path, monkeypatch):
+    exe = tmp_path / "soffice"
+    exe.write_text(FAKE_SOFFICE.format(python=sys.executable))
+    exe.chmod(0o755)
+    log = tmp_path / "calls.log"
+    log.write_text("")
+    monkeypatch.setenv("FAKE_SOFFICE_LOG", str(log))
+    child_process.reset()
+    return exe, log
+
+
+def calls(log):
+    return [line.split(" ", 1) for line in log.read_text().splitlines()]
+
+
+def test_hung_document_fails_once_without_retry(tmp_path, fake_soffice):
+    exe, log = fake_soffice
+    docs = [tmp_path / n for n in ("a.docx", "hang.docx", "b.docx")]
+    worker = SofficeWorker(exe, use_uno=False, start_timeout=10)
+    try:
+        worker.print_document("P", docs[0], timeout=5)
+        t0 = time.monotonic()
+        with pytest.raises(child_process.ProcessTimeout):
+            worker.print_document("P", docs[1], timeout=1.0)
+        assert time.monotonic() - t0 < 1.9       # やり直すと時間制限の2倍かかる
+        worker.print_document("P", docs[2], timeout=5)
+    finally:
+        worker.stop()
+
+    printed = [arg for _, arg in calls(log) if arg.endswith(".docx")]
+    assert printed.count(str(docs[1])) == 1
+    assert printed[-1] == str(docs[2])
+    time.sleep(0.5)
+    assert [pid for pid, _ in calls(log) if alive(int(pid))] == []
+    assert child_process.running() == 0
+
+
+def test_hung_document_is_one_failed_item_in_a_run(tmp_path, fake_soffice):
+    exe, log = fake_soffice
+    selected = []
+    for name in ("w0.docx", "hang.docx", "w1.docx", "w2.docx"):
+        p = tmp_path / name
+        p.write_bytes(b"PK")
+        selected.append(("word", p, name))
+
+    backend = printer_backend.make_backend("fake", submit_ms=5, service_ms=5, page_ms=0)
+    spooler.set_default_inspector(backend.inspector)
+    queue_monitor.configure(0.05, 0.5)
+    worker = SofficeWorker(exe, use_uno=False, start_timeout=10)
+    done = []
+
+    def print_word(path, printer=None):
+        worker.print_document("P", path, timeout=1.0)
+        done.append(path.name)
+
+    result = {}
+    t0 = time.monotonic()
+    th = threading.Thread(target=lambda: result.setdefault(
+        "ok", ppg.run_print_with_gui(selected, None, print_word, "P", headless=True)))
+    th.start()
+    th.join(20)
+    elapsed = time.monotonic() - t0
+    worker.stop()
+    queue_monitor.stop_all()
+    backend.close()
+
+    assert not th.is_alive()
+    assert result["ok"] is False                 # 止まった1件は失敗
+    assert done == ["w0.docx", "w1.docx", "w2.docx"]
+    assert elapsed < 8
+    hung = [arg for _, arg in calls(log) if arg.endswith("hang.docx")]
+    assert len(hung) == 1                        # 止まった分は時間制限1回ぶんだけ待つ
+    time.sleep(0.5)
+    assert [pid for pid, _ in calls(log) if alive(int(pid))] == []
+    assert child_process.running() == 0
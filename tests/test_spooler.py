@@ -0,0 +1,122 @@
+import os
+import sys
+import textwrap
+import time
+
+import pytest
+
+import spooler
+from spooler import CupsInspector, FakeInspector, PowerShellInspector, SpoolerError
+
+
+def fake_command(tmp_path, monkeypatch, name, body):
+    """PATH の先頭に name という Python スクリプトを置く"""
+    path = tmp_path / name
+    path.write_text(f"#!{sys.executable}\n" + textwrap.dedent(body))
+    path.chmod(0o755)
+    monkeypatch.setenv("PATH", str(tmp_path) + os.pathsep + os.environ.get("PATH", ""))
+    return path
+
+
+def test_auto_inspector_refuses_to_fall_back_to_fake(monkeypatch):
+    monkeypatch.setattr(spooler, "win32print", None)
+    monkeypatch.setattr(spooler.os, "name", "posix")
+    monkeypatch.setattr(spooler.shutil, "which", lambda name: None)
+    with pytest.raises(SpoolerError):
+        spooler.make_inspector("auto")
+    assert isinstance(spooler.make_inspector("fake"), FakeInspector)
+
+
+def test_fake_inspector_jobs_and_status():
+    fake = FakeInspector()
+    a = fake.add_job("P", "a.pdf", pages=3, size=100)
+    b = fake.add_job("P", "b.pdf", owner="bob")
+    jobs = fake.jobs("P")
+    assert [j.job_id for j in jobs] == [a, b]
+    assert jobs[0].pages == 3 and jobs[0].owner == spooler.current_user()
+    assert jobs[1].owner == "bob"
+
+    fake.cancel("P", b)
+    with pytest.raises(SpoolerError):
+        fake.cancel("P", b)
+    fake.finish_job("P")
+    assert fake.queue_size("P") == 0
+
+    fake.set_status("P", "offline", "error")
+    status = fake.printer_status("P")
+    assert not status.healthy and status.faults == ("offline", "error")
+    fake.set_status("P")
+    assert fake.printer_status("P").healthy
+
+    fake.fail = True
+    with pytest.raises(SpoolerError):
+        fake.jobs("P")
+
+
+def test_owner_matches():
+    assert spooler.owner_matches("alice", "ALICE")
+    assert spooler.owner_matches("alice", "CORP\\alice")
+    assert not spooler.owner_matches("alice", "bob")
+    assert not spooler.owner_matches("alice", "")
+
+
+POWERSHELL = """
+import sys, time
+for line in sys.stdin:
+    if "hang" in line:
+        time.sleep(60)
+    if line.startswith("Get-PrintJob"):
+        print("7\\tPrinting\\t2\\t2048\\talice\\treport1.pdf", flush=True)
+    elif line.startswith("Write-Output '"):
+        print(line.split("'")[1], flush=True)
+"""
+
+
+def test_powershell_read_deadline(tmp_path, monkeypatch):
+    fake_command(tmp_path, monkeypatch, "powershell", POWERSHELL)
+    ps = PowerShellInspector(timeout=1.0)
+    try:
+        assert ps.jobs("P") == [spooler.JobInfo(7, "report1.pdf", "Printing", 2, 2048, "alice")]
+
+        t0 = time.monotonic()
+        with pytest.raises(SpoolerError):
+            ps.jobs("hang")
+        assert time.monotonic() - t0 < 5
+
+        # 止まった PowerShell は捨てて、次の問い合わせで起動し直す
+        assert [j.job_id for j in ps.jobs("P")] == [7]
+    finally:
+        ps.close()
+
+
+LPQ = """
+print("Brother is ready and printing")
+print("alice: active                            [job 12 localhost]")
+print("        report1.pdf                             10240 bytes")
+print("")
+print("bob: 1st                                 [job 13 localhost]")
+print("        other.pdf                               512 bytes")
+"""
+
+
+def test_cups_jobs_carry_document_name(tmp_path, monkeypatch):
+    fake_command(tmp_path, monkeypatch, "lpq", LPQ)
+    jobs = CupsInspector().jobs("Brother")
+    assert jobs == [
+        spooler.JobInfo(12, "report1.pdf", "printing", 0, 10240, "alice"),
+        spooler.JobInfo(13, "other.pdf", "", 0, 512, "bob"),
+    ]
+    assert spooler.document_matches("report1.pdf", jobs[0].document)
+
+
+@pytest.mark.parametrize("bits, text", [
+    (0x0004, "Deleting"),
+    (0x0008, "Spooling"),
+    (0x0100, "Deleted"),
+    (0x0800, "Restart"),
+    (0x0008 | 0x0010, "Spooling,Printing"),
+    (0, ""),
+])
+def test_win32_job_status_bits(bits, text):
+    assert spooler._win32_status({"Status": bits}) == text
+    assert spooler._win32_status({"Status": bits, "pStatus": "Toner low"}) == "Toner low"